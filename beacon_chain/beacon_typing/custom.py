@@ -1,10 +1,13 @@
 from typing import (
+    Any,
     Dict,
     NewType,
-    Union,
+    Tuple,
 )
 
 
-BlockVoteCache = Dict[str, Dict[str, Union[str, bytes, int]]]
 Hash32 = NewType('Hash32', bytes)
+BlockVoteCache = Dict[Hash32, Dict[str, Any]]
 ShardId = NewType('ShardId', int)
+# Projective (x, y, z) point of BN128's G1, e.g. an aggregate public key
+G1Point = Tuple[Any, Any, Any]
@@ -3,6 +3,10 @@ from typing import (  # noqa: F401
     Dict,
 )
 
+from ssz import (
+    invalidate,
+)
+
 from .attestation_record import AttestationRecord
 from .chain import Chain
 
@@ -41,6 +45,9 @@ class ActiveState():
 
     def __setattr__(self, name: str, value: Any) -> None:
         super().__setattr__(name, value)
+        # Drop cached encodings of this object and of the objects holding it
+        if name in self.fields:
+            invalidate(self)
 
     def __getattribute__(self, name: str) -> Any:
         return super().__getattribute__(name)
@@ -1,11 +1,18 @@
+import operator
 from typing import (  # noqa: F401
     Any,
     Dict,
 )
 
 from ssz import (
+    invalidate,
     serialize,
 )
+from ssz.cache import (
+    add_parents,
+    get_cache,
+    get_cached,
+)
 
 from beacon_chain.utils.blake import blake
 from beacon_chain.state.constants import (
@@ -15,6 +22,9 @@ from beacon_chain.state.constants import (
 from .attestation_record import AttestationRecord
 
 
+BLOCK_HASH_KEY = 'hash'
+
+
 class Block():
     fields = {
         # Hash of the parent block
@@ -50,13 +60,31 @@ class Block():
 
     def __setattr__(self, name: str, value: Any) -> None:
         super().__setattr__(name, value)
+        # Drop cached encodings of this object and of the objects holding it
+        if name in self.fields:
+            invalidate(self)
 
     def __getattribute__(self, name: str) -> Any:
         return super().__getattribute__(name)
 
     @property
     def hash(self):
-        return blake(serialize(self))
+        # Computed once; assigning a field of the block or of one of its
+        # attestations drops the cached value.  It is kept with the
+        # attestations it was computed from, so that changing the list of
+        # attestations in place is noticed too.
+        cached = get_cached(self, BLOCK_HASH_KEY)
+        attestations = self.attestations
+        if cached is None or not (
+                len(cached[0]) == len(attestations) and
+                all(map(operator.is_, cached[0], attestations))):
+            invalidate(self)
+            get_cache(self)[BLOCK_HASH_KEY] = cached = (
+                tuple(attestations),
+                blake(serialize(self)),
+            )
+            add_parents(self)
+        return cached[1]
 
     @property
     def num_attestations(self):
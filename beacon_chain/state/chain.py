@@ -1,4 +1,5 @@
-from typing import (
+from typing import (  # noqa: F401
+    Dict,
     List,
     TYPE_CHECKING,
 )
@@ -7,6 +8,28 @@ if TYPE_CHECKING:
     from .block import Block  # noqa: F401
 
 
+class _ChainStore():
+    # Append-only storage shared by a chain and the chains extended from it.
+    # A chain only sees the first ``length`` entries of ``chain`` (and
+    # ``num_blocks`` of ``blocks``), so extending it never changes what the
+    # chains it was extended from see.
+
+    def __init__(self) -> None:
+        # All known blocks, in the order they were added
+        self.blocks = []  # type: List['Block']
+        # Canonical chain, oldest block first
+        self.chain = []  # type: List['Block']
+        # Position in ``chain`` of the first block with each hash/slot number
+        self.index_by_hash = {}  # type: Dict[bytes, int]
+        self.index_by_slot_number = {}  # type: Dict[int, int]
+
+    def extend_chain(self, block: 'Block') -> None:
+        index = len(self.chain)
+        self.chain.append(block)
+        self.index_by_hash.setdefault(block.hash, index)
+        self.index_by_slot_number.setdefault(block.slot_number, index)
+
+
 class Chain():
     # Note, this is not an object defined in the v2.1 spec
     # this is a helper object to mask complexity in tracking
@@ -14,27 +37,79 @@ class Chain():
 
     def __init__(self, head: 'Block'=None, blocks: List['Block']=[]) -> None:
         self.head = head
-        self.blocks = blocks
-        self.chain = []  # type: List['Block']
+        self._store = _ChainStore()
+        self._store.blocks.extend(blocks)
 
         # temp helper
         all_blocks_by_hash = {
             block.hash: block
-            for block in self.blocks
+            for block in blocks
         }
 
+        ancestors = []  # type: List['Block']
         if self.head:
             tmp = self.head
-            self.chain.append(tmp)
+            ancestors.append(tmp)
             while all_blocks_by_hash.get(tmp.parent_hash, None):
                 tmp = all_blocks_by_hash[tmp.parent_hash]
-                self.chain.append(tmp)
+                ancestors.append(tmp)
+
+        for block in reversed(ancestors):
+            self._store.extend_chain(block)
+        self._length = len(self._store.chain)
+        self._num_blocks = len(self._store.blocks)
+
+    def append(self, block: 'Block') -> 'Chain':
+        # Return the chain with ``block`` added to ``blocks`` and, if it
+        # extends the head, to the canonical chain as the new head.  This
+        # chain is left unchanged.  Appending to the newest chain of a store
+        # is O(1); appending to an older one (a fork) copies the store first.
+        # Blocks are indexed by their hash when they are added and must not
+        # be modified afterwards.
+        extends_head = (
+            block.parent_hash == self.head.hash
+            if self.head else
+            self._num_blocks == 0
+        )
+        if not extends_head:
+            return Chain(head=block, blocks=self.blocks + [block])
 
-        self.block_by_hash = {
+        store = self._store
+        if len(store.chain) != self._length or len(store.blocks) != self._num_blocks:
+            store = _ChainStore()
+            store.blocks.extend(self._store.blocks[:self._num_blocks])
+            for ancestor in self._store.chain[:self._length]:
+                store.extend_chain(ancestor)
+
+        store.blocks.append(block)
+        store.extend_chain(block)
+
+        new_chain = Chain.__new__(Chain)
+        new_chain.head = block
+        new_chain._store = store
+        new_chain._length = self._length + 1
+        new_chain._num_blocks = self._num_blocks + 1
+        return new_chain
+
+    @property
+    def blocks(self) -> List['Block']:
+        return self._store.blocks[:self._num_blocks]
+
+    @property
+    def chain(self) -> List['Block']:
+        # Head first
+        return self._store.chain[self._length - 1::-1] if self._length else []
+
+    @property
+    def block_by_hash(self) -> Dict[bytes, 'Block']:
+        return {
             block.hash: block
             for block in self.chain
         }
-        self.block_by_slot_number = {
+
+    @property
+    def block_by_slot_number(self) -> Dict[int, 'Block']:
+        return {
             block.slot_number: block
             for block in self.chain
         }
@@ -42,8 +117,13 @@ class Chain():
     def __contains__(self, block: 'Block') -> bool:
         return bool(self.get_block_by_hash(block.hash))
 
+    def _get_block(self, index: int) -> 'Block':
+        if index is None or index >= self._length:
+            return None
+        return self._store.chain[index]
+
     def get_block_by_slot_number(self, slot_number: int) -> 'Block':
-        return self.block_by_slot_number.get(slot_number, None)
+        return self._get_block(self._store.index_by_slot_number.get(slot_number, None))
 
     def get_block_by_hash(self, block_hash: bytes) -> 'Block':
-        return self.block_by_hash.get(block_hash, None)
+        return self._get_block(self._store.index_by_hash.get(block_hash, None))
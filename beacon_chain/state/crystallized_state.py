@@ -4,6 +4,10 @@ from typing import (  # noqa: F401
     List,
 )
 
+from ssz import (
+    invalidate,
+)
+
 from .crosslink_record import CrosslinkRecord
 from .shard_and_committee import ShardAndCommittee
 from .validator_record import ValidatorRecord
@@ -56,6 +60,9 @@ class CrystallizedState():
 
     def __setattr__(self, name: str, value: Any) -> None:
         super().__setattr__(name, value)
+        # Drop cached encodings of this object and of the objects holding it
+        if name in self.fields:
+            invalidate(self)
 
     def __getattribute__(self, name: str) -> Any:
         return super().__getattribute__(name)
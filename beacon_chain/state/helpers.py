@@ -7,6 +7,7 @@ from typing import (
 )
 
 from beacon_chain.beacon_typing.custom import (
+    G1Point,
     Hash32,
     ShardId,
 )
@@ -14,6 +15,9 @@ from beacon_chain.beacon_typing.custom import (
 from ssz import (
     serialize,
 )
+from ssz.cache import (
+    get_cache,
+)
 
 from beacon_chain.state.config import (
     DEFAULT_CONFIG,
@@ -21,6 +25,10 @@ from beacon_chain.state.config import (
 from beacon_chain.state.shard_and_committee import (
     ShardAndCommittee,
 )
+import beacon_chain.utils.bls as bls
+from beacon_chain.utils.bitfield import (
+    has_voted,
+)
 from beacon_chain.utils.blake import (
     blake,
 )
@@ -34,6 +42,11 @@ if TYPE_CHECKING:
     from .validator_record import ValidatorRecord  # noqa: F401
 
 
+# Key of (public keys, sum of their points) in the cache of a
+# ShardAndCommittee
+COMMITTEE_PUBKEYS_KEY = 'committee_pubkeys'
+
+
 def is_power_of_two(num: int) -> bool:
     return ((num & (num - 1)) == 0) and num != 0
 
@@ -101,9 +114,50 @@ def get_hashes_from_active_state(active_state: 'ActiveState',
     return hashes
 
 
-def get_attestation_indices(crystallized_state: 'CrystallizedState',
+def get_attestation_message(slot: int,
+                            parent_hashes: List[Hash32],
+                            shard_id: ShardId,
+                            shard_block_hash: Hash32,
+                            justified_slot: int) -> Hash32:
+    # The message whose signatures are aggregated in an attestation
+    return blake(
+        slot.to_bytes(8, byteorder='big') +
+        b''.join(parent_hashes) +
+        shard_id.to_bytes(2, byteorder='big') +
+        shard_block_hash +
+        justified_slot.to_bytes(8, byteorder='big')
+    )
+
+
+def get_upcoming_attestation_messages(crystallized_state: 'CrystallizedState',
+                                      active_state: 'ActiveState',
+                                      block: 'Block',
+                                      shard_block_hashes: Dict[ShardId, Hash32],
+                                      config: Dict[str, Any]=DEFAULT_CONFIG) -> List[Hash32]:
+    # The messages the committees of ``block``'s slot sign when they attest
+    # to ``block`` without oblique parent hashes, for the shards with a
+    # known shard block hash.  Meant for bls.warm_hash_to_G2.
+    parent_hashes = get_hashes_to_sign(active_state, block, config)
+    return [
+        get_attestation_message(
+            block.slot_number,
+            parent_hashes,
+            shard_and_committee.shard_id,
+            shard_block_hashes[shard_and_committee.shard_id],
+            crystallized_state.last_justified_slot,
+        )
+        for shard_and_committee in get_shards_and_committees_for_slot(
+            crystallized_state,
+            block.slot_number,
+            config=config,
+        )
+        if shard_and_committee.shard_id in shard_block_hashes
+    ]
+
+
+def get_shard_and_committee(crystallized_state: 'CrystallizedState',
                             attestation: 'AttestationRecord',
-                            config: Dict[str, Any]=DEFAULT_CONFIG) -> List[int]:
+                            config: Dict[str, Any]=DEFAULT_CONFIG) -> ShardAndCommittee:
     shard_id = attestation.shard_id
 
     filtered_shards_and_committees_for_slot = list(
@@ -117,13 +171,52 @@ def get_attestation_indices(crystallized_state: 'CrystallizedState',
         )
     )
 
-    attestation_indices = []  # type: List[int]
     if filtered_shards_and_committees_for_slot:
-        attestation_indices = filtered_shards_and_committees_for_slot[0].committee
+        return filtered_shards_and_committees_for_slot[0]
+    return None
+
+
+def get_attestation_indices(crystallized_state: 'CrystallizedState',
+                            attestation: 'AttestationRecord',
+                            config: Dict[str, Any]=DEFAULT_CONFIG) -> List[int]:
+    shard_and_committee = get_shard_and_committee(crystallized_state, attestation, config)
+
+    attestation_indices = []  # type: List[int]
+    if shard_and_committee:
+        attestation_indices = shard_and_committee.committee
 
     return attestation_indices
 
 
+def get_attesters_aggregate_pubkey(crystallized_state: 'CrystallizedState',
+                                   attestation: 'AttestationRecord',
+                                   config: Dict[str, Any]=DEFAULT_CONFIG) -> G1Point:
+    # The aggregate public key of the committee members that voted in
+    # ``attestation``, as a point that bls.verify takes without compressing
+    # it.  The sum of the public keys of the whole committee is cached with
+    # the ShardAndCommittee, so it is computed once per committee (a new
+    # shuffling brings new ShardAndCommittee objects) and most attestations
+    # only subtract their few non-voters from it.
+    shard_and_committee = get_shard_and_committee(crystallized_state, attestation, config)
+    if not shard_and_committee:
+        return bls.sum_pubs([])
+    pub_keys = tuple(
+        crystallized_state.validators[validator_index].pubkey
+        for validator_index in shard_and_committee.committee
+    )
+    voted = [
+        has_voted(attestation.attester_bitfield, committee_index)
+        for committee_index in range(len(pub_keys))
+    ]
+
+    cache = get_cache(shard_and_committee)
+    cached = cache.get(COMMITTEE_PUBKEYS_KEY)
+    # The validators at the committee's indices may differ between states
+    if cached is None or cached[0] != pub_keys:
+        cached = cache[COMMITTEE_PUBKEYS_KEY] = (pub_keys, bls.sum_pubs(pub_keys))
+    return bls.sum_pubs_from_total(cached[1], pub_keys, voted)
+
+
 def get_new_recent_block_hashes(old_block_hashes: List[Hash32],
                                 parent_slot: int,
                                 current_slot: int,
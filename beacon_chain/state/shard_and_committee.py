@@ -3,6 +3,14 @@ from typing import (  # noqa: F401
     Dict,
 )
 
+from ssz import (
+    invalidate,
+)
+
+from beacon_chain.utils.tree_hash import (
+    register_hasher,
+)
+
 
 class ShardAndCommittee():
     fields = {
@@ -24,6 +32,13 @@ class ShardAndCommittee():
 
     def __setattr__(self, name: str, value: Any) -> None:
         super().__setattr__(name, value)
+        # Drop cached encodings of this object and of the objects holding it
+        if name in self.fields:
+            invalidate(self)
 
     def __getattribute__(self, name: str) -> Any:
         return super().__getattribute__(name)
+
+
+# Hashed as the fields in declaration order
+register_hasher(ShardAndCommittee)
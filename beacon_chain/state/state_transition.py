@@ -1,7 +1,12 @@
+from concurrent.futures import (
+    Executor,
+)
 from typing import (
     Any,
     Dict,
+    Generator,
     List,
+    Set,
     Tuple,
     TYPE_CHECKING,
 )
@@ -16,13 +21,14 @@ from ssz import (
 
 from beacon_chain.beacon_typing.custom import (  # noqa: F401
     BlockVoteCache,
+    G1Point,
     Hash32,
     ShardId,
 )
 
 import beacon_chain.utils.bls as bls
-from beacon_chain.utils.blake import (
-    blake,
+from beacon_chain.utils.tree_hash import (
+    tree_hash,
 )
 from beacon_chain.utils.bitfield import (
     get_bitfield_length,
@@ -37,11 +43,12 @@ from .config import (
 from .active_state import (
     ActiveState,
 )
-from .chain import (
-    Chain,
+from .block import (
+    Block,
 )
 from .constants import (
     WEI_PER_ETH,
+    ZERO_HASH32,
 )
 from .crosslink_record import (
     CrosslinkRecord,
@@ -51,7 +58,9 @@ from .crystallized_state import (
 )
 from .helpers import (
     get_active_validator_indices,
+    get_attestation_message,
     get_attestation_indices,
+    get_attesters_aggregate_pubkey,
     get_new_recent_block_hashes,
     get_new_shuffling,
     get_proposer_position,
@@ -62,7 +71,6 @@ from .helpers import (
 
 if TYPE_CHECKING:
     from .attesation_record import AttestationRecord  # noqa: F401
-    from .block import Block  # noqa: F401
     from .validator_record import ValidatorRecord  # noqa: F401
 
 
@@ -77,6 +85,11 @@ def validate_block_pre_processing_conditions(
     # 3. ensure pow_chain_ref processed
     # 4. ensure local time is large enough to process this block's slot
 
+    # The genesis block has no parent state to transition from: the chain
+    # starts from the genesis states, whose roots it carries
+    if block.parent_hash == ZERO_HASH32:
+        raise ValidationError("The genesis block has no state transition")
+
     return True
 
 
@@ -119,12 +132,15 @@ def validate_parent_block_proposer(block: 'Block',
         )
 
 
-def validate_attestation(crystallized_state: CrystallizedState,
-                         active_state: ActiveState,
-                         attestation: 'AttestationRecord',
-                         block: 'Block',
-                         parent_block: 'Block',
-                         config: Dict[str, Any]=DEFAULT_CONFIG) -> bool:
+def validate_attestation_structure(
+        crystallized_state: CrystallizedState,
+        active_state: ActiveState,
+        attestation: 'AttestationRecord',
+        block: 'Block',
+        parent_block: 'Block',
+        config: Dict[str, Any]=DEFAULT_CONFIG) -> Tuple[Hash32, G1Point]:
+    # Validate everything but the aggregate signature and return the signed
+    # message with the aggregate public key of the attesters
     #
     # validate slot number
     #
@@ -195,35 +211,91 @@ def validate_attestation(crystallized_state: CrystallizedState,
             if has_voted(attestation.attester_bitfield, last_bit + i):
                 raise ValidationError("Attestation has non-zero trailing bits")
 
+    message = get_attestation_message(
+        attestation.slot,
+        parent_hashes,
+        attestation.shard_id,
+        attestation.shard_block_hash,
+        attestation.justified_slot,
+    )
+    aggregate_pub = get_attesters_aggregate_pubkey(crystallized_state, attestation, config)
+    return message, aggregate_pub
+
+
+def validate_attestation(crystallized_state: CrystallizedState,
+                         active_state: ActiveState,
+                         attestation: 'AttestationRecord',
+                         block: 'Block',
+                         parent_block: 'Block',
+                         config: Dict[str, Any]=DEFAULT_CONFIG) -> bool:
+    message, aggregate_pub = validate_attestation_structure(
+        crystallized_state,
+        active_state,
+        attestation,
+        block,
+        parent_block,
+        config,
+    )
+
     #
     # validate aggregate_sig
     #
-    pub_keys = [
-        crystallized_state.validators[validator_index].pubkey
-        for committee_index, validator_index in enumerate(attestation_indices)
-        if has_voted(attestation.attester_bitfield, committee_index)
-    ]
-    message = blake(
-        attestation.slot.to_bytes(8, byteorder='big') +
-        b''.join(parent_hashes) +
-        attestation.shard_id.to_bytes(2, byteorder='big') +
-        attestation.shard_block_hash +
-        attestation.justified_slot.to_bytes(8, 'big')
-    )
-    if not bls.verify(message, bls.aggregate_pubs(pub_keys), attestation.aggregate_sig):
+    if not bls.verify(message, aggregate_pub, attestation.aggregate_sig):
         raise ValidationError("Attestation aggregate signature fails")
 
     return True
 
 
+def validate_attestation_signatures(attestations: List['AttestationRecord'],
+                                    messages: List[Hash32],
+                                    aggregate_pubs: List[G1Point],
+                                    executor: Executor=None) -> None:
+    # Verify the aggregate signatures of ``attestations`` in one batch.  If
+    # the batch fails, they are verified one by one to report the first
+    # attestation (in block order) whose signature fails.
+    #
+    # With an executor, the signatures are verified one by one on it in
+    # parallel, and the results are checked in block order.
+    aggregate_sigs = [attestation.aggregate_sig for attestation in attestations]
+    if executor is None and bls.verify_multiple(messages, aggregate_pubs, aggregate_sigs):
+        return
+    for valid in bls.verify_each(messages, aggregate_pubs, aggregate_sigs, executor):
+        if not valid:
+            raise ValidationError("Attestation aggregate signature fails")
+    if executor is None:
+        raise ValidationError("Attestation aggregate signatures fail as a batch")
+
+
 def get_updated_block_vote_cache(crystallized_state: CrystallizedState,
                                  active_state: ActiveState,
                                  attestation: 'AttestationRecord',
                                  block: 'Block',
                                  block_vote_cache: BlockVoteCache,
                                  config: Dict[str, Any]=DEFAULT_CONFIG) -> BlockVoteCache:
-    new_block_vote_cache = deepcopy(block_vote_cache)
+    new_block_vote_cache = dict(block_vote_cache)
+    update_block_vote_cache(
+        crystallized_state,
+        active_state,
+        attestation,
+        block,
+        new_block_vote_cache,
+        set(),
+        config
+    )
+    return new_block_vote_cache
 
+
+def update_block_vote_cache(crystallized_state: CrystallizedState,
+                            active_state: ActiveState,
+                            attestation: 'AttestationRecord',
+                            block: 'Block',
+                            block_vote_cache: BlockVoteCache,
+                            owned_hashes: Set[Hash32],
+                            config: Dict[str, Any]=DEFAULT_CONFIG) -> None:
+    # Record the votes of ``attestation`` in ``block_vote_cache`` in place.
+    # Entries are shared with earlier states, so an entry is copied before
+    # its first modification unless its hash is in ``owned_hashes``; copied
+    # or newly created hashes are added to ``owned_hashes``.
     parent_hashes = get_signed_parent_hashes(
         active_state,
         block,
@@ -239,52 +311,125 @@ def get_updated_block_vote_cache(crystallized_state: CrystallizedState,
     for parent_hash in parent_hashes:
         if parent_hash in attestation.oblique_parent_hashes:
             continue
-        if parent_hash not in new_block_vote_cache:
-            new_block_vote_cache[parent_hash] = {
+        if parent_hash not in block_vote_cache:
+            block_vote_cache[parent_hash] = {
                 'voter_indices': set(),
                 'total_voter_deposits': 0
             }
+            owned_hashes.add(parent_hash)
         for committee_index, validator_index in enumerate(attestation_indices):
             if (has_voted(attestation.attester_bitfield, committee_index) and
-                    validator_index not in new_block_vote_cache[parent_hash]['voter_indices']):
-                new_block_vote_cache[parent_hash]['voter_indices'].add(validator_index)
-                new_block_vote_cache[parent_hash]['total_voter_deposits'] += (
+                    validator_index not in block_vote_cache[parent_hash]['voter_indices']):
+                if parent_hash not in owned_hashes:
+                    entry = block_vote_cache[parent_hash]
+                    block_vote_cache[parent_hash] = {
+                        'voter_indices': set(entry['voter_indices']),
+                        'total_voter_deposits': entry['total_voter_deposits']
+                    }
+                    owned_hashes.add(parent_hash)
+                block_vote_cache[parent_hash]['voter_indices'].add(validator_index)
+                block_vote_cache[parent_hash]['total_voter_deposits'] += (
                     crystallized_state.validators[validator_index].balance
                 )
 
-    return new_block_vote_cache
-
 
 def process_block(crystallized_state: CrystallizedState,
                   active_state: ActiveState,
                   block: 'Block',
                   parent_block: 'Block',
-                  config: dict = DEFAULT_CONFIG) -> ActiveState:
-    new_block_vote_cache = deepcopy(active_state.block_vote_cache)
+                  config: dict = DEFAULT_CONFIG,
+                  batch_verify: bool=True,
+                  executor: Executor=None) -> ActiveState:
+    # ``executor`` (optional, e.g. bls.get_process_pool()) verifies the
+    # signatures of the attestations in parallel
+    deferred_verify = batch_verify or executor is not None
+    new_active_state, messages, aggregate_pubs = process_block_structure(
+        crystallized_state,
+        active_state,
+        block,
+        parent_block,
+        config,
+        deferred_verify=deferred_verify,
+        executor=executor,
+    )
+
+    # The aggregate signatures of all attestations are verified together,
+    # once everything else about them is validated
+    if deferred_verify and block.attestations:
+        validate_attestation_signatures(
+            block.attestations,
+            messages,
+            aggregate_pubs,
+            executor,
+        )
+
+    return new_active_state
+
+
+def process_block_structure(
+        crystallized_state: CrystallizedState,
+        active_state: ActiveState,
+        block: 'Block',
+        parent_block: 'Block',
+        config: Dict[str, Any]=DEFAULT_CONFIG,
+        deferred_verify: bool=True,
+        executor: Executor=None) -> Tuple[ActiveState, List[Hash32], List[G1Point]]:
+    # Process ``block`` and return the new active state along with the
+    # message and aggregate pubkey of each attestation.  With
+    # ``deferred_verify``, the aggregate signatures are left for the caller
+    # to verify against them, except those of the attestations before one
+    # that fails validation (verified on ``executor`` if given).
+    # Entries are shared with the parent state and copied on first write
+    new_block_vote_cache = dict(active_state.block_vote_cache)
+    owned_hashes = set()  # type: Set[Hash32]
+    messages = []  # type: List[Hash32]
+    aggregate_pubs = []  # type: List[G1Point]
 
     validate_parent_block_proposer(block, parent_block, crystallized_state, config=config)
 
     for attestation in block.attestations:
-        validate_attestation(crystallized_state,
-                             active_state,
-                             attestation,
-                             block,
-                             parent_block,
-                             config)
-        new_block_vote_cache = get_updated_block_vote_cache(
+        if deferred_verify:
+            try:
+                message, aggregate_pub = validate_attestation_structure(
+                    crystallized_state,
+                    active_state,
+                    attestation,
+                    block,
+                    parent_block,
+                    config,
+                )
+            except ValidationError:
+                # Errors are reported in block order: a bad signature of an
+                # earlier attestation comes first
+                if messages:
+                    validate_attestation_signatures(
+                        block.attestations[:len(messages)],
+                        messages,
+                        aggregate_pubs,
+                        executor,
+                    )
+                raise
+            messages.append(message)
+            aggregate_pubs.append(aggregate_pub)
+        else:
+            validate_attestation(crystallized_state,
+                                 active_state,
+                                 attestation,
+                                 block,
+                                 parent_block,
+                                 config)
+        update_block_vote_cache(
             crystallized_state,
             active_state,
             attestation,
             block,
             new_block_vote_cache,
+            owned_hashes,
             config
         )
 
     new_attestations = active_state.pending_attestations + block.attestations
-    new_chain = Chain(
-        head=block,
-        blocks=active_state.chain.blocks + [block]
-    )
+    new_chain = active_state.chain.append(block)
 
     new_active_state = ActiveState(
         pending_attestations=new_attestations,
@@ -292,7 +437,7 @@ def process_block(crystallized_state: CrystallizedState,
         block_vote_cache=new_block_vote_cache,
         chain=new_chain
     )
-    return new_active_state
+    return new_active_state, messages, aggregate_pubs
 
 
 def process_updated_crosslinks(crystallized_state: CrystallizedState,
@@ -301,7 +446,8 @@ def process_updated_crosslinks(crystallized_state: CrystallizedState,
                                config: Dict[str, Any]=DEFAULT_CONFIG) -> List[CrosslinkRecord]:
     total_attestation_balance = {}  # type: Dict[Tuple[ShardId, Hash32], int]
 
-    crosslinks = deepcopy(crystallized_state.crosslink_records)
+    # Records are replaced rather than mutated, so they can be shared
+    crosslinks = list(crystallized_state.crosslink_records)
 
     for attestation in active_state.pending_attestations:
         shard_tuple = (attestation.shard_id, attestation.shard_block_hash)
@@ -414,8 +560,8 @@ def initialize_new_cycle(crystallized_state: CrystallizedState,
         recent_block_hashes=active_state.recent_block_hashes[:],
         # Should probably clean up block_vote_cache but old records won't break cache
         # so okay for now
-        block_vote_cache=deepcopy(active_state.block_vote_cache),
-        chain=deepcopy(active_state.chain),
+        block_vote_cache=dict(active_state.block_vote_cache),
+        chain=active_state.chain,
     )
 
     return new_crystallized_state, new_active_state
@@ -424,16 +570,18 @@ def initialize_new_cycle(crystallized_state: CrystallizedState,
 def fill_recent_block_hashes(active_state: ActiveState,
                              parent_block: 'Block',
                              block: 'Block') -> ActiveState:
+    # Attestations, vote cache entries and the chain are never modified in
+    # place by the state transition, so the new state shares them
     return ActiveState(
-        pending_attestations=deepcopy(active_state.pending_attestations),
+        pending_attestations=list(active_state.pending_attestations),
         recent_block_hashes=get_new_recent_block_hashes(
             active_state.recent_block_hashes,
             parent_block.slot_number,
             block.slot_number,
             block.parent_hash
         ),
-        block_vote_cache=deepcopy(active_state.block_vote_cache),
-        chain=deepcopy(active_state.chain),
+        block_vote_cache=dict(active_state.block_vote_cache),
+        chain=active_state.chain,
     )
 
 
@@ -615,7 +763,8 @@ def apply_rewards_and_penalties(crystallized_state: CrystallizedState,
         config=config
     )
 
-    updated_validators = deepcopy(crystallized_state.validators)
+    # Only the validators whose balance changes are copied
+    updated_validators = list(crystallized_state.validators)
     active_validator_indices = get_active_validator_indices(
         crystallized_state.current_dynasty,
         crystallized_state.validators
@@ -623,13 +772,17 @@ def apply_rewards_and_penalties(crystallized_state: CrystallizedState,
 
     # apply rewards and penalties
     for index in active_validator_indices:
-        updated_validators[index].balance += (
+        balance = updated_validators[index].balance + (
             ffg_rewards[index] +
             crosslink_rewards[index]
         )
         # TODO: Keep the balance nonnegative now until we have clear rule of forced exit.
-        if updated_validators[index].balance < 0:
-            updated_validators[index].balance = 0
+        if balance < 0:
+            balance = 0
+
+        if balance != updated_validators[index].balance:
+            updated_validators[index] = deepcopy(updated_validators[index])
+            updated_validators[index].balance = balance
 
     return updated_validators
 
@@ -662,25 +815,38 @@ def ready_for_dynasty_transition(crystallized_state: CrystallizedState,
 def compute_dynasty_transition(crystallized_state: CrystallizedState,
                                block: 'Block',
                                config: Dict[str, Any]=DEFAULT_CONFIG) -> CrystallizedState:
-    crystallized_state = deepcopy(crystallized_state)
-    crystallized_state.current_dynasty += 1
-
-    # Not current in spec, but should be added soon
-    crystallized_state.dynasty_start = crystallized_state.last_state_recalc
+    current_dynasty = crystallized_state.current_dynasty + 1
 
     next_start_shard = (
         (crystallized_state.shard_and_committee_for_slots[-1][-1].shard_id + 1) %
         config['shard_count']
     )
 
-    crystallized_state.shard_and_committee_for_slots[config['cycle_length']:] = get_new_shuffling(
-        block.parent_hash,  # stub until better RNG
-        crystallized_state.validators,
-        crystallized_state.current_dynasty,
-        next_start_shard
+    shard_and_committee_for_slots = (
+        crystallized_state.shard_and_committee_for_slots[:config['cycle_length']] +
+        get_new_shuffling(
+            block.parent_hash,  # stub until better RNG
+            crystallized_state.validators,
+            current_dynasty,
+            next_start_shard
+        )
     )
 
-    return crystallized_state
+    # Everything but the dynasty fields and the new shuffling is shared with
+    # the previous state
+    return CrystallizedState(
+        validators=crystallized_state.validators,
+        last_state_recalc=crystallized_state.last_state_recalc,
+        shard_and_committee_for_slots=shard_and_committee_for_slots,
+        last_justified_slot=crystallized_state.last_justified_slot,
+        justified_streak=crystallized_state.justified_streak,
+        last_finalized_slot=crystallized_state.last_finalized_slot,
+        current_dynasty=current_dynasty,
+        crosslink_records=crystallized_state.crosslink_records,
+        dynasty_seed=crystallized_state.dynasty_seed,
+        # Not current in spec, but should be added soon
+        dynasty_start=crystallized_state.last_state_recalc,
+    )
 
 
 def compute_cycle_transitions(
@@ -706,11 +872,41 @@ def compute_cycle_transitions(
     return crystallized_state, active_state
 
 
-def compute_state_transition(
+def get_state_roots(crystallized_state: CrystallizedState,
+                    active_state: ActiveState) -> Tuple[Hash32, Hash32]:
+    # The (crystallized_state_root, active_state_root) a block leading to
+    # these post-states carries
+    return tree_hash(crystallized_state), tree_hash(active_state)
+
+
+def validate_state_roots(block: 'Block',
+                         crystallized_state: CrystallizedState,
+                         active_state: ActiveState) -> None:
+    # Both roots are always checked.  A block proposer fills them in with
+    # compute_state_transition_with_roots.
+    crystallized_state_root, active_state_root = get_state_roots(
+        crystallized_state,
+        active_state,
+    )
+    if block.crystallized_state_root != crystallized_state_root:
+        raise ValidationError(
+            "Block crystallized_state_root %s doesn't match the post-state" %
+            block.crystallized_state_root
+        )
+    if block.active_state_root != active_state_root:
+        raise ValidationError(
+            "Block active_state_root %s doesn't match the post-state" %
+            block.active_state_root
+        )
+
+
+def compute_post_state(
         parent_state: Tuple[CrystallizedState, ActiveState],
         parent_block: 'Block',
         block: 'Block',
-        config: Dict[str, Any]=DEFAULT_CONFIG) -> Tuple[CrystallizedState, ActiveState]:
+        config: Dict[str, Any]=DEFAULT_CONFIG,
+        executor: Executor=None) -> Tuple[CrystallizedState, ActiveState]:
+    # The post-states of ``block``, whose state roots are not checked
     crystallized_state, active_state = parent_state
 
     validate_block_pre_processing_conditions(
@@ -729,7 +925,8 @@ def compute_state_transition(
         active_state,
         block,
         parent_block,
-        config
+        config,
+        executor=executor,
     )
 
     # Initialize a new cycle(s) if needed
@@ -741,3 +938,146 @@ def compute_state_transition(
     )
 
     return crystallized_state, active_state
+
+
+def compute_state_transition(
+        parent_state: Tuple[CrystallizedState, ActiveState],
+        parent_block: 'Block',
+        block: 'Block',
+        config: Dict[str, Any]=DEFAULT_CONFIG,
+        executor: Executor=None) -> Tuple[CrystallizedState, ActiveState]:
+    crystallized_state, active_state = compute_post_state(
+        parent_state,
+        parent_block,
+        block,
+        config,
+        executor=executor,
+    )
+
+    validate_state_roots(block, crystallized_state, active_state)
+
+    return crystallized_state, active_state
+
+
+def compute_state_transition_with_roots(
+        parent_state: Tuple[CrystallizedState, ActiveState],
+        parent_block: 'Block',
+        block: 'Block',
+        config: Dict[str, Any]=DEFAULT_CONFIG,
+        executor: Executor=None) -> Tuple['Block', CrystallizedState, ActiveState]:
+    # For block proposers: ``block`` with the state roots of its post-states
+    # filled in, and those post-states.  The roots of ``block`` are ignored
+    # (the post-states do not depend on them) and the transition runs once.
+    crystallized_state, active_state = compute_post_state(
+        parent_state,
+        parent_block,
+        block,
+        config,
+        executor=executor,
+    )
+    crystallized_state_root, active_state_root = get_state_roots(
+        crystallized_state,
+        active_state,
+    )
+    block_params = {name: getattr(block, name) for name in Block.fields}
+    block_params.update(
+        crystallized_state_root=crystallized_state_root,
+        active_state_root=active_state_root,
+    )
+    block = Block(**block_params)
+
+    # The chain of the post-state holds the block it was computed from,
+    # which is replaced by the completed one
+    active_state.chain = parent_state[1].chain.append(block)
+
+    return block, crystallized_state, active_state
+
+
+class PendingStateTransition():
+    # The tentative post-state of a block whose attestation signatures are
+    # still being verified.  ``result`` commits the state once every
+    # signature passes, or rolls it back by raising ``ValidationError``.
+
+    def __init__(self,
+                 block: 'Block',
+                 crystallized_state: CrystallizedState,
+                 active_state: ActiveState,
+                 verifications: Generator[bool, None, None]) -> None:
+        self.block = block
+        # Tentative until committed; states built on it must be discarded
+        # if it rolls back
+        self.crystallized_state = crystallized_state
+        self.active_state = active_state
+        self._verifications = verifications
+        self._committed = None  # type: bool
+
+    def result(self) -> Tuple[CrystallizedState, ActiveState]:
+        # Signatures are checked in block order, so the first failing
+        # attestation is the one reported
+        if self._committed is None:
+            self._committed = all(self._verifications)
+        if not self._committed:
+            raise ValidationError("Attestation aggregate signature fails")
+        return self.crystallized_state, self.active_state
+
+    def cancel(self) -> None:
+        # Drop the signature checks not yet started and roll back
+        if self._committed is None:
+            self._verifications.close()
+            self._committed = False
+
+
+def compute_state_transition_deferred(
+        parent_state: Tuple[CrystallizedState, ActiveState],
+        parent_block: 'Block',
+        block: 'Block',
+        config: Dict[str, Any]=DEFAULT_CONFIG,
+        executor: Executor=None) -> PendingStateTransition:
+    # Like compute_state_transition, but the attestation signatures are
+    # queued on ``executor`` (by default bls.get_process_pool()) and the
+    # returned transition is committed only once they all pass.  Every
+    # other check is done before returning.
+    if executor is None:
+        executor = bls.get_process_pool()
+    crystallized_state, active_state = parent_state
+
+    validate_block_pre_processing_conditions(
+        block,
+        parent_block,
+        crystallized_state,
+        config=config,
+    )
+
+    active_state = fill_recent_block_hashes(active_state, parent_block, block)
+
+    active_state, messages, aggregate_pubs = process_block_structure(
+        crystallized_state,
+        active_state,
+        block,
+        parent_block,
+        config,
+        executor=executor,
+    )
+    verifications = bls.verify_each(
+        messages,
+        aggregate_pubs,
+        [attestation.aggregate_sig for attestation in block.attestations],
+        executor,
+    )
+
+    crystallized_state, active_state = compute_cycle_transitions(
+        crystallized_state,
+        active_state,
+        block,
+        config=config,
+    )
+
+    try:
+        validate_state_roots(block, crystallized_state, active_state)
+    except ValidationError:
+        # As in compute_state_transition, a bad signature is reported first
+        if not all(verifications):
+            raise ValidationError("Attestation aggregate signature fails")
+        raise
+
+    return PendingStateTransition(block, crystallized_state, active_state, verifications)
@@ -1,3 +1,9 @@
+import collections
+import concurrent.futures
+import functools
+import secrets
+import threading
+
 from .blake import blake
 from py_ecc.optimized_bn128 import (  # NOQA
     G1,
@@ -17,11 +23,65 @@ from py_ecc.optimized_bn128 import (  # NOQA
     b2,
     is_on_curve,
     curve_order,
-    final_exponentiate
+    double,
+    final_exponentiate,
+    twist,
+)
+from py_ecc.optimized_bn128.optimized_pairing import (
+    cast_point_to_fq12,
+    linefunc,
+    pseudo_binary_encoding,
 )
 
 
-CACHE = {}
+class LRUCache():
+    # Mapping of at most ``maxsize`` entries that drops the least recently
+    # used one when full, counting its hits and misses.  Safe to use from
+    # several threads (e.g. while warm_hash_to_G2 fills it).
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()  # type: collections.OrderedDict
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# hash_to_G2 points by message
+CACHE = LRUCache(2**16)
+# Decompressed G1 points by compressed public key
+G1_CACHE = LRUCache(2**18)
+# G2Lines of hash_to_G2 points by message (about 150 KB each)
+LINES_CACHE = LRUCache(2**7)
 # 16th root of unity
 HEX_ROOT = FQ2([21573744529824266246521972077326577680729363968861965890554801909984373949499,
                 16854739155576650954933913186877292401521110422362946064090026408937773542853])
@@ -37,6 +97,27 @@ def compress_G1(pt):
 
 
 def decompress_G1(p):
+    # Registry public keys are decompressed again for every aggregate they
+    # are part of, so the points (which are never modified) are kept in
+    # G1_CACHE.  Keys only seen once, like the aggregates that signatures
+    # are verified against, are decompressed with _decompress_G1 so that
+    # they do not evict them.
+    o = G1_CACHE.get(p)
+    if o is None:
+        o = _decompress_G1(p)
+        G1_CACHE.put(p, o)
+    return o
+
+
+def _G1_point(pub):
+    # The point of a public key given compressed, or already as a point
+    # (e.g. an aggregate from sum_pubs_from_total, which is never compressed)
+    if isinstance(pub, tuple):
+        return pub
+    return _decompress_G1(pub)
+
+
+def _decompress_G1(p):
     if p == 0:
         return (FQ(1), FQ(1), FQ(0))
     x = p % 2**255
@@ -56,8 +137,14 @@ def sqrt_fq2(x):
 
 
 def hash_to_G2(m):
-    if m in CACHE:
-        return CACHE[m]
+    o = CACHE.get(m)
+    if o is None:
+        o = _hash_to_G2(m)
+        CACHE.put(m, o)
+    return o
+
+
+def _hash_to_G2(m):
     k2 = m
     while 1:
         k1 = blake(k2)
@@ -69,9 +156,27 @@ def hash_to_G2(m):
         if xcb ** ((field_modulus ** 2 - 1) // 2) == FQ2([1, 0]):
             break
     y = sqrt_fq2(xcb)
-    o = multiply((x, y, FQ2([1, 0])), 2*field_modulus-curve_order)
-    CACHE[m] = o
-    return o
+    return multiply((x, y, FQ2([1, 0])), 2*field_modulus-curve_order)
+
+
+def _store_hash_to_G2(m, future):
+    if future.exception() is None:
+        CACHE.put(m, future.result())
+
+
+def warm_hash_to_G2(msgs, executor):
+    # Compute hash_to_G2 of ``msgs`` (e.g. the attestation messages of the
+    # next slot) on ``executor`` ahead of their use; each point is added to
+    # CACHE as soon as it is ready.  Returns the futures of the messages
+    # that were not cached yet.
+    futures = []
+    for m in dict.fromkeys(msgs):
+        if m in CACHE:
+            continue
+        future = executor.submit(_hash_to_G2, m)
+        future.add_done_callback(functools.partial(_store_hash_to_G2, m))
+        futures.append(future)
+    return futures
 
 
 def compress_G2(pt):
@@ -102,23 +207,269 @@ def privtopub(k):
     return compress_G1(multiply(G1, k))
 
 
-def verify(m, pub, sig):
-    final_exponentiation = final_exponentiate(
-        pairing(decompress_G2(sig), G1, False) *
-        pairing(hash_to_G2(m), neg(decompress_G1(pub)), False)
+def _line_coefficients(P1, P2):
+    # linefunc(P1, P2, T) of py_ecc's optimized_pairing as (A, B, C, D):
+    # the line at an affine T = (x, y) is (A * x + B * y + C, D)
+    zero = P1[0].__class__.zero()
+    x1, y1, z1 = P1
+    x2, y2, z2 = P2
+    m_numerator = y2 * z1 - y1 * z2
+    m_denominator = x2 * z1 - x1 * z2
+    if m_denominator == zero:
+        if m_numerator != zero:
+            # Vertical line
+            return z1, zero, -x1, z1
+        # Tangent
+        m_numerator = 3 * x1 * x1
+        m_denominator = 2 * y1 * z1
+    return (
+        m_numerator * z1,
+        -(m_denominator * z1),
+        m_denominator * y1 - m_numerator * x1,
+        m_denominator * z1,
     )
-    return final_exponentiation == FQ12.one()
+
+
+class G2Lines():
+    # The lines of the Miller loop of a G2 point, which only depend on that
+    # point.  A pair of G2Lines and a G1 point in miller_loop_multiple only
+    # evaluates the lines at the G1 point, without doubling and adding G2
+    # points.
+
+    def __init__(self, Q):
+        assert is_on_curve(Q, b2)
+        self.infinity = Q[-1] == Q[-1].__class__.zero()
+        # Lines of each step of the loop, then of the two final additions
+        self.steps = []
+        self.final = []
+        if self.infinity:
+            return
+        Q = twist(Q)
+        R = Q
+        for v in pseudo_binary_encoding[63::-1]:
+            lines = [_line_coefficients(R, R)]
+            R = double(R)
+            if v != 0:
+                nQ = Q if v == 1 else neg(Q)
+                lines.append(_line_coefficients(R, nQ))
+                R = add(R, nQ)
+            self.steps.append(lines)
+        Q1 = (Q[0] ** field_modulus, Q[1] ** field_modulus, Q[2] ** field_modulus)
+        nQ2 = (Q1[0] ** field_modulus, -Q1[1] ** field_modulus, Q1[2] ** field_modulus)
+        self.final.append(_line_coefficients(R, Q1))
+        R = add(R, Q1)
+        self.final.append(_line_coefficients(R, nQ2))
+
+
+def miller_loop_multiple(pairs):
+    # The product of pairing(Q, P, False) over the (G2 point, G1 point)
+    # pairs (up to a factor that the final exponentiation removes), with a
+    # single Miller loop: the loop runs over all pairs at once, so the
+    # accumulated value is squared (and divided at the end) once for all
+    # of them instead of once per pair.  Q can also be the G2Lines of a G2
+    # point.
+    points = []
+    precomputed = []
+    for Q, P in pairs:
+        assert is_on_curve(P, b)
+        # Pairings with the point at infinity are one
+        if P[-1] == P[-1].__class__.zero():
+            continue
+        if isinstance(Q, G2Lines):
+            if not Q.infinity:
+                x, y = normalize(P)
+                precomputed.append((Q, x.n, y.n))
+            continue
+        assert is_on_curve(Q, b2)
+        if Q[-1] != Q[-1].__class__.zero():
+            points.append((twist(Q), cast_point_to_fq12(P)))
+    if not points and not precomputed:
+        return FQ12.one()
+
+    # As in py_ecc.optimized_bn128.optimized_pairing.miller_loop
+    R = [Q for Q, P in points]
+    f_num, f_den = FQ12.one(), FQ12.one()
+    for step, v in enumerate(pseudo_binary_encoding[63::-1]):
+        f_num = f_num * f_num
+        f_den = f_den * f_den
+        for lines, x, y in precomputed:
+            for A, B, C, D in lines.steps[step]:
+                f_num = f_num * (A * x + B * y + C)
+                f_den = f_den * D
+        for i, (Q, P) in enumerate(points):
+            _n, _d = linefunc(R[i], R[i], P)
+            f_num = f_num * _n
+            f_den = f_den * _d
+            R[i] = double(R[i])
+            if v != 0:
+                nQ = Q if v == 1 else neg(Q)
+                _n, _d = linefunc(R[i], nQ, P)
+                f_num = f_num * _n
+                f_den = f_den * _d
+                R[i] = add(R[i], nQ)
+    for lines, x, y in precomputed:
+        for A, B, C, D in lines.final:
+            f_num = f_num * (A * x + B * y + C)
+            f_den = f_den * D
+    for i, (Q, P) in enumerate(points):
+        Q1 = (Q[0] ** field_modulus, Q[1] ** field_modulus, Q[2] ** field_modulus)
+        nQ2 = (Q1[0] ** field_modulus, -Q1[1] ** field_modulus, Q1[2] ** field_modulus)
+        _n1, _d1 = linefunc(R[i], Q1, P)
+        R[i] = add(R[i], Q1)
+        _n2, _d2 = linefunc(R[i], nQ2, P)
+        f_num = f_num * _n1 * _n2
+        f_den = f_den * _d1 * _d2
+    return f_num / f_den
+
+
+def multi_pairing(pairs):
+    # The product of the pairings of the (G2 point, G1 point) pairs, with
+    # one Miller loop and one final exponentiation for all of them
+    return final_exponentiate(miller_loop_multiple(pairs))
+
+
+def hash_to_G2_lines(m):
+    # G2Lines of hash_to_G2(m), computed on the first use of a message: the
+    # same message is verified with the signatures of every attester of a
+    # committee
+    o = LINES_CACHE.get(m)
+    if o is None:
+        o = G2Lines(hash_to_G2(m))
+        LINES_CACHE.put(m, o)
+    return o
+
+
+def verify(m, pub, sig):
+    # ``pub`` is a compressed public key or a G1 point
+    return multi_pairing([
+        (decompress_G2(sig), G1),
+        (hash_to_G2_lines(m), neg(_G1_point(pub))),
+    ]) == FQ12.one()
+
+
+def verify_multiple(msgs, pubs, sigs):
+    # Whether verify(msgs[i], pubs[i], sigs[i]) holds for every i, with one
+    # final exponentiation for the whole batch.  Each triple is weighted by
+    # a random 64-bit factor r_i and the batch checks
+    # e(sum(r_i * sig_i), G1) * prod(e(H(m_i), -r_i * pub_i)) == 1, which a
+    # batch holding an invalid triple only passes with probability 2**-64.
+    # Triples with the same message share their pairing.
+    assert len(msgs) == len(pubs) == len(sigs)
+    if not msgs:
+        return True
+    weights = [secrets.randbits(64) | 1 for _ in msgs]
+    sig_sum = Z2
+    pub_sums = {}
+    for m, pub, sig, r in zip(msgs, pubs, sigs, weights):
+        sig_sum = add(sig_sum, multiply(decompress_G2(sig), r))
+        pub_sums[m] = add(pub_sums.get(m, Z1), multiply(_G1_point(pub), r))
+    pairs = [(sig_sum, G1)] + [
+        (hash_to_G2_lines(m), neg(pub_sum))
+        for m, pub_sum in pub_sums.items()
+    ]
+    return multi_pairing(pairs) == FQ12.one()
+
+
+def _verify(m, pub, sig):
+    # Looked up at call time, so that verify can be replaced in tests
+    return verify(m, pub, sig)
+
+
+def verify_each(msgs, pubs, sigs, executor=None):
+    # Iterator of verify(msgs[i], pubs[i], sigs[i]), in order.  With an
+    # executor (e.g. get_process_pool()), the verifications run on it.  A
+    # process pool is only sent the message, the compressed pubkey and the
+    # signature, so pubkeys given as points are compressed for it.
+    if executor is None:
+        return map(_verify, msgs, pubs, sigs)
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        pubs = [compress_G1(pub) if isinstance(pub, tuple) else pub for pub in pubs]
+    return executor.map(_verify, msgs, pubs, sigs)
+
+
+_PROCESS_POOL = None
+
+
+def get_process_pool(max_workers=None):
+    # A process pool kept for the life of the process, so its workers keep
+    # their caches (decompressed keys, message points and lines) from one
+    # block to the next
+    global _PROCESS_POOL
+    if _PROCESS_POOL is None:
+        _PROCESS_POOL = concurrent.futures.ProcessPoolExecutor(max_workers)
+    return _PROCESS_POOL
+
+
+class Aggregator():
+    # Accumulates a sum of points in projective coordinates.  Inputs can be
+    # compressed (``add``) or already decompressed points (``add_point``);
+    # the sum is only normalized when ``compress`` is asked for the wire
+    # form, so aggregates can keep growing without a compress/decompress
+    # round-trip (and its inversion and square root) at every step.
+    # Subclasses set the group's ``zero``, ``decompress`` and
+    # ``compress_point``.
+    def __init__(self, point=None):
+        self.point = self.zero if point is None else point
+
+    def add(self, p):
+        return self.add_point(self.decompress(p))
+
+    def add_point(self, pt):
+        self.point = add(self.point, pt)
+        return self
+
+    def sub(self, p):
+        return self.sub_point(self.decompress(p))
+
+    def sub_point(self, pt):
+        self.point = add(self.point, neg(pt))
+        return self
+
+    def extend(self, ps):
+        for p in ps:
+            self.add(p)
+        return self
+
+    def compress(self):
+        return self.compress_point(self.point)
+
+
+class G1Aggregator(Aggregator):
+    # Sums of public keys
+    zero = Z1
+    decompress = staticmethod(decompress_G1)
+    compress_point = staticmethod(compress_G1)
+
+
+class G2Aggregator(Aggregator):
+    # Sums of signatures
+    zero = Z2
+    decompress = staticmethod(decompress_G2)
+    compress_point = staticmethod(compress_G2)
 
 
 def aggregate_sigs(sigs):
-    o = Z2
-    for s in sigs:
-        o = add(o, decompress_G2(s))
-    return compress_G2(o)
+    return G2Aggregator().extend(sigs).compress()
+
+
+def sum_pubs(pubs):
+    # The (uncompressed) sum of the points of ``pubs``
+    return G1Aggregator().extend(pubs).point
 
 
 def aggregate_pubs(pubs):
-    o = Z1
-    for p in pubs:
-        o = add(o, decompress_G1(p))
-    return compress_G1(o)
+    return G1Aggregator().extend(pubs).compress()
+
+
+def sum_pubs_from_total(total, pubs, included):
+    # sum_pubs of the pubs whose ``included`` flag is set, given ``total`` =
+    # sum_pubs(pubs).  When most pubs are included, the excluded ones are
+    # subtracted from ``total`` instead of adding up the others.
+    included_pubs = [p for p, flag in zip(pubs, included) if flag]
+    if len(included_pubs) * 2 <= len(pubs):
+        return sum_pubs(included_pubs)
+    aggregator = G1Aggregator(total)
+    for p, flag in zip(pubs, included):
+        if not flag:
+            aggregator.sub(p)
+    return aggregator.point
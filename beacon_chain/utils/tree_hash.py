@@ -0,0 +1,895 @@
+"""Tree hashing of SSZ objects.
+
+``tree_hash(val, typ)`` hashes scalars to their encoding, ``bytes`` to their
+hash, lists to the root of a Merkle tree over the hashes of their elements
+(``merkle_hash``) and containers to the hash of the concatenated hashes of
+their fields, in sorted field order.
+
+Container types can register their own hasher with ``register_hasher``.  The
+default registered hasher is a fixed-layout one compiled from the type: the
+hash of the field hashes in declaration order (this is how ``ValidatorRecord``
+and ``ShardAndCommittee`` are hashed).
+
+Hashes of containers are kept in the per-object caches of ``ssz.cache`` and
+large lists of containers (the validator registry) are hashed through a
+``ListTree`` that keeps its internal nodes, so hashing a state that shares
+most of its objects with an already hashed one only costs what changed.
+Since lists changed in place are not noticed by the caches, only containers
+without lists (e.g. ``ValidatorRecord``) are cached unless the caller asks
+for it with ``tree_hash(..., cache=True)`` (like ``ssz.serialize``).
+``tree_hash`` can be called from several threads at once: each thread runs
+its own pass, and the shared ``ListTree``s are used under a lock.
+
+``make_proofs`` builds Merkle branches of single list elements of a container
+(e.g. ``validators[i]`` of a ``CrystallizedState``), which ``verify_proof``
+checks against the container's tree hash without the rest of the container.
+"""
+import collections
+import itertools
+import operator
+import threading
+import weakref
+
+from ssz.cache import (
+    add_parents,
+    get_cache,
+    get_cached,
+    invalidate,
+    watch,
+)
+from ssz.codec import (
+    get_codec,
+)
+from ssz.layout import (
+    field_offsets,
+    static_size,
+)
+
+from .blake import blake
+
+
+TREE_HASH_KEY = 'tree_hash'
+
+CHUNKSIZE = 128
+
+# Lists of containers at least this long are hashed through a ListTree
+LIST_TREE_MIN_LENGTH = 256
+
+# With an executor, trees of at least this many chunks are built in parallel
+PARALLEL_MIN_CHUNKS = 2**12
+# Number of subtrees the bottom of a parallel tree is split into
+PARALLEL_PARTS = 64
+
+# Container type -> hasher(val) returning the hash of a value of that type
+HASHERS = {}
+# Container type -> hasher(data, pos) returning (hash, end) of the value
+# encoded at ``pos`` in ``data``
+SERIALIZED_HASHERS = {}
+# Container types of HASHERS whose hasher is a compiled fixed-layout one
+FIXED_LAYOUT_TYPES = set()
+
+
+def next_power_of_2(x):
+    return 1 if x <= 1 else 1 << (x - 1).bit_length()
+
+
+def extend_to_power_of_2(bytez):
+    return bytez + b'\x00' * (next_power_of_2(len(bytez)) - len(bytez))
+
+
+def length_suffix(count):
+    # Stored with the root to compensate for the non-bijectiveness of padding
+    return count.to_bytes(32, 'big')
+
+
+#
+# Merkle trees over lists of item hashes.  Items are padded to a power of 2
+# size and packed into chunks of CHUNKSIZE bytes, the chunks are padded with
+# zero chunks to a power of 2 count, and the root is hashed together with the
+# number of items.  An empty list has a single zero chunk.
+#
+def chunk_data(lst):
+    # The items of lst padded and concatenated
+    if lst and len(lst[0]) != next_power_of_2(len(lst[0])):
+        lst = [extend_to_power_of_2(x) for x in lst]
+    data = b''.join(lst)
+    return data + b'\x00' * (CHUNKSIZE - (len(data) % CHUNKSIZE or CHUNKSIZE))
+
+
+def chunk_tree_levels(data):
+    # Levels above the chunks of the tree over ``data`` (a power of 2 number
+    # of chunks), bottom first; the last level is [root]
+    nodes = [data[i:i + CHUNKSIZE] for i in range(0, len(data), CHUNKSIZE)]
+    levels = []
+    while len(nodes) > 1:
+        nodes = [blake(nodes[i] + nodes[i + 1]) for i in range(0, len(nodes), 2)]
+        levels.append(nodes)
+    return levels
+
+
+def chunk_tree_root(data):
+    levels = chunk_tree_levels(data)
+    return levels[-1][0] if levels else data
+
+
+_ZERO_NODES = [b'\x00' * CHUNKSIZE]
+
+
+def zero_node(depth):
+    # Root of a tree of 2**depth zero chunks
+    while len(_ZERO_NODES) <= depth:
+        _ZERO_NODES.append(blake(_ZERO_NODES[-1] + _ZERO_NODES[-1]))
+    return _ZERO_NODES[depth]
+
+
+def merkle_hash(lst, executor=None):
+    if not lst:
+        return blake(zero_node(0) + length_suffix(0))
+    if executor is not None and len(lst) * len(lst[0]) >= PARALLEL_MIN_CHUNKS * CHUNKSIZE:
+        return merkle_hash_parallel(lst, executor)
+    data = chunk_data(lst)
+    chunk_count = len(data) // CHUNKSIZE
+    data += zero_node(0) * (next_power_of_2(chunk_count) - chunk_count)
+    return blake(chunk_tree_root(data) + length_suffix(len(lst)))
+
+
+def split_chunks(data, parts):
+    # Split ``data`` into ``parts`` contiguous ranges of the same power of 2
+    # number of chunks, as if it were padded with zero chunks to a power of
+    # 2.  Ranges past the end of ``data`` are left out.
+    chunk_count = len(data) // CHUNKSIZE
+    part_size = next_power_of_2(chunk_count) // parts * CHUNKSIZE
+    ranges = [data[i:i + part_size] for i in range(0, len(data), part_size)]
+    ranges[-1] += b'\x00' * (part_size - len(ranges[-1]))
+    return ranges, (part_size // CHUNKSIZE).bit_length() - 1
+
+
+def merkle_hash_parallel(lst, executor, parts=PARALLEL_PARTS):
+    # merkle_hash with the subtrees below the top log2(parts) levels hashed
+    # by ``executor`` (e.g. a concurrent.futures.ProcessPoolExecutor; blake2b
+    # holds the GIL for inputs this small, so threads do not help).  Workers
+    # are given contiguous byte ranges of the chunk data and return their
+    # subtree roots, which are joined here.
+    if not lst:
+        return merkle_hash(lst)
+    data = chunk_data(lst)
+    parts = min(parts, next_power_of_2(len(data) // CHUNKSIZE))
+    ranges, depth = split_chunks(data, parts)
+    nodes = list(executor.map(chunk_tree_root, ranges))
+    nodes += [zero_node(depth)] * (parts - len(nodes))
+    while len(nodes) > 1:
+        nodes = [blake(nodes[i] + nodes[i + 1]) for i in range(0, len(nodes), 2)]
+    return blake(nodes[0] + length_suffix(len(lst)))
+
+
+class MerkleStream():
+    # merkle_hash over items appended one at a time.  Only one pending node
+    # per level of the tree (and one partial chunk) is kept, so memory is
+    # O(log n) however many items are appended.
+
+    def __init__(self):
+        self.count = 0
+        self.pad_items = False
+        self.buffer = bytearray()
+        # pending[d] is a node at level d waiting for its right sibling
+        self.pending = []
+        self.chunk_count = 0
+
+    @staticmethod
+    def _push(pending, node):
+        level = 0
+        while level < len(pending) and pending[level] is not None:
+            node = blake(pending[level] + node)
+            pending[level] = None
+            level += 1
+        pending[level:level + 1] = [node]
+
+    def append(self, item):
+        if self.count == 0:
+            # Like merkle_hash, pad all items if the first one needs it
+            self.pad_items = len(item) != next_power_of_2(len(item))
+        if self.pad_items:
+            item = extend_to_power_of_2(item)
+        self.count += 1
+        self.buffer += item
+        while len(self.buffer) >= CHUNKSIZE:
+            self._push(self.pending, bytes(self.buffer[:CHUNKSIZE]))
+            self.chunk_count += 1
+            del self.buffer[:CHUNKSIZE]
+
+    def root(self):
+        pending = list(self.pending)
+        chunk_count = self.chunk_count
+        if self.buffer or chunk_count == 0:
+            # The last chunk is padded with zeros
+            self._push(pending, bytes(self.buffer) + b'\x00' * (CHUNKSIZE - len(self.buffer)))
+            chunk_count += 1
+        # Complete the tree with zero subtrees up to a power of 2 of chunks
+        depth = next_power_of_2(chunk_count).bit_length() - 1
+        node = None
+        for level in range(depth):
+            left = pending[level] if level < len(pending) else None
+            if left is not None:
+                node = blake(left + (zero_node(level) if node is None else node))
+            elif node is not None:
+                node = blake(node + zero_node(level))
+        if node is None:
+            node = pending[depth]
+        return blake(node + length_suffix(self.count))
+
+
+def merkle_hash_stream(items):
+    # merkle_hash over any iterable, e.g. a generator of element hashes
+    stream = MerkleStream()
+    for item in items:
+        stream.append(item)
+    return stream.root()
+
+
+class MerkleTree():
+    # The chunk tree of merkle_hash, with its internal nodes kept.  After
+    # set(index, item) only the path from the item's chunk to the top is
+    # hashed again, so root() costs O(k log n) for k changed items.  With an
+    # executor, the bottom levels of large trees are built by parallel
+    # workers as in merkle_hash_parallel.
+
+    def __init__(self, items, executor=None):
+        assert len(items) > 0
+        self.item_size = next_power_of_2(len(items[0]))
+        assert self.item_size <= CHUNKSIZE
+        self.items_per_chunk = CHUNKSIZE // self.item_size
+        self.items = [extend_to_power_of_2(x) for x in items]
+        chunk_count = (len(self.items) - 1) // self.items_per_chunk + 1
+        chunks = [self._chunk(i) for i in range(chunk_count)]
+        chunks += [zero_node(0)] * (next_power_of_2(chunk_count) - chunk_count)
+        # levels[0] are the chunks, levels[-1] is [top node]
+        self.levels = [chunks]
+        if executor is not None and chunk_count >= PARALLEL_MIN_CHUNKS:
+            self._build_parallel(executor)
+        while len(self.levels[-1]) > 1:
+            below = self.levels[-1]
+            self.levels.append([
+                blake(below[i] + below[i + 1]) for i in range(0, len(below), 2)
+            ])
+        self.dirty_chunks = set()
+
+    def _build_parallel(self, executor, parts=PARALLEL_PARTS):
+        parts = min(parts, len(self.levels[0]))
+        ranges, depth = split_chunks(b''.join(self.levels[0]), parts)
+        part_levels = list(executor.map(chunk_tree_levels, ranges))
+        for level in range(depth):
+            nodes = []
+            for levels in part_levels:
+                nodes.extend(levels[level])
+            width = len(part_levels[0][level])
+            nodes += [zero_node(level + 1)] * (width * (parts - len(part_levels)))
+            self.levels.append(nodes)
+
+    def _chunk(self, index):
+        start = index * self.items_per_chunk
+        data = b''.join(self.items[start:start + self.items_per_chunk])
+        return data + b'\x00' * (CHUNKSIZE - len(data))
+
+    def __len__(self):
+        return len(self.items)
+
+    def set(self, index, item):
+        item = extend_to_power_of_2(item)
+        assert len(item) == self.item_size
+        if self.items[index] != item:
+            self.items[index] = item
+            self.dirty_chunks.add(index // self.items_per_chunk)
+
+    def branch(self, index):
+        # The chunk holding item ``index`` and the siblings of the nodes on
+        # the path from that chunk to the top node, bottom first
+        self.root()
+        position = index // self.items_per_chunk
+        siblings = []
+        for level in self.levels[:-1]:
+            siblings.append(level[position ^ 1])
+            position //= 2
+        return self.levels[0][index // self.items_per_chunk], siblings
+
+    def root(self):
+        if self.dirty_chunks:
+            chunks = self.levels[0]
+            for index in self.dirty_chunks:
+                chunks[index] = self._chunk(index)
+            dirty = {index // 2 for index in self.dirty_chunks}
+            for below, level in zip(self.levels, self.levels[1:]):
+                for index in dirty:
+                    level[index] = blake(below[index * 2] + below[index * 2 + 1])
+                dirty = {index // 2 for index in dirty}
+            self.dirty_chunks = set()
+        return blake(self.levels[-1][0] + length_suffix(len(self.items)))
+
+
+class ListTree():
+    # Keeps the MerkleTree of the element hashes of a list of containers.
+    # sync(lst) returns tree_hash(lst) and only rehashes the elements that
+    # are new (compared by identity with the list of the last call) or that
+    # had a field assigned since then, which the elements report through
+    # ssz.cache.watch.
+    #
+    # Containers whose cached hash was computed through the tree are kept
+    # in ``holders`` instead of registering as parents of every element, and
+    # are invalidated when any element the tree has seen changes.
+    #
+    # The trees are shared by all threads: callers hold _LIST_TREES_LOCK.
+
+    def __init__(self, typ):
+        self.typ = typ
+        self.objects = []
+        self.tree = None
+        self.changed_indices = set()
+        self.holders = weakref.WeakSet()
+
+    def changed(self, index):
+        # The element may since have been replaced at ``index``, in which
+        # case the current one is rehashed for nothing
+        with _LIST_TREES_LOCK:
+            self.changed_indices.add(index)
+            holders = list(self.holders)
+        for holder in holders:
+            invalidate(holder, fields_assigned=False)
+
+    def sync(self, lst, executor=None):
+        if self.tree is None or len(lst) != len(self.tree):
+            self.objects = list(lst)
+            for index, obj in enumerate(self.objects):
+                watch(obj, self, index)
+            self.tree = MerkleTree([tree_hash(x, self.typ) for x in self.objects], executor)
+            self.changed_indices = set()
+            return self.tree.root()
+
+        replaced = itertools.compress(
+            itertools.count(),
+            map(operator.is_not, self.objects, lst),
+        )
+        for index in replaced:
+            self.objects[index] = lst[index]
+            watch(lst[index], self, index)
+            self.changed_indices.add(index)
+        for index in self.changed_indices:
+            self.tree.set(index, tree_hash(self.objects[index], self.typ))
+        self.changed_indices = set()
+        return self.tree.root()
+
+
+# One ListTree per (container type, field name), shared by all the objects of
+# that type: consecutive states share most of their elements, so syncing the
+# tree with the list of the next state only rehashes what changed.  The
+# lock is reentrant since syncing a tree hashes elements, which may sync
+# other trees.
+_LIST_TREES = {}
+_LIST_TREES_LOCK = threading.RLock()
+
+
+def reset():
+    # Drop the module-level state kept between calls (the ListTrees and the
+    # shared memo's entries), e.g. to time cold hashing.  The per-object
+    # caches are dropped with ssz.cache.clear.
+    with _LIST_TREES_LOCK:
+        _LIST_TREES.clear()
+    if _SHARED_MEMO is not None:
+        _SHARED_MEMO.entries.clear()
+
+
+def _list_tree(typ, name):
+    # Called with _LIST_TREES_LOCK held
+    key = (typ, name)
+    if key not in _LIST_TREES:
+        _LIST_TREES[key] = ListTree(typ.fields[name][0])
+    return _LIST_TREES[key]
+
+
+def _uses_list_tree(val, typ, name):
+    field_typ = typ.fields[name]
+    return (
+        isinstance(field_typ, list) and
+        isinstance(field_typ[0], type) and
+        hasattr(field_typ[0], 'fields') and
+        len(getattr(val, name)) >= LIST_TREE_MIN_LENGTH
+    )
+
+
+def _field_hashes(val, typ, executor=None):
+    # The hashes of the fields of ``val`` in sorted field order, and the
+    # names of the fields hashed through a ListTree
+    tree_fields = {k for k in typ.fields if _uses_list_tree(val, typ, k)}
+    sub = []
+    for k in sorted(typ.fields.keys()):
+        if k in tree_fields:
+            with _LIST_TREES_LOCK:
+                tree = _list_tree(typ, k)
+                sub.append(tree.sync(getattr(val, k), executor))
+                tree.holders.add(val)
+        else:
+            sub.append(tree_hash(getattr(val, k), typ.fields[k], executor))
+    return sub, tree_fields
+
+
+def _hash_container(val, typ, executor=None):
+    sub, tree_fields = _field_hashes(val, typ, executor)
+    return blake(b''.join(sub)), tree_fields
+
+
+#
+# Memoization.  During one top-level tree_hash call (a pass) nothing is
+# modified, so lists are memoized by identity, and lists of scalars and
+# containers of scalars and lists of scalars by content: a committee list or
+# a ShardAndCommittee that appears several times, or several equal ones, is
+# hashed once.  Containers are also memoized by identity through their
+# caches (a crosslink record held several times is hashed once).
+# Content-keyed hashes can also be kept across passes in a bounded shared
+# memo, see set_shared_memo_size.
+#
+# Lists longer than this are not memoized by content
+MEMO_MAX_LIST_LENGTH = 4096
+
+_getattr = object.__getattribute__
+
+# Container type -> ((field name, is a list, holds bytes), ...) in
+# declaration order, or None if values of the type are not memoized by
+# content
+_CONTENT_FIELDS = {}
+
+
+def _is_scalar(typ):
+    return isinstance(typ, str)
+
+
+def _is_bytes(typ):
+    return typ in ('hash32', 'address', 'bytes')
+
+
+def _content_fields(typ):
+    if typ not in _CONTENT_FIELDS:
+        fields = []
+        for name, field_typ in typ.fields.items():
+            if isinstance(field_typ, list) and _is_scalar(field_typ[0]):
+                fields.append((name, True, _is_bytes(field_typ[0])))
+            elif _is_scalar(field_typ):
+                fields.append((name, False, _is_bytes(field_typ)))
+            else:
+                fields = None
+                break
+        if fields is not None and not any(is_list for _, is_list, _ in fields):
+            # Hashed with a single blake call, which is about as cheap as
+            # building the key; repeated objects still hit their caches
+            fields = None
+        _CONTENT_FIELDS[typ] = None if fields is None else tuple(fields)
+    return _CONTENT_FIELDS[typ]
+
+
+def _bytes_key(value):
+    # Byte strings can also be given as (unhashable) bytearrays or
+    # memoryviews, e.g. by a zero-copy decode
+    return value if type(value) is bytes else bytes(value)
+
+
+def _list_key(value, is_bytes):
+    if is_bytes:
+        return tuple(map(_bytes_key, value))
+    return tuple(value)
+
+
+def _content_key(val, typ):
+    # A hashable key equal for values of ``typ`` with equal contents, or
+    # None if ``val`` is not memoized by content
+    if isinstance(typ, list):
+        if _is_scalar(typ[0]) and len(val) <= MEMO_MAX_LIST_LENGTH:
+            return (typ[0], _list_key(val, _is_bytes(typ[0])))
+        return None
+    fields = _content_fields(typ)
+    if fields is None:
+        return None
+    d = _getattr(val, '__dict__')
+    key = [typ]
+    for name, is_list, is_bytes in fields:
+        value = d[name]
+        if is_list:
+            if len(value) > MEMO_MAX_LIST_LENGTH:
+                return None
+            value = _list_key(value, is_bytes)
+        elif is_bytes:
+            value = _bytes_key(value)
+        key.append(value)
+    return tuple(key)
+
+
+class BoundedMemo():
+    # Least recently used content key -> hash mapping of at most ``maxsize``
+    # entries, shared by all threads
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+_SHARED_MEMO = None
+
+
+def set_shared_memo_size(maxsize):
+    # Keep up to ``maxsize`` content-keyed hashes across passes (None or 0
+    # disables the shared memo)
+    global _SHARED_MEMO
+    _SHARED_MEMO = BoundedMemo(maxsize) if maxsize else None
+
+
+class _HashPass():
+
+    def __init__(self, cache=False):
+        # Whether the hashes of containers holding lists are cached too
+        self.cache = cache
+        # id(list) -> (list, id(typ), hash); the list is kept so that its id
+        # is not reused during the pass
+        self.lists = {}
+        self.by_content = {}
+
+    def get(self, key):
+        result = self.by_content.get(key)
+        if result is None and _SHARED_MEMO is not None:
+            result = _SHARED_MEMO.get(key)
+            if result is not None:
+                self.by_content[key] = result
+        return result
+
+    def put(self, key, result):
+        self.by_content[key] = result
+        if _SHARED_MEMO is not None:
+            _SHARED_MEMO.put(key, result)
+
+
+# The pass of the top-level tree_hash call running in each thread
+_local = threading.local()
+
+
+def tree_hash(val, typ=None, executor=None, cache=False):
+    # ``executor`` (optional) builds the trees of large lists in parallel.
+    # With ``cache=True`` the hashes of containers holding lists are cached
+    # as well, and the caller must not change those lists in place (assign
+    # the field again instead).
+    memo = getattr(_local, 'current_pass', None)
+    if memo is not None:
+        return _tree_hash(val, typ, executor, memo)
+    _local.current_pass = memo = _HashPass(cache)
+    try:
+        return _tree_hash(val, typ, executor, memo)
+    finally:
+        _local.current_pass = None
+
+
+def _hash_list(val, typ, executor, memo):
+    memoized = memo.lists.get(id(val))
+    if memoized is not None and memoized[1] == id(typ):
+        return memoized[2]
+    key = _content_key(val, typ)
+    result = memo.get(key) if key is not None else None
+    if result is None:
+        result = merkle_hash([_tree_hash(x, typ[0], executor, memo) for x in val], executor)
+        if key is not None:
+            memo.put(key, result)
+    memo.lists[id(val)] = (val, id(typ), result)
+    return result
+
+
+# Container type -> whether its values hold lists, directly or in fields
+_HOLDS_LISTS = {}
+
+
+def _holds_lists(typ):
+    if typ not in _HOLDS_LISTS:
+        _HOLDS_LISTS[typ] = any(
+            isinstance(field_typ, list) or (
+                isinstance(field_typ, type) and
+                hasattr(field_typ, 'fields') and
+                _holds_lists(field_typ)
+            )
+            for field_typ in typ.fields.values()
+        )
+    return _HOLDS_LISTS[typ]
+
+
+def _hash_object(val, typ, executor, memo):
+    # A cached hash of a container holding lists may be stale if one of
+    # them was changed in place, so it is only used when asked for
+    cacheable = type(val) is typ and (memo.cache or not _holds_lists(typ))
+    cached = get_cached(val, TREE_HASH_KEY) if cacheable else None
+    if cached is not None:
+        return cached
+    tree_fields = set()
+    key = _content_key(val, typ)
+    result = memo.get(key) if key is not None else None
+    if result is None:
+        hasher = HASHERS.get(typ)
+        if hasher is not None:
+            result = hasher(val)
+        else:
+            result, tree_fields = _hash_container(val, typ, executor)
+        if key is not None:
+            memo.put(key, result)
+    if cacheable:
+        get_cache(val)[TREE_HASH_KEY] = result
+        add_parents(val, typ, [k for k in typ.fields if k not in tree_fields])
+    return result
+
+
+def _tree_hash(val, typ, executor, memo):
+    if typ is None and hasattr(val, 'fields'):
+        typ = type(val)
+    if typ in ('hash32', 'address'):
+        assert len(val) == 20 if typ == 'address' else 32
+        return val
+    elif isinstance(typ, str) and typ[:3] == 'int':
+        length = int(typ[3:])
+        assert length % 8 == 0
+        return val.to_bytes(length // 8, 'big', signed=True)
+    elif isinstance(typ, str) and typ[:4] == 'uint':
+        length = int(typ[4:])
+        assert length % 8 == 0
+        assert val >= 0
+        return val.to_bytes(length // 8, 'big')
+    elif typ == 'bytes':
+        return blake(val)
+    elif isinstance(typ, list):
+        assert len(typ) == 1
+        return _hash_list(val, typ, executor, memo)
+    elif isinstance(typ, type):
+        return _hash_object(val, typ, executor, memo)
+    raise Exception("Cannot tree hash", val, typ)
+
+
+#
+# Registry of fixed-layout hashers
+#
+def _field_hash_source(expr, typ, name, namespace):
+    # Source of an expression computing tree_hash(expr, typ)
+    if typ in ('hash32', 'address'):
+        return expr
+    elif isinstance(typ, str) and typ[:3] == 'int':
+        return "%s.to_bytes(%d, 'big', signed=True)" % (expr, int(typ[3:]) // 8)
+    elif isinstance(typ, str) and typ[:4] == 'uint':
+        return "%s.to_bytes(%d, 'big')" % (expr, int(typ[4:]) // 8)
+    elif typ == 'bytes':
+        return "blake(%s)" % expr
+    namespace['t_' + name] = typ
+    return "tree_hash(%s, t_%s)" % (expr, name)
+
+
+def _compile_fixed_layout_hasher(typ):
+    namespace = {
+        'blake': blake,
+        'tree_hash': tree_hash,
+        '_getattr': object.__getattribute__,
+    }
+    parts = [
+        _field_hash_source('d[%r]' % name, field_typ, name, namespace)
+        for name, field_typ in typ.fields.items()
+    ]
+    source = '\n'.join([
+        'def hasher(val):',
+        '    d = _getattr(val, "__dict__")',
+        '    return blake(b"".join([%s]))' % ', '.join(parts),
+    ])
+    exec(source, namespace)
+    return namespace['hasher']
+
+
+def _compile_serialized_hasher(typ):
+    # The field hashes of a fixed-size container are its field encodings,
+    # so they can be taken from a serialization (in sorted field order)
+    # without decoding it
+    offsets = field_offsets(typ)
+    ranges = [
+        (offsets[name], offsets[name] + static_size(field_typ))
+        for name, field_typ in typ.fields.items()
+    ]
+    size = static_size(typ)
+
+    def hasher(data, pos):
+        return blake(b''.join([data[pos + start:pos + end] for start, end in ranges])), pos + size
+    return hasher
+
+
+def _is_fixed_size_scalar(typ):
+    return typ in ('hash32', 'address') or (
+        isinstance(typ, str) and (typ[:3] == 'int' or typ[:4] == 'uint')
+    )
+
+
+def register_hasher(typ, hasher=None):
+    # Hash values of the container type ``typ`` with ``hasher``.  Without a
+    # hasher, a fixed-layout one is compiled: the hash of the field hashes
+    # in declaration order.
+    if hasher is None:
+        hasher = _compile_fixed_layout_hasher(typ)
+        FIXED_LAYOUT_TYPES.add(typ)
+        if all(_is_fixed_size_scalar(field_typ) for field_typ in typ.fields.values()):
+            SERIALIZED_HASHERS[typ] = _compile_serialized_hasher(typ)
+    else:
+        FIXED_LAYOUT_TYPES.discard(typ)
+    HASHERS[typ] = hasher
+    return hasher
+
+
+#
+# Hashing straight from a serialization
+#
+def _read_length(data, pos):
+    assert pos + 4 <= len(data)
+    end = pos + 4 + int.from_bytes(data[pos:pos + 4], 'big')
+    assert end <= len(data)
+    return end
+
+
+def _element_hashes(data, pos, end, typ):
+    while pos < end:
+        value, pos = _hash_serialized(data, pos, typ)
+        yield value
+    assert pos == end
+
+
+def _hash_serialized(data, pos, typ):
+    if isinstance(typ, list):
+        end = _read_length(data, pos)
+        return merkle_hash_stream(_element_hashes(data, pos + 4, end, typ[0])), end
+    elif typ in SERIALIZED_HASHERS:
+        return SERIALIZED_HASHERS[typ](data, pos)
+    elif isinstance(typ, type) and typ not in HASHERS:
+        end = _read_length(data, pos)
+        sub = []
+        pos += 4
+        # Fields are encoded in the same (sorted) order they are hashed in
+        for k in sorted(typ.fields.keys()):
+            value, pos = _hash_serialized(data, pos, typ.fields[k])
+            sub.append(value)
+        assert pos == end
+        return blake(b''.join(sub)), end
+    value, end = get_codec(typ).decode(data, pos)
+    if isinstance(typ, type):
+        # Decoded only for hashing, so not cached
+        return HASHERS[typ](value), end
+    return tree_hash(value, typ), end
+
+
+def tree_hash_serialized(data, typ):
+    # tree_hash of the value of type ``typ`` encoded in ``data`` (e.g. an
+    # mmap of a stored state), decoding one list element at a time: memory
+    # stays bounded by the size of one element, not of the whole value.
+    return _hash_serialized(memoryview(data).cast('B'), 0, typ)[0]
+
+
+#
+# Merkle proofs of single list elements of a container, e.g.
+# ``validators[i]`` or ``crosslink_records[shard]`` of a CrystallizedState
+#
+class ListItemProof():
+    # Proof that a value is element ``index`` of the list field ``name`` of
+    # a container with a given tree hash
+
+    def __init__(self, name, index, length, chunk, branch, field_hashes):
+        self.name = name
+        self.index = index
+        # Length of the list
+        self.length = length
+        # The chunk holding the hash of the element
+        self.chunk = chunk
+        # Siblings of the nodes on the path from the chunk to the top of
+        # the list's tree, bottom first
+        self.branch = branch
+        # Hashes of the fields of the container, in the order they are
+        # hashed in (see proof_field_names); the one of the list field is
+        # the list's root
+        self.field_hashes = field_hashes
+
+
+def proof_field_names(typ):
+    # The field names of the container type ``typ`` in the order their
+    # hashes are joined in its tree hash
+    if typ in FIXED_LAYOUT_TYPES:
+        return list(typ.fields.keys())
+    elif typ in HASHERS:
+        raise Exception("Cannot make proofs of a type with a custom hasher", typ)
+    return sorted(typ.fields.keys())
+
+
+def make_proofs(val, name, indices, typ=None, executor=None):
+    # ListItemProofs of ``getattr(val, name)[index]`` for each index.  The
+    # internal nodes of the list's tree are computed once (or reused from
+    # its ListTree), after which each proof costs O(log n).
+    typ = typ or type(val)
+    assert isinstance(typ.fields[name], list)
+    lst = getattr(val, name)
+    for index in indices:
+        if not 0 <= index < len(lst):
+            raise IndexError("List index out of range", name, index)
+    names = proof_field_names(typ)
+    sub, tree_fields = _field_hashes(val, typ, executor)
+    hashes_by_name = dict(zip(sorted(typ.fields.keys()), sub))
+    field_hashes = [hashes_by_name[k] for k in names]
+    if name in tree_fields:
+        tree = _list_tree(typ, name).tree
+    else:
+        element_typ = typ.fields[name][0]
+        tree = MerkleTree([tree_hash(x, element_typ) for x in lst], executor)
+    proofs = []
+    for index in indices:
+        chunk, branch = tree.branch(index)
+        proofs.append(ListItemProof(name, index, len(lst), chunk, branch, list(field_hashes)))
+    return proofs
+
+
+def make_proof(val, name, index, typ=None):
+    return make_proofs(val, name, [index], typ)[0]
+
+
+def _field_hash_size(typ):
+    # Size of tree_hash of a value of ``typ``
+    if typ == 'address':
+        return 20
+    elif isinstance(typ, str) and typ[:3] == 'int':
+        return int(typ[3:]) // 8
+    elif isinstance(typ, str) and typ[:4] == 'uint':
+        return int(typ[4:]) // 8
+    return 32
+
+
+def verify_proof(root, typ, proof, value):
+    # Whether ``proof`` shows that ``value`` is element ``proof.index`` of
+    # the list field ``proof.name`` of the container of type ``typ`` whose
+    # tree hash is ``root``
+    names = proof_field_names(typ)
+    field_typ = typ.fields.get(proof.name)
+    if not isinstance(field_typ, list) or not 0 <= proof.index < proof.length:
+        return False
+    if len(proof.field_hashes) != len(names) or any(
+        len(field_hash) != _field_hash_size(typ.fields[name])
+        for name, field_hash in zip(names, proof.field_hashes)
+    ):
+        return False
+
+    element_typ = field_typ[0]
+    if isinstance(element_typ, type) and not isinstance(value, element_typ):
+        return False
+    item = extend_to_power_of_2(tree_hash(value, element_typ))
+    if len(item) > CHUNKSIZE or len(proof.chunk) != CHUNKSIZE:
+        return False
+    items_per_chunk = CHUNKSIZE // len(item)
+    offset = proof.index % items_per_chunk * len(item)
+    if proof.chunk[offset:offset + len(item)] != item:
+        return False
+
+    chunk_count = (proof.length - 1) // items_per_chunk + 1
+    if len(proof.branch) != next_power_of_2(chunk_count).bit_length() - 1:
+        return False
+    node = proof.chunk
+    position = proof.index // items_per_chunk
+    for sibling in proof.branch:
+        node = blake(node + sibling) if position % 2 == 0 else blake(sibling + node)
+        position //= 2
+    list_root = blake(node + length_suffix(proof.length))
+
+    return (
+        proof.field_hashes[names.index(proof.name)] == list_root and
+        blake(b''.join(proof.field_hashes)) == root
+    )
@@ -0,0 +1,48 @@
+"""Microbenchmark of BLS signature verification.
+
+Times ``bls.verify`` of signatures of one message by different signers, with
+the Miller loop lines of the message's point computed for each verification
+(``cold``, as before they were cached) and taken from ``bls.LINES_CACHE``
+(``warm``, as for every attester of a committee after the first one), and
+``bls.verify_multiple`` of all of them.
+
+    python bench_bls.py --signers 8
+"""
+import argparse
+import sys
+import time
+
+from beacon_chain.utils import bls
+
+
+def time_calls(fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        assert fn(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--signers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    msg = b'\x42' * 32
+    privkeys = [3 + i for i in range(args.signers)]
+    triples = [(msg, bls.privtopub(k), bls.sign(msg, k)) for k in privkeys]
+
+    def verify_cold(m, pub, sig):
+        bls.LINES_CACHE.clear()
+        return bls.verify(m, pub, sig)
+
+    cold = time_calls(verify_cold, triples)
+    warm = time_calls(bls.verify, triples)
+    batch = time_calls(bls.verify_multiple, [tuple(map(list, zip(*triples)))])
+    print('verify (cold lines)  %8.3f s' % cold)
+    print('verify (warm lines)  %8.3f s  %.2fx' % (warm, cold / warm))
+    print('verify_multiple      %8.3f s  for %d signatures' % (batch, args.signers))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""Throughput benchmarks for SSZ encoding, copying, comparison and hashing.
+
+Times ``ssz.serialize``, ``ssz.deserialize``, ``ssz.deepcopy``, ``ssz.eq``
+and ``tree_hash`` (plus the compiled ``ssz.codec`` encoder/decoder)
+on crystallized states with 2**10 to 2**22 validators and on blocks with 0 to
+1024 attestations, and reports ops/sec, MB/s (of the encoded object) and the
+peak memory allocated during one operation.
+
+Every object in the generated states is distinct and the per-object caches
+are dropped before each run, so the numbers are for cold encodings.
+
+    python bench_ssz.py --output results.json
+    python bench_ssz.py --max-validators-exp 16 --baseline results.json
+
+With ``--baseline``, results are compared with a stored run and the script
+exits with status 1 if any operation got slower by more than ``--threshold``.
+Large states need a lot of memory: 2**22 validators take several GB.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from ssz import codec, ssz
+from ssz.cache import clear
+
+from beacon_chain.state.attestation_record import AttestationRecord
+from beacon_chain.state.block import Block
+from beacon_chain.state.crosslink_record import CrosslinkRecord
+from beacon_chain.state.crystallized_state import CrystallizedState
+from beacon_chain.state.shard_and_committee import ShardAndCommittee
+from beacon_chain.state.validator_record import ValidatorRecord
+from beacon_chain.utils import tree_hash as tree_hash_module
+from beacon_chain.utils.tree_hash import tree_hash
+
+
+OPERATIONS = {
+    'serialize': lambda case: ssz.serialize(case.value),
+    'deserialize': lambda case: ssz.deserialize(case.encoded, case.typ),
+    'deepcopy': lambda case: ssz.deepcopy(case.value),
+    'eq': lambda case: ssz.eq(case.value, case.copy),
+    'tree_hash': lambda case: tree_hash(case.value),
+    'codec.serialize': lambda case: codec.serialize(case.value),
+    'codec.deserialize': lambda case: codec.deserialize(case.encoded, case.typ),
+}
+
+DEFAULT_ATTESTATIONS = [0, 1, 4, 16, 64, 256, 1024]
+
+
+class Case():
+    # A value to benchmark, with its encoding and an equal copy for ``eq``
+
+    def __init__(self, name, size, value):
+        self.name = name
+        self.size = size
+        self.value = value
+        self.typ = type(value)
+        self.encoded = ssz.serialize(value)
+        self.copy = ssz.deepcopy(value)
+
+    def clear_caches(self):
+        clear(self.value)
+        clear(self.copy)
+        tree_hash_module.reset()
+
+
+def make_crystallized_state(valcount):
+    validators = [
+        ValidatorRecord(
+            pubkey=3**160 + i,
+            withdrawal_shard=i % 1024,
+            withdrawal_address=i.to_bytes(20, 'big'),
+            randao_commitment=i.to_bytes(32, 'big'),
+            balance=32 * 10**18 + i,
+            start_dynasty=7,
+            end_dynasty=17284,
+        )
+        for i in range(valcount)
+    ]
+    committee_size = max(valcount // 1024, 1)
+    shard_and_committee_for_slots = [
+        [
+            ShardAndCommittee(
+                shard_id=slot * 16 + j,
+                committee=list(range(committee_size)),
+            )
+            for j in range(16)
+        ]
+        for slot in range(64)
+    ]
+    crosslink_records = [
+        CrosslinkRecord(dynasty=4, slot=12847, hash=shard.to_bytes(32, 'big'))
+        for shard in range(1024)
+    ]
+    return CrystallizedState(
+        validators=validators,
+        last_state_recalc=1,
+        shard_and_committee_for_slots=shard_and_committee_for_slots,
+        last_justified_slot=12744,
+        justified_streak=98,
+        last_finalized_slot=1724,
+        current_dynasty=19824,
+        crosslink_records=crosslink_records,
+        dynasty_seed=b'\x98' * 32,
+        dynasty_start=124,
+    )
+
+
+def make_block(num_attestations):
+    attestations = [
+        AttestationRecord(
+            slot=i,
+            shard_id=i % 1024,
+            oblique_parent_hashes=[i.to_bytes(32, 'big')],
+            shard_block_hash=(i + 1).to_bytes(32, 'big'),
+            attester_bitfield=b'\xff' * 32,
+            justified_slot=i,
+            justified_block_hash=(i + 2).to_bytes(32, 'big'),
+            aggregate_sig=[3**160 + i, 5**100 + i],
+        )
+        for i in range(num_attestations)
+    ]
+    return Block(
+        parent_hash=b'\x11' * 32,
+        slot_number=num_attestations,
+        randao_reveal=b'\x22' * 32,
+        attestations=attestations,
+        pow_chain_ref=b'\x33' * 32,
+        active_state_root=b'\x44' * 32,
+        crystallized_state_root=b'\x55' * 32,
+    )
+
+
+def time_operation(case, operation, repeat):
+    times = []
+    for _ in range(repeat):
+        case.clear_caches()
+        start = time.perf_counter()
+        operation(case)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def peak_memory(case, operation):
+    # Bytes allocated at the peak of one operation
+    case.clear_caches()
+    tracemalloc.start()
+    try:
+        operation(case)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case, operations, repeat, measure_memory):
+    results = []
+    for name in operations:
+        result = {
+            'case': case.name,
+            'size': case.size,
+            'operation': name,
+            'encoded_size': len(case.encoded),
+        }
+        try:
+            times = time_operation(case, OPERATIONS[name], repeat)
+        except Exception as e:
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+        else:
+            best = min(times)
+            result['times'] = times
+            result['ops_per_sec'] = 1 / best if best else float('inf')
+            result['mb_per_sec'] = len(case.encoded) / best / 10**6 if best else float('inf')
+            if measure_memory:
+                result['peak_memory'] = peak_memory(case, OPERATIONS[name])
+        print_result(result)
+        results.append(result)
+    return results
+
+
+def print_result(result):
+    label = '%-18s %8d  %-18s' % (result['case'], result['size'], result['operation'])
+    if 'error' in result:
+        print('%s  skipped (%s)' % (label, result['error']))
+        return
+    line = '%s %12.2f ops/s %10.2f MB/s' % (label, result['ops_per_sec'], result['mb_per_sec'])
+    if 'peak_memory' in result:
+        line += ' %10.2f MB peak' % (result['peak_memory'] / 10**6)
+    print(line)
+    sys.stdout.flush()
+
+
+def result_key(result):
+    return (result['case'], result['size'], result['operation'])
+
+
+def compare(results, baseline, threshold):
+    # Return the results whose throughput dropped by more than ``threshold``
+    # (a fraction) compared to the matching baseline result
+    baseline_by_key = {
+        result_key(result): result
+        for result in baseline['results']
+        if 'ops_per_sec' in result
+    }
+    regressions = []
+    for result in results:
+        old = baseline_by_key.get(result_key(result))
+        if old is None or 'ops_per_sec' not in result:
+            continue
+        change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        if change < -threshold:
+            regressions.append((result, change))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--min-validators-exp', type=int, default=10)
+    parser.add_argument('--max-validators-exp', type=int, default=22)
+    parser.add_argument('--validators-exp-step', type=int, default=2)
+    parser.add_argument(
+        '--attestations', type=int, nargs='*', default=DEFAULT_ATTESTATIONS,
+        help='attestation counts of the benchmarked blocks',
+    )
+    parser.add_argument(
+        '--operations', nargs='*', default=list(OPERATIONS), choices=list(OPERATIONS),
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='runs per operation, best is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip peak memory tracing')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='allowed fraction of throughput lost against the baseline',
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+
+    for num_attestations in args.attestations:
+        case = Case('block', num_attestations, make_block(num_attestations))
+        results.extend(run_case(case, args.operations, args.repeat, not args.no_memory))
+
+    exps = range(args.min_validators_exp, args.max_validators_exp + 1, args.validators_exp_step)
+    for exp in exps:
+        case = Case('crystallized_state', 2**exp, make_crystallized_state(2**exp))
+        results.extend(run_case(case, args.operations, args.repeat, not args.no_memory))
+        del case
+
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for result, change in regressions:
+            print('REGRESSION %s %d %s: %.1f%% ops/s' % (result_key(result) + (change * 100,)))
+        if regressions:
+            return 1
+        print('No regressions against %s' % args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,6 @@
+from .cache import (  # noqa: F401
+    invalidate,
+)
 from .ssz import (  # noqa: F401
     deepcopy,
     deserialize,
@@ -0,0 +1,197 @@
+"""Per-instance caches of derived values (encodings, hashes) of SSZ objects.
+
+Record classes call ``invalidate(self)`` from ``__setattr__`` when one of their
+``fields`` is assigned.  Whoever stores a derived value of an object in its
+cache registers the object as a parent of the objects it contains (directly
+or inside lists) with ``add_parents``, so invalidating a child also
+invalidates every cached parent up to the root.  Registrations are kept
+until a field of the parent is assigned, so caching a value of a parent
+again does not walk all of its children again.
+
+Lists are plain Python lists and are not observed: after changing a list
+field in place, either assign the field again or call ``invalidate`` on the
+object that holds it.  For this reason ``ssz.serialize`` only caches
+encodings when asked to (``cache=True``), and so does ``tree_hash`` with the
+hashes of containers holding lists.
+
+Other structures that keep values derived from an object outside of its cache
+(e.g. the Merkle trees of ``beacon_chain.utils.tree_hash``) can ``watch`` the object: their
+``changed(key)`` method is called whenever the object is invalidated.
+"""
+import weakref
+
+
+_CACHE_ATTR = '_ssz_cache'
+
+_getattr = object.__getattribute__
+
+
+class SSZCache(dict):
+    # Derived values of a single object, keyed by name.  ``owner`` is the id
+    # of the object the cache was created for: a shallow copy of the object
+    # (which shares its ``__dict__`` entries) must not see it.
+    #
+    # The other attributes survive invalidation and are created on first
+    # use, since most objects (e.g. validator records) never need them.
+
+    __slots__ = ('owner', 'parents', 'registered', 'watchers')
+
+    def __init__(self, owner=None):
+        super().__init__()
+        self.owner = owner
+        # Weak references to the objects holding this one (usually one or
+        # two, so a list is lighter than a WeakSet)
+        self.parents = None
+        # Fields whose current children the object is registered with
+        self.registered = None
+        # weakref to watcher -> keys it watches this object under
+        self.watchers = None
+
+    def __copy__(self):
+        return None
+
+    def __deepcopy__(self, memo):
+        return None
+
+    def __reduce__(self):
+        return (SSZCache, ())
+
+
+def _own_cache(obj):
+    cache = _getattr(obj, '__dict__').get(_CACHE_ATTR)
+    if cache is not None and cache.owner == id(obj):
+        return cache
+    return None
+
+
+def get_cache(obj):
+    cache = _own_cache(obj)
+    if cache is None:
+        cache = SSZCache(id(obj))
+        _getattr(obj, '__dict__')[_CACHE_ATTR] = cache
+    return cache
+
+
+def get_cached(obj, key):
+    cache = _own_cache(obj)
+    if cache is None:
+        return None
+    return cache.get(key)
+
+
+def invalidate(obj, fields_assigned=True):
+    # Drop the cached values of ``obj`` and of every object that cached a
+    # value derived from it.  ``fields_assigned=False`` is for changes below
+    # ``obj`` that leave its fields holding the same objects.
+    cache = _own_cache(obj)
+    if cache is None:
+        return
+    if fields_assigned:
+        # The fields of ``obj`` may hold other objects now
+        cache.registered = None
+    _invalidate(cache)
+
+
+def _invalidate(cache):
+    cache.clear()
+    if cache.watchers:
+        _notify(cache.watchers)
+    if not cache.parents:
+        return
+    # A parent whose fields changed since it registered is invalidated too,
+    # which is only a wasted cache entry
+    for ref in list(cache.parents):
+        parent = ref()
+        if parent is None:
+            continue
+        parent_cache = _own_cache(parent)
+        if parent_cache is not None:
+            _invalidate(parent_cache)
+
+
+def _notify(watchers):
+    for ref, keys in list(watchers.items()):
+        watcher = ref()
+        if watcher is None:
+            del watchers[ref]
+            continue
+        for key in keys:
+            watcher.changed(key)
+
+
+def watch(obj, watcher, key):
+    # Call ``watcher.changed(key)`` whenever ``obj`` is invalidated.  Only a
+    # weak reference to ``watcher`` is kept.
+    cache = get_cache(obj)
+    if cache.watchers is None:
+        cache.watchers = {}
+    cache.watchers.setdefault(weakref.ref(watcher), set()).add(key)
+
+
+_OBJECT_FIELDS = {}
+
+
+def _holds_objects(typ):
+    while isinstance(typ, list):
+        typ = typ[0]
+    return isinstance(typ, type)
+
+
+def _object_fields(typ):
+    # Names of the fields of ``typ`` that can hold other objects
+    names = _OBJECT_FIELDS.get(typ)
+    if names is None:
+        names = _OBJECT_FIELDS[typ] = frozenset(
+            name for name, field_typ in typ.fields.items() if _holds_objects(field_typ)
+        )
+    return names
+
+
+def _children(value, typ):
+    if isinstance(typ, list):
+        for element in value:
+            yield from _children(element, typ[0])
+    elif isinstance(typ, type) and hasattr(value, 'fields'):
+        yield value
+
+
+def add_parents(obj, typ=None, names=None):
+    # Register ``obj`` as a parent of every object held by its fields (or by
+    # the fields in ``names``)
+    typ = typ or type(obj)
+    object_fields = _object_fields(typ)
+    if not object_fields:
+        return
+    cache = get_cache(obj)
+    if cache.registered is None:
+        cache.registered = set()
+    for name in (object_fields if names is None else object_fields.intersection(names)):
+        if name in cache.registered:
+            continue
+        field_typ = typ.fields[name]
+        for child in _children(getattr(obj, name), field_typ):
+            _add_parent(get_cache(child), obj)
+        cache.registered.add(name)
+
+
+def _add_parent(cache, obj):
+    if cache.parents is None:
+        cache.parents = [weakref.ref(obj)]
+        return
+    # Drop the references to collected parents while looking for ``obj``
+    live = [ref for ref in cache.parents if ref() is not None]
+    if not any(ref() is obj for ref in live):
+        live.append(weakref.ref(obj))
+    cache.parents = live
+
+
+def clear(obj, typ=None):
+    # Drop the cached values of ``obj`` and of every object held by it, so
+    # the next encoding or hash is computed from scratch (e.g. for timing)
+    typ = typ or type(obj)
+    cache = _own_cache(obj)
+    if cache is not None:
+        cache.clear()
+    for name in _object_fields(typ):
+        for child in _children(getattr(obj, name), typ.fields[name]):
+            clear(child)
@@ -0,0 +1,485 @@
+"""Schema-compiled SSZ codecs.
+
+``ssz.serialize`` and ``ssz.deserialize`` interpret the type description on
+every value they touch.  The codecs in this module resolve a type description
+once, generate a specialised encoder/decoder pair for it and cache the pair, so
+that encoding a list of 2**18 ``ValidatorRecord`` objects only pays for the
+field accesses and the integer conversions.
+
+The encoded bytes are identical to the ones produced by ``ssz.serialize``.
+"""
+
+
+class Codec():
+    # Compiled encoder/decoder pair for a single SSZ type description.
+    #
+    # ``encode(val)`` returns the serialized bytes of ``val``.
+    # ``decode(data, pos)`` reads a value starting at ``pos`` and returns
+    # ``(value, new_pos)``.  ``data`` may be any buffer (bytes, bytearray,
+    # memoryview, mmap); hash and bytes fields are always returned as bytes.
+    # ``decode_view(data, pos)`` is the zero-copy variant: hash and bytes
+    # fields are returned as slices of ``data``, i.e. views into the source
+    # buffer when ``data`` is a memoryview.
+    # ``fixed_size`` is the length of every encoding of this type (including
+    # any length prefix), or None if the length depends on the value.
+    #
+    # The single-pass writers share the same layout:
+    # ``size(val)`` returns the encoded length of ``val`` without encoding it.
+    # ``encode_into(val, buf, pos)`` writes the encoding into the writable
+    # buffer ``buf`` at ``pos`` and returns the end position.
+    # ``collect_sizes(val, sizes)`` returns ``size(val)`` and appends to the
+    # list ``sizes`` the sizes of the variable-size lists and containers in
+    # ``val``, in the order ``write`` needs them.
+    # ``write(val, stream, sizes)`` writes the encoding to a file-like
+    # ``stream``, taking the length prefixes from the iterator ``sizes``
+    # over what ``collect_sizes`` collected, so that every size is computed
+    # once however deep the value is nested.
+
+    def __init__(self, typ, encode, decode, fixed_size=None,
+                 size=None, encode_into=None, write=None, decode_view=None,
+                 collect_sizes=None):
+        self.typ = typ
+        self.encode = encode
+        self.decode = decode
+        self.decode_view = decode_view or decode
+        self.fixed_size = fixed_size
+
+        if fixed_size is not None:
+            size = size or (lambda val: fixed_size)
+            encode_into = encode_into or _fixed_encode_into(encode, fixed_size)
+            write = write or (lambda val, stream, sizes: stream.write(encode(val)))
+        self.size = size
+        self.collect_sizes = collect_sizes or (lambda val, sizes: size(val))
+        self.encode_into = encode_into
+        self.write = write
+
+    def __repr__(self):
+        return '<Codec %r>' % (self.typ,)
+
+
+def _fixed_encode_into(encode, fixed_size):
+    def encode_into(val, buf, pos):
+        end = pos + fixed_size
+        buf[pos:end] = encode(val)
+        return end
+    return encode_into
+
+
+_CODECS = {}
+
+# Number of fixed-size list elements encoded per buffer or stream write
+_BATCH_SIZE = 1024
+
+
+def _type_key(typ):
+    if isinstance(typ, list):
+        assert len(typ) == 1
+        return ('list', _type_key(typ[0]))
+    return typ
+
+
+def get_codec(typ):
+    key = _type_key(typ)
+    codec = _CODECS.get(key)
+    if codec is None:
+        codec = _compile(typ)
+        _CODECS[key] = codec
+    return codec
+
+
+def _int_size(typ, prefix):
+    length = int(typ[len(prefix):])
+    assert length % 8 == 0
+    return length // 8
+
+
+def _compile(typ):
+    if typ in ('hash32', 'address'):
+        return _compile_hash(typ, 20 if typ == 'address' else 32)
+    elif isinstance(typ, str) and typ[:3] == 'int':
+        return _compile_int(typ, _int_size(typ, 'int'), True)
+    elif isinstance(typ, str) and typ[:4] == 'uint':
+        return _compile_int(typ, _int_size(typ, 'uint'), False)
+    elif typ == 'bytes':
+        return _compile_bytes(typ)
+    elif isinstance(typ, list):
+        return _compile_list(typ)
+    elif isinstance(typ, type) and hasattr(typ, 'fields'):
+        return _compile_container(typ)
+    raise Exception("Cannot compile codec", typ)
+
+
+def _compile_hash(typ, size):
+    def encode(val):
+        assert len(val) == size
+        return val
+
+    def decode(data, pos):
+        end = pos + size
+        assert end <= len(data)
+        return bytes(data[pos:end]), end
+
+    def decode_view(data, pos):
+        end = pos + size
+        assert end <= len(data)
+        return data[pos:end], end
+
+    return Codec(typ, encode, decode, size, decode_view=decode_view)
+
+
+def _compile_int(typ, size, signed):
+    def encode(val):
+        assert signed or val >= 0
+        return val.to_bytes(size, 'big', signed=signed)
+
+    def decode(data, pos):
+        end = pos + size
+        assert end <= len(data)
+        return int.from_bytes(data[pos:end], 'big', signed=signed), end
+
+    return Codec(typ, encode, decode, size)
+
+
+def _compile_bytes(typ):
+    def encode(val):
+        return len(val).to_bytes(4, 'big') + val
+
+    def decode(data, pos):
+        start = pos + 4
+        assert start <= len(data)
+        end = start + int.from_bytes(data[pos:start], 'big')
+        assert end <= len(data)
+        return bytes(data[start:end]), end
+
+    def decode_view(data, pos):
+        start = pos + 4
+        assert start <= len(data)
+        end = start + int.from_bytes(data[pos:start], 'big')
+        assert end <= len(data)
+        return data[start:end], end
+
+    def size(val):
+        return 4 + len(val)
+
+    def encode_into(val, buf, pos):
+        start = pos + 4
+        end = start + len(val)
+        buf[pos:start] = len(val).to_bytes(4, 'big')
+        buf[start:end] = val
+        return end
+
+    def write(val, stream, sizes):
+        stream.write(len(val).to_bytes(4, 'big'))
+        stream.write(val)
+
+    return Codec(
+        typ,
+        encode,
+        decode,
+        size=size,
+        encode_into=encode_into,
+        write=write,
+        decode_view=decode_view,
+    )
+
+
+def _compile_list(typ):
+    element = get_codec(typ[0])
+    element_encode = element.encode
+    element_size = element.fixed_size
+
+    if isinstance(typ[0], str) and typ[0][:4] == 'uint':
+        # The common case of a list of indices: skip the per-element call.
+        def encode_body(val):
+            return b''.join([x.to_bytes(element_size, 'big') for x in val])
+    else:
+        def encode_body(val):
+            return b''.join([element_encode(x) for x in val])
+
+    def encode(val):
+        sub = encode_body(val)
+        return len(sub).to_bytes(4, 'big') + sub
+
+    def make_decode(element_decode):
+        def decode(data, pos):
+            start = pos + 4
+            assert start <= len(data)
+            end = start + int.from_bytes(data[pos:start], 'big')
+            assert end <= len(data)
+            o = []
+            append = o.append
+            pos = start
+            while pos < end:
+                result, pos = element_decode(data, pos)
+                append(result)
+            assert pos == end
+            return o, end
+        return decode
+
+    decode = make_decode(element.decode)
+    decode_view = make_decode(element.decode_view)
+
+    if element_size is not None:
+        def size(val):
+            return 4 + len(val) * element_size
+    else:
+        element_sizer = element.size
+
+        def size(val):
+            return 4 + sum([element_sizer(x) for x in val])
+
+    element_encode_into = element.encode_into
+    element_write = element.write
+
+    if element_size is not None:
+        # Fixed-size elements are encoded in bounded batches, so each batch
+        # costs one buffer write instead of one write per element.
+        def encode_into(val, buf, pos):
+            start = pos + 4
+            end = start + len(val) * element_size
+            buf[pos:start] = (end - start).to_bytes(4, 'big')
+            for i in range(0, len(val), _BATCH_SIZE):
+                chunk = encode_body(val[i:i + _BATCH_SIZE])
+                buf[start:start + len(chunk)] = chunk
+                start += len(chunk)
+            assert start == end
+            return end
+
+        def write(val, stream, sizes):
+            stream.write((size(val) - 4).to_bytes(4, 'big'))
+            for i in range(0, len(val), _BATCH_SIZE):
+                stream.write(encode_body(val[i:i + _BATCH_SIZE]))
+
+        collect_sizes = None
+    else:
+        def encode_into(val, buf, pos):
+            # The length prefix is filled in once the body has been written
+            start = pos + 4
+            end = start
+            for x in val:
+                end = element_encode_into(x, buf, end)
+            buf[pos:start] = (end - start).to_bytes(4, 'big')
+            return end
+
+        element_collect_sizes = element.collect_sizes
+
+        def collect_sizes(val, sizes):
+            index = len(sizes)
+            sizes.append(None)
+            total = 4 + sum([element_collect_sizes(x, sizes) for x in val])
+            sizes[index] = total
+            return total
+
+        def write(val, stream, sizes):
+            stream.write((next(sizes) - 4).to_bytes(4, 'big'))
+            for x in val:
+                element_write(x, stream, sizes)
+
+    return Codec(
+        typ,
+        encode,
+        decode,
+        size=size,
+        encode_into=encode_into,
+        write=write,
+        decode_view=decode_view,
+        collect_sizes=collect_sizes,
+    )
+
+
+def _compile_container(typ):
+    # Generate straight-line encode/decode functions for the container.  Every
+    # field in ``typ.fields`` becomes one expression in the encoder and one
+    # statement in the decoder, in sorted field order.
+    names = sorted(typ.fields.keys())
+    codecs = [get_codec(typ.fields[name]) for name in names]
+    # Records override __getattribute__ in Python; read the instance dict
+    # through the C implementation once instead of once per field.
+    namespace = {'_cls': typ, '_getattr': object.__getattribute__, '_bytes': bytes}
+
+    fixed_size = 0
+    for codec in codecs:
+        if codec.fixed_size is None:
+            fixed_size = None
+            break
+        fixed_size += codec.fixed_size
+
+    encode_parts = []
+    decode_lines = []
+    decode_view_lines = []
+    for i, (name, codec) in enumerate(zip(names, codecs)):
+        field_typ = typ.fields[name]
+        namespace['_e%d' % i] = codec.encode
+        namespace['_d%d' % i] = codec.decode
+        namespace['_v%d' % i] = codec.decode_view
+        if isinstance(field_typ, str) and field_typ[:4] == 'uint':
+            encode_parts.append(
+                'd[%r].to_bytes(%d, "big")' % (name, codec.fixed_size)
+            )
+        else:
+            encode_parts.append('_e%d(d[%r])' % (i, name))
+
+        if isinstance(field_typ, str) and field_typ[:4] == 'uint':
+            line = 'f%d = int.from_bytes(data[pos:pos + %d], "big")' % (i, codec.fixed_size)
+            decode_lines += [line, 'pos += %d' % codec.fixed_size]
+            decode_view_lines += [line, 'pos += %d' % codec.fixed_size]
+        elif field_typ in ('hash32', 'address'):
+            decode_lines += [
+                'f%d = _bytes(data[pos:pos + %d])' % (i, codec.fixed_size),
+                'pos += %d' % codec.fixed_size,
+            ]
+            decode_view_lines += [
+                'f%d = data[pos:pos + %d]' % (i, codec.fixed_size),
+                'pos += %d' % codec.fixed_size,
+            ]
+        else:
+            decode_lines.append('f%d, pos = _d%d(data, pos)' % (i, i))
+            decode_view_lines.append('f%d, pos = _v%d(data, pos)' % (i, i))
+
+    encode_src = [
+        'def encode(val):',
+        '    d = _getattr(val, "__dict__")',
+        '    sub = b"".join((%s,))' % ', '.join(encode_parts) if names else
+        '    sub = b""',
+    ]
+    if fixed_size is not None:
+        namespace['_prefix'] = fixed_size.to_bytes(4, 'big')
+        encode_src.append('    assert len(sub) == %d' % fixed_size)
+        encode_src.append('    return _prefix + sub')
+    else:
+        encode_src.append('    return len(sub).to_bytes(4, "big") + sub')
+
+    exec('\n'.join(encode_src), namespace)
+    exec(_container_decoder_source('decode', names, decode_lines), namespace)
+    exec(_container_decoder_source('decode_view', names, decode_view_lines), namespace)
+
+    if fixed_size is not None:
+        return Codec(
+            typ,
+            namespace['encode'],
+            namespace['decode'],
+            fixed_size + 4,
+            decode_view=namespace['decode_view'],
+        )
+
+    _getattr = object.__getattribute__
+    sizers = [(name, codec.size) for name, codec in zip(names, codecs)]
+    writers_into = [(name, codec.encode_into) for name, codec in zip(names, codecs)]
+    collectors = [(name, codec.collect_sizes) for name, codec in zip(names, codecs)]
+    writers = [(name, codec.write) for name, codec in zip(names, codecs)]
+
+    def size(val):
+        d = _getattr(val, '__dict__')
+        return 4 + sum([sizer(d[name]) for name, sizer in sizers])
+
+    def encode_into(val, buf, pos):
+        d = _getattr(val, '__dict__')
+        start = pos + 4
+        end = start
+        for name, field_encode_into in writers_into:
+            end = field_encode_into(d[name], buf, end)
+        buf[pos:start] = (end - start).to_bytes(4, 'big')
+        return end
+
+    def collect_sizes(val, sizes):
+        d = _getattr(val, '__dict__')
+        index = len(sizes)
+        sizes.append(None)
+        total = 4 + sum([collect(d[name], sizes) for name, collect in collectors])
+        sizes[index] = total
+        return total
+
+    def write(val, stream, sizes):
+        d = _getattr(val, '__dict__')
+        stream.write((next(sizes) - 4).to_bytes(4, 'big'))
+        for name, field_write in writers:
+            field_write(d[name], stream, sizes)
+
+    return Codec(
+        typ,
+        namespace['encode'],
+        namespace['decode'],
+        size=size,
+        encode_into=encode_into,
+        write=write,
+        decode_view=namespace['decode_view'],
+        collect_sizes=collect_sizes,
+    )
+
+
+def _container_decoder_source(function_name, names, lines):
+    source = [
+        'def %s(data, pos):' % function_name,
+        '    assert pos + 4 <= len(data)',
+        '    end = pos + 4 + int.from_bytes(data[pos:pos + 4], "big")',
+        '    assert end <= len(data)',
+        '    pos += 4',
+    ]
+    source.extend('    ' + line for line in lines)
+    source.extend([
+        '    assert pos == end',
+        '    return _cls(%s), end' % ', '.join(
+            '%s=f%d' % (name, i) for i, name in enumerate(names)
+        ),
+    ])
+    return '\n'.join(source)
+
+
+def serialize(val, typ=None):
+    if typ is None and hasattr(val, 'fields'):
+        typ = type(val)
+    return get_codec(typ).encode(val)
+
+
+def deserialize(data, typ, zero_copy=False):
+    # Decode ``data`` (any object supporting the buffer protocol).  With
+    # ``zero_copy`` the hash and bytes fields of the result are memoryviews
+    # into ``data`` instead of copies; ``data`` must then stay alive and
+    # unchanged (e.g. an mmap must not be closed) while the result is in use.
+    codec = get_codec(typ)
+    if zero_copy:
+        return codec.decode_view(memoryview(data).cast('B'), 0)[0]
+    if not isinstance(data, bytes):
+        data = memoryview(data).cast('B')
+    return codec.decode(data, 0)[0]
+
+
+def serialized_size(val, typ=None):
+    if typ is None and hasattr(val, 'fields'):
+        typ = type(val)
+    return get_codec(typ).size(val)
+
+
+def serialize_into(val, buf, offset=0, typ=None):
+    # Write the encoding of ``val`` into the writable buffer ``buf``
+    # (a bytearray or a memoryview of one) starting at ``offset``, and return
+    # the end offset.  Each byte of the payload is written exactly once.
+    if typ is None and hasattr(val, 'fields'):
+        typ = type(val)
+    codec = get_codec(typ)
+    assert offset + codec.size(val) <= len(buf)
+    return codec.encode_into(val, buf, offset)
+
+
+def serialize_to_buffer(val, typ=None):
+    # Allocate a single bytearray of the exact encoded size and fill it
+    if typ is None and hasattr(val, 'fields'):
+        typ = type(val)
+    codec = get_codec(typ)
+    buf = bytearray(codec.size(val))
+    codec.encode_into(val, buf, 0)
+    return buf
+
+
+def serialize_to_stream(val, stream, typ=None):
+    # Stream the encoding of ``val`` to a file-like object and return the
+    # number of bytes written.  Length prefixes are computed up front in a
+    # single pass, so besides them nothing larger than a single fixed-size
+    # record is held in memory.
+    if typ is None and hasattr(val, 'fields'):
+        typ = type(val)
+    codec = get_codec(typ)
+    sizes = []
+    total = codec.collect_sizes(val, sizes)
+    codec.write(val, stream, iter(sizes))
+    return total
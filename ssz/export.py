@@ -0,0 +1,248 @@
+"""Streaming JSON export of SSZ objects.
+
+``ssz.to_dict`` builds the whole nested dict of an object before anything can
+be written, and leaves ``bytes`` values for the caller to encode.  The
+exporter in this module walks the type description instead and writes the
+JSON text in chunks to a file-like stream, so dumping a ``CrystallizedState``
+with millions of validators needs memory for one chunk, not for a second copy
+of the state.  The structure is the one of ``to_dict``: containers become
+objects with their fields in declaration order, lists become arrays.  Integers
+are written as JSON numbers and ``hash32``, ``address`` and ``bytes`` values
+as ``0x``-prefixed hex strings.
+
+Selected values can be exported on their own with field paths such as
+``validators[3].balance``; ``[*]`` selects every element of a list, e.g.
+``crosslink_records[*].hash``.  Lazily decoded views (``ssz.lazy``) can be
+exported as well, which only decodes the selected values.
+"""
+import io
+import itertools
+import json
+import re
+
+from .lazy import (
+    LazyContainer,
+    LazyList,
+)
+
+
+# Number of characters collected before they are written to the stream
+_CHUNK_SIZE = 1 << 16
+
+# Number of list elements formatted at a time
+_BATCH_SIZE = 1024
+
+_FORMATTERS = {}
+
+_PATH_STEP = re.compile(r'\.?([A-Za-z_][A-Za-z0-9_]*)|\[(\d+|\*)\]')
+
+WILDCARD = '*'
+
+
+def _is_container(typ):
+    return isinstance(typ, type) and hasattr(typ, 'fields')
+
+
+def _has_lists(typ):
+    if isinstance(typ, list):
+        return True
+    elif _is_container(typ):
+        return any(_has_lists(field_typ) for field_typ in typ.fields.values())
+    return False
+
+
+def _format_hex(val):
+    return '"0x' + val.hex() + '"'
+
+
+def _format_int(val):
+    return str(int(val))
+
+
+def _formatter(typ):
+    # Function returning the complete JSON text of a value of ``typ``; only
+    # used for types without lists, whose values have a bounded size.
+    formatter = _FORMATTERS.get(typ)
+    if formatter is not None:
+        return formatter
+    if typ in ('hash32', 'address', 'bytes'):
+        formatter = _format_hex
+    elif isinstance(typ, str) and (typ[:3] == 'int' or typ[:4] == 'uint'):
+        formatter = _format_int
+    elif _is_container(typ) and not _has_lists(typ):
+        fields = [
+            (name, json.dumps(name) + ':', _formatter(field_typ))
+            for name, field_typ in typ.fields.items()
+        ]
+
+        def formatter(val):
+            return '{' + ','.join([
+                key + format_field(getattr(val, name))
+                for name, key, format_field in fields
+            ]) + '}'
+    else:
+        raise Exception("Cannot export type", typ)
+    _FORMATTERS[typ] = formatter
+    return formatter
+
+
+class _Writer():
+    # Collects JSON text and writes it to ``stream`` in chunks.  Text streams
+    # get ``str``, binary streams (files opened with 'wb', sockets wrapped
+    # with ``makefile('wb')``) get ASCII bytes.
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.binary = not isinstance(stream, io.TextIOBase)
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= _CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        if text:
+            self.stream.write(text.encode('ascii') if self.binary else text)
+
+
+def _write_value(writer, val, typ):
+    if not _has_lists(typ):
+        writer.write(_formatter(typ)(val))
+    elif isinstance(typ, list):
+        writer.write('[')
+        element_typ = typ[0]
+        if _has_lists(element_typ):
+            first = True
+            for element in val:
+                if not first:
+                    writer.write(',')
+                first = False
+                _write_value(writer, element, element_typ)
+        else:
+            # Format the elements in batches
+            format_element = _formatter(element_typ)
+            elements = iter(val)
+            separator = ''
+            while True:
+                batch = ','.join(map(format_element, itertools.islice(elements, _BATCH_SIZE)))
+                if not batch:
+                    break
+                writer.write(separator + batch)
+                separator = ','
+        writer.write(']')
+    else:
+        writer.write('{')
+        first = True
+        for name, field_typ in typ.fields.items():
+            if not first:
+                writer.write(',')
+            first = False
+            writer.write(json.dumps(name) + ':')
+            _write_value(writer, getattr(val, name), field_typ)
+        writer.write('}')
+
+
+def parse_path(path):
+    # Split e.g. 'validators[3].balance' into ('validators', 3, 'balance')
+    steps = []
+    pos = 0
+    while pos < len(path):
+        match = _PATH_STEP.match(path, pos)
+        if match is None:
+            raise ValueError("Invalid field path", path)
+        name, index = match.groups()
+        # Field names are separated by dots, except for the first one
+        if name is not None and (match.group(0)[0] == '.') == (pos == 0):
+            raise ValueError("Invalid field path", path)
+        if name is not None:
+            steps.append(name)
+        elif index == WILDCARD:
+            steps.append(WILDCARD)
+        else:
+            steps.append(int(index))
+        pos = match.end()
+    return tuple(steps)
+
+
+def _check_path(typ, steps):
+    # Raise KeyError for the first step of ``steps`` that does not select a
+    # value of ``typ`` (a field name of a container, an index or WILDCARD
+    # of a list)
+    for step in steps:
+        if isinstance(typ, list):
+            if step != WILDCARD and not isinstance(step, int):
+                raise KeyError(step)
+            typ = typ[0]
+        elif _is_container(typ) and isinstance(step, str) and step in typ.fields:
+            typ = typ.fields[step]
+        else:
+            raise KeyError(step)
+
+
+def _write_path(writer, val, typ, steps):
+    if not steps:
+        _write_value(writer, val, typ)
+        return
+    step, rest = steps[0], steps[1:]
+    if isinstance(typ, list):
+        if step == WILDCARD:
+            writer.write('[')
+            for i, element in enumerate(val):
+                if i:
+                    writer.write(',')
+                _write_path(writer, element, typ[0], rest)
+            writer.write(']')
+        elif isinstance(step, int):
+            _write_path(writer, val[step], typ[0], rest)
+        else:
+            raise KeyError(step)
+    elif _is_container(typ) and isinstance(step, str) and step in typ.fields:
+        _write_path(writer, getattr(val, step), typ.fields[step], rest)
+    else:
+        raise KeyError(step)
+
+
+def _value_type(val):
+    if isinstance(val, (LazyContainer, LazyList)):
+        return val.typ
+    elif hasattr(val, 'fields'):
+        return type(val)
+    raise Exception("Cannot infer type of value, pass typ", val)
+
+
+def export_json(val, stream, typ=None, paths=None):
+    # Write ``val`` as JSON to ``stream``.  With ``paths`` only the selected
+    # values are written, as an object keyed by path:
+    # export_json(state, f, paths=['last_state_recalc', 'validators[0].balance'])
+    # writes {"last_state_recalc":64,"validators[0].balance":32000000000000000000}
+    if typ is None:
+        typ = _value_type(val)
+    writer = _Writer(stream)
+    if paths is None:
+        _write_value(writer, val, typ)
+    else:
+        # Check every path against the type before writing anything (an
+        # index past the end of a list is only found while writing)
+        selected = [(path, parse_path(path)) for path in paths]
+        for path, steps in selected:
+            _check_path(typ, steps)
+        writer.write('{')
+        for i, (path, steps) in enumerate(selected):
+            if i:
+                writer.write(',')
+            writer.write(json.dumps(path) + ':')
+            _write_path(writer, val, typ, steps)
+        writer.write('}')
+    writer.flush()
+
+
+def to_json(val, typ=None, paths=None):
+    stream = io.StringIO()
+    export_json(val, stream, typ, paths)
+    return stream.getvalue()
@@ -0,0 +1,130 @@
+"""Static layout of fixed-size SSZ types and in-place access to encodings.
+
+``ValidatorRecord``, ``CrosslinkRecord`` and integer committee entries all have
+a fixed encoded size, so the position of the i-th element of a serialized
+list, or of one field inside such a record, can be computed instead of found
+by decoding everything before it.  This module exposes that layout and uses it
+to read or overwrite single values inside an existing serialized buffer, e.g.
+``patch(buf, CrystallizedState, ('validators', i, 'balance'), new_balance)``.
+"""
+from .codec import (
+    get_codec,
+)
+
+
+_FIELD_OFFSETS = {}
+
+
+def static_size(typ):
+    # Encoded size of every value of ``typ`` (including any length prefix),
+    # or None for variable-size types.
+    return get_codec(typ).fixed_size
+
+
+def field_offsets(typ):
+    # Map each field of the container ``typ`` to the offset of its encoding
+    # relative to the start of the container's encoding (i.e. counting the
+    # 4-byte length prefix).  Only fields that come before the first
+    # variable-size field, in serialization order, have a static offset; the
+    # others map to None.
+    offsets = _FIELD_OFFSETS.get(typ)
+    if offsets is None:
+        offsets = {}
+        pos = 4
+        for name in sorted(typ.fields.keys()):
+            offsets[name] = pos
+            size = static_size(typ.fields[name])
+            if pos is not None and size is not None:
+                pos += size
+            else:
+                pos = None
+        _FIELD_OFFSETS[typ] = offsets
+    return offsets
+
+
+def _read_length(data, pos):
+    assert pos + 4 <= len(data)
+    end = pos + 4 + int.from_bytes(data[pos:pos + 4], 'big')
+    assert end <= len(data)
+    return end
+
+
+def _field_offset(data, typ, name, offset):
+    if name not in typ.fields:
+        raise KeyError(name)
+    static_offset = field_offsets(typ)[name]
+    if static_offset is not None:
+        return offset + static_offset
+    # Skip over the fields in front, using length prefixes where needed
+    pos = offset + 4
+    for field in sorted(typ.fields.keys()):
+        if field == name:
+            return pos
+        size = static_size(typ.fields[field])
+        pos = _read_length(data, pos) if size is None else pos + size
+
+
+def _element_offset(data, typ, index, offset):
+    assert isinstance(typ, list) and len(typ) == 1
+    start = offset + 4
+    end = _read_length(data, offset)
+    size = static_size(typ[0])
+    if size is not None:
+        count = (end - start) // size
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('list index out of range')
+        return start + index * size
+    # Variable-size elements: walk the length prefixes
+    if index < 0:
+        raise IndexError('negative indices need fixed-size elements')
+    pos = start
+    for _ in range(index):
+        if pos >= end:
+            break
+        pos = _read_length(data, pos)
+    if pos >= end:
+        raise IndexError('list index out of range')
+    return pos
+
+
+def locate(data, typ, path, offset=0):
+    # Follow ``path`` (a sequence of field names and list indices) from the
+    # value of type ``typ`` encoded at ``offset`` and return
+    # ``(offset, typ)`` of the addressed value.  Steps through fixed-size
+    # parts of the layout are O(1).
+    data = memoryview(data).cast('B')
+    for step in path:
+        if isinstance(typ, list):
+            offset = _element_offset(data, typ, step, offset)
+            typ = typ[0]
+        else:
+            offset = _field_offset(data, typ, step, offset)
+            typ = typ.fields[step]
+    return offset, typ
+
+
+def read(data, typ, path, offset=0):
+    # Decode only the value addressed by ``path``
+    offset, typ = locate(data, typ, path, offset)
+    return get_codec(typ).decode(memoryview(data).cast('B'), offset)[0]
+
+
+def read_element(data, typ, index, offset=0):
+    # Decode the index-th element of the serialized list of type ``typ``
+    return read(data, typ, (index,), offset)
+
+
+def patch(buf, typ, path, value, offset=0):
+    # Overwrite the value addressed by ``path`` inside the writable buffer
+    # ``buf`` without re-encoding anything else.  The addressed value must be
+    # of a fixed-size type so that the rest of the layout is unchanged.
+    offset, typ = locate(buf, typ, path, offset)
+    size = static_size(typ)
+    if size is None:
+        raise TypeError("Cannot patch variable-size value in place", typ)
+    encoded = get_codec(typ).encode(value)
+    assert len(encoded) == size
+    buf[offset:offset + size] = encoded
+    return offset
@@ -0,0 +1,192 @@
+"""Lazily decoded views over serialized SSZ containers.
+
+``ssz.deserialize`` builds every nested object up front.  A ``LazyContainer``
+only reads the offsets of the container's fields when it is created; field
+values are decoded on first access and list elements are decoded one by one
+as they are indexed, so reading a few scalars or validators out of a stored
+``CrystallizedState`` does not pay for the whole registry.
+"""
+from .codec import (
+    get_codec,
+)
+
+
+def _element_type(typ):
+    assert isinstance(typ, list) and len(typ) == 1
+    return typ[0]
+
+
+def _is_container(typ):
+    return isinstance(typ, type) and hasattr(typ, 'fields')
+
+
+def _read_length(data, pos):
+    assert pos + 4 <= len(data)
+    end = pos + 4 + int.from_bytes(data[pos:pos + 4], 'big')
+    assert end <= len(data)
+    return end
+
+
+def _lazy_value(data, pos, typ, zero_copy):
+    # Wrap lists and containers in lazy views; decode everything else
+    if isinstance(typ, list):
+        return LazyList(data, typ, pos, zero_copy)
+    elif _is_container(typ):
+        return LazyContainer(data, typ, pos, zero_copy)
+    codec = get_codec(typ)
+    decode = codec.decode_view if zero_copy else codec.decode
+    return decode(data, pos)[0]
+
+
+class LazyContainer():
+    # Read-only view of a serialized container of type ``typ`` starting at
+    # ``offset`` in ``data``.  Fields are available as attributes, like on the
+    # decoded object.  ``materialize()`` returns the fully decoded object.
+
+    def __init__(self, data, typ, offset=0, zero_copy=False):
+        assert _is_container(typ)
+        self._data = memoryview(data).cast('B')
+        self._typ = typ
+        self._zero_copy = zero_copy
+        self._start = offset
+        self._end = _read_length(self._data, offset)
+        self._values = {}
+
+        # Fixed-size fields are skipped over, variable-size fields by their
+        # length prefix; nothing is decoded here.
+        self._offsets = {}
+        pos = offset + 4
+        for name in sorted(typ.fields.keys()):
+            fixed_size = get_codec(typ.fields[name]).fixed_size
+            self._offsets[name] = pos
+            if fixed_size is None:
+                pos = _read_length(self._data, pos)
+            else:
+                pos += fixed_size
+        assert pos == self._end
+
+    @property
+    def typ(self):
+        return self._typ
+
+    @property
+    def encoded_size(self):
+        return self._end - self._start
+
+    def field_offset(self, name):
+        # Absolute offset of the field's encoding in the underlying buffer
+        return self._offsets[name]
+
+    def __getattr__(self, name):
+        # Only called for attributes not found the normal way
+        typ = self.__dict__['_typ']
+        if name not in typ.fields:
+            raise AttributeError(name)
+        values = self._values
+        if name not in values:
+            values[name] = _lazy_value(
+                self._data,
+                self._offsets[name],
+                typ.fields[name],
+                self._zero_copy,
+            )
+        return values[name]
+
+    def serialize(self):
+        return bytes(self._data[self._start:self._end])
+
+    def materialize(self):
+        codec = get_codec(self._typ)
+        decode = codec.decode_view if self._zero_copy else codec.decode
+        return decode(self._data, self._start)[0]
+
+    def __repr__(self):
+        return '<LazyContainer %s>' % self._typ.__name__
+
+
+class LazyList():
+    # Read-only view of a serialized list.  Elements are decoded when they are
+    # first indexed and kept: nested lists are returned as lazy views,
+    # containers and scalars as decoded objects.  Fixed-size elements are
+    # located by arithmetic; variable-size elements by a scan of their length
+    # prefixes when the list view is created.
+
+    def __init__(self, data, typ, offset=0, zero_copy=False):
+        self._data = memoryview(data).cast('B')
+        self._typ = typ
+        self._element_typ = _element_type(typ)
+        self._zero_copy = zero_copy
+        self._start = offset + 4
+        self._end = _read_length(self._data, offset)
+
+        self._element_size = get_codec(self._element_typ).fixed_size
+        if self._element_size is None:
+            self._element_offsets = []
+            pos = self._start
+            while pos < self._end:
+                self._element_offsets.append(pos)
+                pos = _read_length(self._data, pos)
+            assert pos == self._end
+            self._length = len(self._element_offsets)
+        else:
+            assert (self._end - self._start) % self._element_size == 0
+            self._length = (self._end - self._start) // self._element_size
+        self._elements = {}
+
+    @property
+    def typ(self):
+        return self._typ
+
+    def element_offset(self, index):
+        # Absolute offset of the index-th element in the underlying buffer
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('list index out of range')
+        if self._element_size is None:
+            return self._element_offsets[index]
+        return self._start + index * self._element_size
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('list index out of range')
+        elements = self._elements
+        if index not in elements:
+            offset = self.element_offset(index)
+            if isinstance(self._element_typ, list):
+                elements[index] = LazyList(
+                    self._data,
+                    self._element_typ,
+                    offset,
+                    self._zero_copy,
+                )
+            else:
+                codec = get_codec(self._element_typ)
+                decode = codec.decode_view if self._zero_copy else codec.decode
+                elements[index] = decode(self._data, offset)[0]
+        return elements[index]
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self[i]
+
+    def materialize(self):
+        codec = get_codec(self._typ)
+        decode = codec.decode_view if self._zero_copy else codec.decode
+        return decode(self._data, self._start - 4)[0]
+
+    def __repr__(self):
+        return '<LazyList %r of %d>' % (self._typ, self._length)
+
+
+def deserialize_lazy(data, typ, zero_copy=False):
+    if isinstance(typ, list):
+        return LazyList(data, typ, 0, zero_copy)
+    return LazyContainer(data, typ, 0, zero_copy)
@@ -1,7 +1,19 @@
-import collections
+import collections.abc
 
+from .cache import (
+    add_parents,
+    get_cache,
+    get_cached,
+)
 
-def serialize(val, typ=None):
+
+SERIALIZE_KEY = 'serialize'
+
+
+def serialize(val, typ=None, cache=False):
+    # With ``cache``, the encodings of containers are kept in their caches
+    # (see ssz.cache), which is only safe if lists held by them are not
+    # changed in place without invalidating their owner
     if typ is None and hasattr(val, 'fields'):
         typ = type(val)
     if typ in ('hash32', 'address'):
@@ -20,13 +32,21 @@ def serialize(val, typ=None):
         return len(val).to_bytes(4, 'big') + val
     elif isinstance(typ, list):
         assert len(typ) == 1
-        sub = b''.join([serialize(x, typ[0]) for x in val])
+        sub = b''.join([serialize(x, typ[0], cache) for x in val])
         return len(sub).to_bytes(4, 'big') + sub
     elif isinstance(typ, type):
+        cache_val = cache and type(val) is typ
+        cached = get_cached(val, SERIALIZE_KEY) if cache_val else None
+        if cached is not None:
+            return cached
         sub = b''.join(
-            [serialize(getattr(val, k), typ.fields[k]) for k in sorted(typ.fields.keys())]
+            [serialize(getattr(val, k), typ.fields[k], cache) for k in sorted(typ.fields.keys())]
         )
-        return len(sub).to_bytes(4, 'big') + sub
+        result = len(sub).to_bytes(4, 'big') + sub
+        if cache_val:
+            get_cache(val)[SERIALIZE_KEY] = result
+            add_parents(val, typ)
+        return result
     raise Exception("Cannot serialize", val, typ)
 
 
@@ -82,7 +102,7 @@ def eq(x, y):
                 print('Unequal:', x, y, f, getattr(x, f), getattr(y, f))
                 return False
         return True
-    elif isinstance(x, collections.Iterable) and isinstance(y, collections.Iterable):
+    elif isinstance(x, collections.abc.Iterable) and isinstance(y, collections.abc.Iterable):
         return all(eq(xi, yi) for xi, yi in zip(x, y))
     else:
         return x == y
@@ -0,0 +1,48 @@
+import pytest
+
+from beacon_chain.state.crosslink_record import (
+    CrosslinkRecord,
+)
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.shard_and_committee import (
+    ShardAndCommittee,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+
+
+@pytest.fixture
+def make_validator():
+    def make_validator(i):
+        return ValidatorRecord(
+            pubkey=i,
+            withdrawal_shard=i,
+            withdrawal_address=b'\x35' * 20,
+            randao_commitment=b'\x57' * 32,
+            balance=32 * 10**18 + i,
+            start_dynasty=1,
+            end_dynasty=10,
+        )
+    return make_validator
+
+
+@pytest.fixture
+def crystallized_state(make_validator):
+    return CrystallizedState(
+        validators=[make_validator(i) for i in range(20)],
+        last_state_recalc=64,
+        shard_and_committee_for_slots=[
+            [ShardAndCommittee(shard_id=j, committee=list(range(j + 1))) for j in range(3)],
+            [ShardAndCommittee(shard_id=7, committee=[])],
+        ],
+        last_justified_slot=60,
+        justified_streak=3,
+        last_finalized_slot=50,
+        current_dynasty=2,
+        crosslink_records=[CrosslinkRecord(dynasty=1, slot=i) for i in range(5)],
+        dynasty_seed=b'\x98' * 32,
+        dynasty_start=12,
+    )
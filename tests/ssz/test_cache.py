@@ -0,0 +1,174 @@
+import copy
+
+from ssz import (
+    eq,
+    invalidate,
+    serialize,
+)
+from ssz.cache import (
+    clear,
+    get_cache,
+    get_cached,
+    watch,
+)
+from ssz.ssz import (
+    SERIALIZE_KEY,
+)
+
+from beacon_chain.state.attestation_record import (
+    AttestationRecord,
+)
+from beacon_chain.state.block import (
+    Block,
+)
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.shard_and_committee import (
+    ShardAndCommittee,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+
+
+def test_serialize_is_cached():
+    block = Block(attestations=[AttestationRecord(slot=3)])
+    data = serialize(block, cache=True)
+
+    assert get_cached(block, SERIALIZE_KEY) == data
+    assert get_cached(block.attestations[0], SERIALIZE_KEY) is not None
+    assert serialize(block, cache=True) is data
+
+
+def test_serialize_does_not_cache_by_default():
+    block = Block(attestations=[])
+    serialize(block)
+    assert get_cached(block, SERIALIZE_KEY) is None
+
+    # So lists changed in place are seen
+    block.attestations.append(AttestationRecord())
+    assert serialize(block) == serialize(Block(attestations=[AttestationRecord()]))
+
+
+def test_setattr_invalidates():
+    block = Block()
+    data = serialize(block, cache=True)
+
+    block.slot_number = 5
+    assert get_cached(block, SERIALIZE_KEY) is None
+    assert serialize(block, cache=True) != data
+    assert serialize(block, cache=True) == serialize(Block(slot_number=5))
+
+
+def test_nested_mutation_invalidates_parents():
+    validators = [ValidatorRecord(pubkey=i) for i in range(3)]
+    shuffling = [[ShardAndCommittee(shard_id=1, committee=[0, 1])]]
+    state = CrystallizedState(
+        validators=validators,
+        shard_and_committee_for_slots=shuffling,
+    )
+    serialize(state, cache=True)
+
+    validators[1].balance = 100
+    assert get_cached(state, SERIALIZE_KEY) is None
+    assert get_cached(validators[0], SERIALIZE_KEY) is not None
+    assert serialize(state, cache=True) == serialize(copy.deepcopy(state))
+
+    # nested lists are followed too
+    serialize(state, cache=True)
+    shuffling[0][0].shard_id = 7
+    assert get_cached(state, SERIALIZE_KEY) is None
+    assert serialize(state, cache=True) == serialize(copy.deepcopy(state))
+
+
+def test_shared_child_invalidates_all_parents():
+    attestation = AttestationRecord()
+    block_a = Block(attestations=[attestation])
+    block_b = Block(attestations=[attestation], slot_number=1)
+    serialize(block_a, cache=True)
+    serialize(block_b, cache=True)
+
+    attestation.slot = 9
+    assert get_cached(block_a, SERIALIZE_KEY) is None
+    assert get_cached(block_b, SERIALIZE_KEY) is None
+
+
+def test_in_place_list_change_needs_invalidate():
+    block = Block(attestations=[])
+    serialize(block, cache=True)
+
+    block.attestations.append(AttestationRecord())
+    invalidate(block)
+    assert serialize(block, cache=True) == serialize(Block(attestations=[AttestationRecord()]))
+
+
+def test_copies_do_not_share_cache():
+    block = Block()
+    serialize(block, cache=True)
+
+    shallow = copy.copy(block)
+    deep = copy.deepcopy(block)
+    assert get_cached(shallow, SERIALIZE_KEY) is None
+    assert get_cached(deep, SERIALIZE_KEY) is None
+
+    shallow.slot_number = 1
+    deep.slot_number = 2
+    assert serialize(block, cache=True) == serialize(Block())
+    assert serialize(shallow, cache=True) == serialize(Block(slot_number=1))
+    assert serialize(deep, cache=True) == serialize(Block(slot_number=2))
+
+
+def test_eq_ignores_stale_cache():
+    block_a = Block(attestations=[])
+    block_b = Block(attestations=[])
+    for block in (block_a, block_b):
+        serialize(block, cache=True)
+
+    assert eq(block_a, block_b)
+    # The cached encodings of both blocks are stale now
+    block_a.attestations.append(AttestationRecord(slot=1))
+    block_b.attestations.append(AttestationRecord(slot=2))
+    assert not eq(block_a, block_b)
+
+
+def test_clear_drops_nested_caches():
+    block = Block(attestations=[AttestationRecord(slot=3)])
+    serialize(block, cache=True)
+    clear(block)
+
+    assert get_cached(block, SERIALIZE_KEY) is None
+    assert get_cached(block.attestations[0], SERIALIZE_KEY) is None
+    assert serialize(block) == serialize(Block(attestations=[AttestationRecord(slot=3)]))
+
+
+def test_collected_parents_are_dropped():
+    attestation = AttestationRecord()
+    for slot_number in range(3):
+        serialize(Block(attestations=[attestation], slot_number=slot_number), cache=True)
+    block = Block(attestations=[attestation])
+    serialize(block, cache=True)
+
+    assert [ref() for ref in get_cache(attestation).parents] == [block]
+    attestation.slot = 9
+    assert get_cached(block, SERIALIZE_KEY) is None
+
+
+def test_watch():
+    class Watcher():
+        def __init__(self):
+            self.changes = []
+
+        def changed(self, key):
+            self.changes.append(key)
+
+    record = ValidatorRecord(balance=1)
+    watcher = Watcher()
+    watch(record, watcher, 'a')
+    watch(record, watcher, 'b')
+    record.balance = 2
+    assert sorted(watcher.changes) == ['a', 'b']
+
+    # Watchers are only weakly referenced
+    del watcher
+    record.balance = 3
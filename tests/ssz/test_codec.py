@@ -0,0 +1,254 @@
+import io
+import mmap
+
+import pytest
+
+from ssz import (
+    codec,
+    serialize,
+    deserialize,
+)
+
+from beacon_chain.state.active_state import (
+    ActiveState,
+)
+from beacon_chain.state.attestation_record import (
+    AttestationRecord,
+)
+from beacon_chain.state.block import (
+    Block,
+)
+from beacon_chain.state.crosslink_record import (
+    CrosslinkRecord,
+)
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.shard_and_committee import (
+    ShardAndCommittee,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+
+
+@pytest.fixture
+def validator(make_validator):
+    return make_validator(1)
+
+
+@pytest.mark.parametrize(
+    'value, typ',
+    [
+        (5, 'int8'),
+        (-7, 'int16'),
+        (2**40, 'uint64'),
+        (2**255, 'uint256'),
+        (b'\x35'*20, 'address'),
+        (b'\x35'*32, 'hash32'),
+        (b'cow', 'bytes'),
+        ([3, 4, 5], ['int8']),
+        ([3, 4, 5], ['uint24']),
+        ([[1], [], [2, 3]], [['uint16']]),
+    ]
+)
+def test_basic_codec(value, typ):
+    data = serialize(value, typ)
+    assert codec.serialize(value, typ) == data
+    assert codec.deserialize(data, typ) == value
+
+
+@pytest.mark.parametrize(
+    'value',
+    [
+        'validator',
+        CrosslinkRecord(dynasty=2, slot=3, hash=b'\x43' * 32),
+        ShardAndCommittee(shard_id=5, committee=[1, 2, 3]),
+        AttestationRecord(oblique_parent_hashes=[b'\x11' * 32], attester_bitfield=b'\x01'),
+        Block(attestations=[AttestationRecord(), AttestationRecord(slot=5)]),
+        ActiveState(recent_block_hashes=[b'\x22' * 32] * 3),
+        'crystallized_state',
+    ]
+)
+def test_container_codec(request, value):
+    if isinstance(value, str):
+        value = request.getfixturevalue(value)
+    data = serialize(value)
+    assert codec.serialize(value) == data
+    assert codec.serialize(codec.deserialize(data, type(value))) == data
+    assert serialize(deserialize(data, type(value))) == data
+
+
+def test_codec_cached_per_type():
+    assert codec.get_codec(ValidatorRecord) is codec.get_codec(ValidatorRecord)
+    assert codec.get_codec([ValidatorRecord]) is codec.get_codec([ValidatorRecord])
+
+
+@pytest.mark.parametrize(
+    'typ, fixed_size',
+    [
+        ('uint24', 3),
+        ('hash32', 32),
+        ('bytes', None),
+        (['uint24'], None),
+        (CrosslinkRecord, 4 + 8 + 8 + 32),
+        (ValidatorRecord, 4 + 32 + 2 + 20 + 32 + 16 + 8 + 8),
+        (ShardAndCommittee, None),
+    ]
+)
+def test_fixed_size(typ, fixed_size):
+    assert codec.get_codec(typ).fixed_size == fixed_size
+
+
+@pytest.mark.parametrize(
+    'value, typ',
+    [
+        (-5, 'uint32'),
+        (b'\x35'*31, 'hash32'),
+        (b'\x35'*21, 'address'),
+        (0, 'hash16'),
+        (CrosslinkRecord(hash=b'\x00' * 20), CrosslinkRecord),
+        # Wrong hash lengths that add up to the right total length
+        (
+            ValidatorRecord(
+                pubkey=1,
+                randao_commitment=b'\x00' * 31,
+                withdrawal_address=b'\x00' * 21,
+            ),
+            ValidatorRecord,
+        ),
+    ]
+)
+def test_failed_codec_serialization(value, typ):
+    with pytest.raises(Exception):
+        codec.serialize(value, typ)
+
+
+@pytest.mark.parametrize(
+    'data, typ',
+    [
+        (b'\x00' * 31, 'hash32'),
+        (b'\x00\x00\x00\x05cow', 'bytes'),
+        (b'\x00\x00\x00\x04\x00\x00\x00', ['uint24']),
+        (serialize(CrosslinkRecord())[:-1], CrosslinkRecord),
+    ]
+)
+def test_failed_codec_deserialization(data, typ):
+    with pytest.raises(Exception):
+        codec.deserialize(data, typ)
+
+
+@pytest.mark.parametrize(
+    'value, typ',
+    [
+        (b'cow', 'bytes'),
+        ([3, 4, 5], ['uint24']),
+        (list(range(3000)), ['uint24']),
+        ([[1], [], [2, 3]], [['uint16']]),
+        ('validator', None),
+        (Block(attestations=[AttestationRecord(), AttestationRecord(slot=5)]), None),
+        ('crystallized_state', None),
+    ]
+)
+def test_single_pass_serialization(request, value, typ):
+    if isinstance(value, str):
+        value = request.getfixturevalue(value)
+    data = serialize(value, typ)
+    assert codec.serialized_size(value, typ) == len(data)
+    assert codec.serialize_to_buffer(value, typ) == data
+
+    buf = bytearray(len(data) + 10)
+    assert codec.serialize_into(value, memoryview(buf), 5, typ) == 5 + len(data)
+    assert buf[5:-5] == data
+    assert buf[:5] == buf[-5:] == b'\x00' * 5
+
+    stream = io.BytesIO()
+    assert codec.serialize_to_stream(value, stream, typ) == len(data)
+    assert stream.getvalue() == data
+
+
+class IterationCountingList(list):
+    iterations = 0
+
+    def __iter__(self):
+        self.iterations += 1
+        return super().__iter__()
+
+
+def test_stream_sizes_nested_lists_once():
+    # Each variable-size list is walked once for its size and once to write
+    # it, however deep it is nested
+    inner = [IterationCountingList([[1, 2], [3]]) for _ in range(3)]
+    value = IterationCountingList([IterationCountingList(inner)])
+    typ = [[[['uint8']]]]
+    data = serialize(value, typ)
+    lists = [value, value[0]] + inner
+    for lst in lists:
+        lst.iterations = 0
+
+    stream = io.BytesIO()
+    assert codec.serialize_to_stream(value, stream, typ) == len(data)
+    assert stream.getvalue() == data
+    assert [lst.iterations for lst in lists] == [2] * len(lists)
+
+
+def test_serialize_into_small_buffer(validator):
+    with pytest.raises(Exception):
+        codec.serialize_into(validator, bytearray(10))
+
+
+def test_deserialize_from_buffers(crystallized_state):
+    value = crystallized_state
+    data = serialize(value)
+
+    for source in (bytearray(data), memoryview(data), memoryview(bytearray(data))):
+        result = codec.deserialize(source, CrystallizedState)
+        assert type(result.dynasty_seed) is bytes
+        assert type(result.validators[0].withdrawal_address) is bytes
+        assert serialize(result) == data
+
+
+def test_zero_copy_deserialize(crystallized_state):
+    value = crystallized_state
+    data = bytearray(serialize(value))
+
+    result = codec.deserialize(data, CrystallizedState, zero_copy=True)
+    assert isinstance(result.dynasty_seed, memoryview)
+    assert result.dynasty_seed == value.dynasty_seed
+    assert codec.serialize(result) == data
+
+    # Fields are views into the source buffer
+    offset = bytes(data).index(b'\x98' * 32)
+    data[offset] = 0
+    assert result.dynasty_seed[0] == 0
+
+
+def test_zero_copy_deserialize_mmap(tmpdir):
+    value = Block(attestations=[AttestationRecord(shard_block_hash=b'\x20' * 32)])
+    path = tmpdir.join('block.ssz')
+    path.write_binary(serialize(value))
+
+    with open(str(path), 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        result = codec.deserialize(mapped, Block, zero_copy=True)
+        assert result.attestations[0].shard_block_hash == b'\x20' * 32
+        assert codec.serialize(result) == serialize(value)
+        del result
+        mapped.close()
+
+
+@pytest.mark.parametrize(
+    'data, typ',
+    [
+        (b'\x00\x00', 'bytes'),
+        (b'\x00\x00', ['uint24']),
+        (b'\x00\x00', CrosslinkRecord),
+        (b'\x00\x00\x00\x20' + b'\x00' * 8, ['hash32']),
+        (b'\x00\x00\x00\x08' + b'\x00' * 4, ['uint64']),
+    ]
+)
+def test_truncated_deserialization(data, typ):
+    with pytest.raises(Exception):
+        codec.deserialize(data, typ)
+    with pytest.raises(Exception):
+        codec.deserialize(data, typ, zero_copy=True)
@@ -0,0 +1,168 @@
+import io
+import json
+
+import pytest
+
+from ssz import (
+    export,
+    serialize,
+    to_dict,
+)
+from ssz.export import (
+    export_json,
+    parse_path,
+    to_json,
+)
+from ssz.lazy import (
+    deserialize_lazy,
+)
+
+from beacon_chain.state.attestation_record import (
+    AttestationRecord,
+)
+from beacon_chain.state.block import (
+    Block,
+)
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+
+
+def hex_bytes(value):
+    # to_dict output with bytes values hex encoded
+    if isinstance(value, dict):
+        return {name: hex_bytes(field) for name, field in value.items()}
+    elif isinstance(value, list):
+        return [hex_bytes(element) for element in value]
+    elif isinstance(value, bytes):
+        return '0x' + value.hex()
+    return value
+
+
+def test_export_matches_to_dict(crystallized_state):
+    exported = to_json(crystallized_state)
+
+    assert json.loads(exported) == hex_bytes(to_dict(crystallized_state))
+    assert list(json.loads(exported).keys()) == list(CrystallizedState.fields.keys())
+
+
+def test_export_block():
+    block = Block(
+        slot_number=5,
+        attestations=[
+            AttestationRecord(slot=i, attester_bitfield=b'\x01\x02', aggregate_sig=[i, i + 1])
+            for i in range(3)
+        ],
+    )
+    exported = json.loads(to_json(block))
+
+    assert exported == hex_bytes(to_dict(block))
+    assert exported['attestations'][1]['attester_bitfield'] == '0x0102'
+    assert exported['attestations'][2]['aggregate_sig'] == [2, 3]
+
+
+@pytest.mark.parametrize(
+    'paths, expected',
+    [
+        (['last_state_recalc'], {'last_state_recalc': 64}),
+        (['validators[3].balance'], {'validators[3].balance': 32 * 10**18 + 3}),
+        (
+            ['validators[19].withdrawal_address', 'dynasty_seed'],
+            {
+                'validators[19].withdrawal_address': '0x' + '35' * 20,
+                'dynasty_seed': '0x' + '98' * 32,
+            },
+        ),
+        (['crosslink_records[*].slot'], {'crosslink_records[*].slot': [0, 1, 2, 3, 4]}),
+        (
+            ['shard_and_committee_for_slots[0][*].committee'],
+            {'shard_and_committee_for_slots[0][*].committee': [[0], [0, 1], [0, 1, 2]]},
+        ),
+        ([], {}),
+    ]
+)
+def test_export_paths(crystallized_state, paths, expected):
+    assert json.loads(to_json(crystallized_state, paths=paths)) == expected
+
+    # Lazily decoded views give the same output
+    view = deserialize_lazy(serialize(crystallized_state), CrystallizedState)
+    assert json.loads(to_json(view, paths=paths)) == expected
+
+
+def test_export_lazy_view(crystallized_state):
+    view = deserialize_lazy(serialize(crystallized_state), CrystallizedState, zero_copy=True)
+
+    assert to_json(view) == to_json(crystallized_state)
+
+
+def test_export_to_binary_stream(crystallized_state):
+    stream = io.BytesIO()
+    export_json(crystallized_state, stream)
+
+    assert stream.getvalue() == to_json(crystallized_state).encode('ascii')
+
+
+def test_export_large_list():
+    validators = [ValidatorRecord(pubkey=i, balance=i) for i in range(5000)]
+    exported = json.loads(to_json(validators, typ=[ValidatorRecord]))
+
+    assert len(exported) == 5000
+    assert [v['pubkey'] for v in exported] == list(range(5000))
+
+
+@pytest.mark.parametrize(
+    'path, steps',
+    [
+        ('validators', ('validators',)),
+        ('validators[3].balance', ('validators', 3, 'balance')),
+        ('validators[*].balance', ('validators', '*', 'balance')),
+        ('[1][*]', (1, '*')),
+    ]
+)
+def test_parse_path(path, steps):
+    assert parse_path(path) == steps
+
+
+@pytest.mark.parametrize(
+    'path',
+    [
+        '.validators',
+        'validators[3]balance',
+        'validators[-1]',
+        'validators..balance',
+        'validators[x]',
+    ]
+)
+def test_parse_invalid_path(path):
+    with pytest.raises(ValueError):
+        parse_path(path)
+
+
+@pytest.mark.parametrize(
+    'path, error',
+    [
+        ('not_a_field', KeyError),
+        ('validators.balance', KeyError),
+        ('validators[20]', IndexError),
+        ('last_state_recalc[0]', KeyError),
+    ]
+)
+def test_export_missing_path(crystallized_state, path, error):
+    with pytest.raises(error):
+        to_json(crystallized_state, paths=[path])
+
+
+def test_export_checks_paths_before_writing(monkeypatch, crystallized_state):
+    # Flush every write
+    monkeypatch.setattr(export, '_CHUNK_SIZE', 1)
+    stream = io.StringIO()
+    with pytest.raises(KeyError):
+        export_json(
+            crystallized_state,
+            stream,
+            paths=['validators[*]', 'validators[0].not_a_field'],
+        )
+    assert stream.getvalue() == ''
@@ -0,0 +1,107 @@
+import pytest
+
+from ssz import (
+    deserialize,
+    serialize,
+)
+from ssz.layout import (
+    field_offsets,
+    locate,
+    patch,
+    read,
+    read_element,
+    static_size,
+)
+
+from beacon_chain.state.crosslink_record import (
+    CrosslinkRecord,
+)
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.shard_and_committee import (
+    ShardAndCommittee,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+
+
+@pytest.mark.parametrize(
+    'typ, size',
+    [
+        ('uint24', 3),
+        (CrosslinkRecord, 52),
+        (ValidatorRecord, 122),
+        (ShardAndCommittee, None),
+        ([ValidatorRecord], None),
+    ]
+)
+def test_static_size(typ, size):
+    assert static_size(typ) == size
+
+
+def test_field_offsets(make_validator):
+    assert field_offsets(CrosslinkRecord) == {'dynasty': 4, 'hash': 12, 'slot': 44}
+    assert field_offsets(ShardAndCommittee) == {'committee': 4, 'shard_id': None}
+
+    data = serialize(make_validator(5))
+    for name, offset in field_offsets(ValidatorRecord).items():
+        size = static_size(ValidatorRecord.fields[name])
+        assert data[offset:offset + size] == serialize(
+            getattr(make_validator(5), name),
+            ValidatorRecord.fields[name]
+        )
+
+
+def test_read_element(make_validator):
+    validators = [make_validator(i) for i in range(10)]
+    data = serialize(validators, [ValidatorRecord])
+
+    assert read_element(data, [ValidatorRecord], 7).pubkey == 7
+    assert read_element(data, [ValidatorRecord], -1).pubkey == 9
+    assert read_element(serialize([5, 6, 7], ['uint24']), ['uint24'], 1) == 6
+    with pytest.raises(IndexError):
+        read_element(data, [ValidatorRecord], 10)
+
+
+def test_read_path(crystallized_state):
+    data = serialize(crystallized_state)
+
+    assert read(data, CrystallizedState, ('validators', 12, 'balance')) == 32 * 10**18 + 12
+    assert read(data, CrystallizedState, ('current_dynasty',)) == 2
+    assert read(data, CrystallizedState, ('shard_and_committee_for_slots', 0, 2, 'committee')) == [
+        0, 1, 2
+    ]
+    assert read(data, CrystallizedState, ('shard_and_committee_for_slots', 1, 0, 'shard_id')) == 7
+    assert read(data, CrystallizedState, ('crosslink_records', 4, 'slot')) == 4
+    with pytest.raises(IndexError):
+        locate(data, CrystallizedState, ('shard_and_committee_for_slots', 1, 1))
+    with pytest.raises(IndexError):
+        locate(data, CrystallizedState, ('shard_and_committee_for_slots', 2))
+
+
+def test_patch(crystallized_state):
+    buf = bytearray(serialize(crystallized_state))
+
+    for index in (0, 3, 19):
+        crystallized_state.validators[index].balance += 10**9
+        patch(
+            buf,
+            CrystallizedState,
+            ('validators', index, 'balance'),
+            crystallized_state.validators[index].balance,
+        )
+    patch(buf, CrystallizedState, ('crosslink_records', 2), CrosslinkRecord(dynasty=2, slot=9))
+    crystallized_state.crosslink_records[2] = CrosslinkRecord(dynasty=2, slot=9)
+    patch(buf, CrystallizedState, ('last_state_recalc',), 128)
+    crystallized_state.last_state_recalc = 128
+
+    assert buf == serialize(crystallized_state)
+    assert serialize(deserialize(bytes(buf), CrystallizedState)) == buf
+
+
+def test_patch_variable_size(crystallized_state):
+    buf = bytearray(serialize(crystallized_state))
+    with pytest.raises(TypeError):
+        patch(buf, CrystallizedState, ('shard_and_committee_for_slots', 0, 0), ShardAndCommittee())
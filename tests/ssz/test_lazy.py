@@ -0,0 +1,92 @@
+import pytest
+
+from ssz import (
+    serialize,
+)
+from ssz.lazy import (
+    LazyContainer,
+    LazyList,
+    deserialize_lazy,
+)
+
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+
+
+def test_lazy_scalars(crystallized_state):
+    view = deserialize_lazy(serialize(crystallized_state), CrystallizedState)
+
+    assert isinstance(view, LazyContainer)
+    assert view.last_state_recalc == 64
+    assert view.last_finalized_slot == 50
+    assert view.current_dynasty == 2
+    assert view.dynasty_seed == b'\x98' * 32
+    with pytest.raises(AttributeError):
+        view.not_a_field
+
+
+def test_lazy_lists(crystallized_state):
+    view = deserialize_lazy(serialize(crystallized_state), CrystallizedState)
+
+    assert isinstance(view.validators, LazyList)
+    assert len(view.validators) == 20
+    assert view.validators[3].balance == 32 * 10**18 + 3
+    assert view.validators[-1].pubkey == 19
+    assert view.validators[3] is view.validators[3]
+    assert [v.pubkey for v in view.validators[5:8]] == [5, 6, 7]
+    with pytest.raises(IndexError):
+        view.validators[20]
+
+    shuffling = view.shard_and_committee_for_slots
+    assert len(shuffling) == 2
+    assert len(shuffling[0]) == 3
+    assert shuffling[0][2].committee == [0, 1, 2]
+    assert shuffling[1][0].shard_id == 7
+    assert [c.slot for c in view.crosslink_records] == list(range(5))
+
+
+@pytest.mark.parametrize(
+    'index',
+    [3, 5, -4, -5, -6],
+)
+def test_lazy_list_index_out_of_range(index):
+    view = deserialize_lazy(serialize([1, 2, 3], ['uint8']), ['uint8'])
+    with pytest.raises(IndexError):
+        view[index]
+    # Nothing is cached for the bad index
+    with pytest.raises(IndexError):
+        view[index]
+    assert view[-3] == 1
+
+
+def test_lazy_decodes_on_demand(crystallized_state):
+    view = deserialize_lazy(serialize(crystallized_state), CrystallizedState)
+
+    validators = view.validators
+    assert validators._elements == {}
+    validators[4]
+    assert list(validators._elements) == [4]
+
+
+def test_materialize(crystallized_state):
+    data = serialize(crystallized_state)
+    view = deserialize_lazy(data, CrystallizedState)
+
+    assert serialize(view.materialize()) == data
+    assert view.serialize() == data
+    assert serialize(view.validators.materialize(), [ValidatorRecord]) == (
+        serialize(crystallized_state.validators, [ValidatorRecord])
+    )
+
+
+def test_lazy_zero_copy(crystallized_state):
+    view = deserialize_lazy(bytearray(serialize(crystallized_state)), CrystallizedState,
+                            zero_copy=True)
+
+    assert isinstance(view.dynasty_seed, memoryview)
+    assert isinstance(view.validators[0].randao_commitment, memoryview)
+    assert view.validators[0].randao_commitment == b'\x57' * 32
@@ -1,10 +1,6 @@
 import pytest
 import random
 
-from ssz import (
-    serialize,
-)
-
 from beacon_chain.state.config import (
     BASE_REWARD_QUOTIENT,
     DEFAULT_END_DYNASTY,
@@ -28,7 +24,8 @@ from beacon_chain.state.validator_record import (
     ValidatorRecord,
 )
 from beacon_chain.state.state_transition import (
-    compute_state_transition,
+    compute_state_transition_with_roots,
+    get_state_roots,
 )
 from beacon_chain.state.genesis_helpers import (
     get_genesis_active_state,
@@ -60,6 +57,10 @@ def bls_verify_mock(m, pub, sig):
     return True
 
 
+def bls_verify_multiple_mock(msgs, pubs, sigs):
+    return True
+
+
 def bls_sign_mock(m, k):
     return 0, 0
 
@@ -70,6 +71,7 @@ def mock_bls(mocker, request):
         return
 
     mocker.patch('beacon_chain.utils.bls.verify', side_effect=bls_verify_mock)
+    mocker.patch('beacon_chain.utils.bls.verify_multiple', side_effect=bls_verify_multiple_mock)
     mocker.patch('beacon_chain.utils.bls.sign', side_effect=bls_sign_mock)
 
 
@@ -280,8 +282,10 @@ def genesis_active_state(config):
 
 @pytest.fixture
 def genesis_block(genesis_active_state, genesis_crystallized_state):
-    active_state_root = blake(serialize(genesis_active_state))
-    crystallized_state_root = blake(serialize(genesis_crystallized_state))
+    crystallized_state_root, active_state_root = get_state_roots(
+        genesis_crystallized_state,
+        genesis_active_state,
+    )
 
     return get_genesis_block(
         active_state_root=active_state_root,
@@ -384,7 +388,6 @@ def mock_make_child(keymap, config):
         if attestations is None:
             attestations = []
 
-        crystallized_state, active_state = parent_state
         block = Block(
             parent_hash=parent.hash,
             slot_number=slot_number,
@@ -392,24 +395,17 @@ def mock_make_child(keymap, config):
             attestations=attestations,
             pow_chain_ref=b'\x00'*32,
             active_state_root=b'\x00'*32,
-            crystallized_state_root=b'\x00'*32
+            crystallized_state_root=b'\x00'*32,
         )
         print('Generated preliminary block header')
 
-        new_crystallized_state, new_active_state = compute_state_transition(
-            (crystallized_state, active_state),
+        block, new_crystallized_state, new_active_state = compute_state_transition_with_roots(
+            parent_state,
             parent,
             block,
             config=config
         )
-        print('Calculated state transition')
-
-        if crystallized_state == new_crystallized_state:
-            block.crystallized_state_root = parent.crystallized_state_root
-        else:
-            block.crystallized_state_root = blake(serialize(crystallized_state))
-
-        block.active_state_root = blake(serialize(active_state))
+        print('Calculated state transition and filled in state roots')
 
         return block, new_crystallized_state, new_active_state
     return mock_make_child
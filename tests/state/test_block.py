@@ -29,3 +29,31 @@ def test_num_attestations(expected):
     )
 
     assert block.num_attestations == expected
+
+
+def test_block_hash_is_cached():
+    attestation = AttestationRecord()
+    block = Block(attestations=[attestation])
+    original_block_hash = block.hash
+    assert block.hash is original_block_hash
+
+    block.slot_number = 1
+    assert block.hash != original_block_hash
+    assert block.hash == Block(slot_number=1, attestations=[attestation]).hash
+
+    # Changing an attestation changes the hash of the block holding it
+    updated_block_hash = block.hash
+    attestation.slot = 5
+    assert block.hash != updated_block_hash
+
+    # So does changing the list of attestations in place
+    updated_block_hash = block.hash
+    block.attestations.append(AttestationRecord())
+    assert block.hash != updated_block_hash
+    assert block.hash == Block(
+        slot_number=1,
+        attestations=[attestation, AttestationRecord()],
+    ).hash
+    updated_block_hash = block.hash
+    block.attestations[1].slot = 3
+    assert block.hash != updated_block_hash
@@ -57,3 +57,71 @@ def test_chain():
     for block in blocks:
         assert block in chain
     assert extra_block not in chain
+
+
+def make_blocks(parent_hash, slot_numbers):
+    blocks = []
+    for slot_number in slot_numbers:
+        block = Block(
+            slot_number=slot_number,
+            parent_hash=parent_hash
+        )
+        blocks.append(block)
+        parent_hash = block.hash
+    return blocks
+
+
+def test_append():
+    blocks = make_blocks(ZERO_HASH32, range(1, 10))
+    chains = [Chain()]
+    for block in blocks:
+        chains.append(chains[-1].append(block))
+
+    chain = chains[-1]
+    expected = Chain(head=blocks[-1], blocks=blocks)
+    assert chain.head == blocks[-1]
+    assert chain.chain == expected.chain
+    assert chain.blocks == blocks
+    assert chain.block_by_hash == expected.block_by_hash
+    assert chain.block_by_slot_number == expected.block_by_slot_number
+
+    # Earlier chains are unchanged
+    for length, earlier_chain in enumerate(chains):
+        assert earlier_chain.chain == list(reversed(blocks[:length]))
+        assert earlier_chain.blocks == blocks[:length]
+        for block in blocks[length:]:
+            assert block not in earlier_chain
+            assert earlier_chain.get_block_by_slot_number(block.slot_number) is None
+
+
+def test_append_fork():
+    blocks = make_blocks(ZERO_HASH32, range(1, 5))
+    chain = Chain(head=blocks[-1], blocks=blocks)
+    main_blocks = make_blocks(blocks[-1].hash, range(5, 8))
+    fork_blocks = make_blocks(blocks[-1].hash, range(6, 8))
+
+    main_chain = chain
+    for block in main_blocks:
+        main_chain = main_chain.append(block)
+    fork_chain = chain
+    for block in fork_blocks:
+        fork_chain = fork_chain.append(block)
+
+    assert main_chain.chain == list(reversed(blocks + main_blocks))
+    assert fork_chain.chain == list(reversed(blocks + fork_blocks))
+    assert fork_chain.get_block_by_slot_number(6) == fork_blocks[0]
+    assert main_chain.get_block_by_slot_number(6) == main_blocks[1]
+    assert chain.get_block_by_slot_number(6) is None
+
+
+def test_append_not_extending_head():
+    blocks = make_blocks(ZERO_HASH32, range(1, 5))
+    chain = Chain(head=blocks[-1], blocks=blocks)
+    # A sibling of the head becomes the new head
+    sibling = Block(slot_number=5, parent_hash=blocks[-2].hash)
+    new_chain = chain.append(sibling)
+
+    assert new_chain.head == sibling
+    assert new_chain.chain == [sibling] + list(reversed(blocks[:-1]))
+    assert blocks[-1] not in new_chain
+    assert new_chain.blocks == blocks + [sibling]
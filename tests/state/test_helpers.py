@@ -1,14 +1,30 @@
 import pytest
 
 from beacon_chain.state.active_state import ActiveState
+from beacon_chain.state.attestation_record import AttestationRecord
+from beacon_chain.state.chain import Chain
 from beacon_chain.state.shard_and_committee import ShardAndCommittee
 from beacon_chain.state.helpers import (
+    get_attesters_aggregate_pubkey,
     get_new_shuffling,
     get_shards_and_committees_for_slot,
     get_block_hash,
     get_proposer_position,
+    get_upcoming_attestation_messages,
     int_sqrt,
 )
+from beacon_chain.state.state_transition import (
+    fill_recent_block_hashes,
+    validate_attestation_structure,
+)
+import beacon_chain.utils.bls as bls
+from beacon_chain.utils.bitfield import (
+    get_empty_bitfield,
+    set_voted,
+)
+from beacon_chain.utils.blake import (
+    blake,
+)
 
 from tests.state.helpers import (
     get_pseudo_chain,
@@ -223,3 +239,103 @@ def test_get_proposer_position(monkeypatch,
     )
 
     assert proposer_index_in_committee == result_proposer_index_in_committee
+
+
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,shard_count'
+    ),
+    [
+        (100, 1000, 10, 10, 10),
+    ],
+)
+def test_get_attesters_aggregate_pubkey(mocker, genesis_crystallized_state, config):
+    crystallized_state = genesis_crystallized_state
+    shard_and_committee = crystallized_state.shard_and_committee_for_slots[0][0]
+    committee = shard_and_committee.committee
+    sum_pubs = mocker.patch('beacon_chain.utils.bls.sum_pubs', side_effect=bls.sum_pubs)
+
+    # All, all but one, two and none of the members voting
+    for voters in (range(len(committee)), range(1, len(committee)), range(2), []):
+        bitfield = get_empty_bitfield(len(committee))
+        for committee_index in voters:
+            bitfield = set_voted(bitfield, committee_index)
+        attestation = AttestationRecord(
+            slot=0,
+            shard_id=shard_and_committee.shard_id,
+            attester_bitfield=bitfield,
+        )
+        expected = bls.aggregate_pubs([
+            crystallized_state.validators[committee[committee_index]].pubkey
+            for committee_index in voters
+        ])
+        aggregate_pub = get_attesters_aggregate_pubkey(crystallized_state, attestation, config)
+        assert bls.compress_G1(aggregate_pub) == expected
+
+    # The committee's sum is computed once
+    pub_keys = tuple(crystallized_state.validators[index].pubkey for index in committee)
+    assert [call[0][0] for call in sum_pubs.call_args_list].count(pub_keys) == 1
+
+    # A new shuffling brings new committees, whose sums are computed again
+    crystallized_state.shard_and_committee_for_slots[0][0] = ShardAndCommittee(
+        shard_id=shard_and_committee.shard_id,
+        committee=list(reversed(committee)),
+    )
+    sum_pubs.reset_mock()
+    get_attesters_aggregate_pubkey(crystallized_state, attestation, config)
+    assert [call[0][0] for call in sum_pubs.call_args_list].count(pub_keys[::-1]) == 1
+
+
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,shard_count'
+    ),
+    [
+        (100, 1000, 50, 10, 10),
+    ],
+)
+def test_get_upcoming_attestation_messages(genesis_crystallized_state,
+                                           genesis_active_state,
+                                           genesis_block,
+                                           mock_make_attestations,
+                                           mock_make_child,
+                                           config):
+    crystallized_state = genesis_crystallized_state
+    active_state = genesis_active_state
+    active_state.chain = Chain(head=genesis_block, blocks=[genesis_block])
+    shard_block_hashes = {
+        shard_id: blake(bytes(str(shard_id), 'utf-8'))
+        for shard_id in range(config['shard_count'])
+    }
+
+    messages = get_upcoming_attestation_messages(
+        crystallized_state,
+        active_state,
+        genesis_block,
+        shard_block_hashes,
+        config,
+    )
+
+    # The messages signed by the attestations to the block
+    attestations = mock_make_attestations((crystallized_state, active_state), genesis_block)
+    block, _, _ = mock_make_child(
+        (crystallized_state, active_state),
+        genesis_block,
+        1,
+        attestations,
+    )
+    # As in compute_state_transition
+    active_state = fill_recent_block_hashes(active_state, genesis_block, block)
+    assert messages == [
+        validate_attestation_structure(
+            crystallized_state,
+            active_state,
+            attestation,
+            block,
+            genesis_block,
+            config,
+        )[0]
+        for attestation in attestations
+    ]
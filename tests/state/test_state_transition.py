@@ -1,4 +1,7 @@
 import copy
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
 
 import pytest
 
@@ -7,6 +10,8 @@ from eth_utils import (
 )
 
 from ssz import (
+    codec,
+    deepcopy,
     serialize,
 )
 
@@ -17,9 +22,13 @@ from beacon_chain.utils.bitfield import (
     set_voted,
 )
 
+from beacon_chain.state import state_transition
 from beacon_chain.state.chain import (
     Chain,
 )
+from beacon_chain.state.constants import (
+    ZERO_HASH32,
+)
 from beacon_chain.state.helpers import (
     get_attestation_indices,
     get_shards_and_committees_for_slot,
@@ -28,8 +37,13 @@ from beacon_chain.state.state_transition import (
     fill_recent_block_hashes,
     calculate_crosslink_rewards,
     compute_cycle_transitions,
+    compute_state_transition,
+    compute_state_transition_deferred,
+    get_state_roots,
     initialize_new_cycle,
+    process_block,
     validate_attestation,
+    validate_state_roots,
 )
 
 
@@ -269,6 +283,112 @@ def test_validate_attestation_aggregate_sig(attestation_validation_fixture, conf
         )
 
 
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,shard_count'
+    ),
+    [
+        (100, 1000, 50, 10, 10),
+    ],
+)
+def test_process_block_batch_verifies_signatures(mocker, attestation_validation_fixture, config):
+    (
+        crystallized_state,
+        active_state,
+        attestation,
+        block,
+        parent_block
+    ) = attestation_validation_fixture
+    block.attestations = [attestation] + [copy.deepcopy(attestation) for _ in range(2)]
+    verify_multiple = mocker.patch('beacon_chain.utils.bls.verify_multiple', return_value=True)
+    verify = mocker.patch('beacon_chain.utils.bls.verify', return_value=True)
+
+    process_block(crystallized_state, active_state, block, parent_block, config)
+    assert verify_multiple.call_count == 1
+    assert len(verify_multiple.call_args[0][0]) == len(block.attestations)
+    assert verify.call_count == 0
+
+    # When the batch fails, the signatures are verified one by one
+    verify_multiple.return_value = False
+    verify.side_effect = [True, False, True]
+    with pytest.raises(ValidationError):
+        process_block(crystallized_state, active_state, block, parent_block, config)
+    assert verify.call_count == 2
+
+    # With an executor, each attestation is verified on its own, in parallel
+    verify.reset_mock(side_effect=True)
+    verify_multiple.reset_mock()
+    verify.side_effect = [True, False, True]
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValidationError):
+            process_block(
+                crystallized_state,
+                active_state,
+                block,
+                parent_block,
+                config,
+                executor=executor,
+            )
+    assert verify_multiple.call_count == 0
+    assert verify.call_count == 3
+
+    # Without batch verification, each attestation is verified on its own
+    verify.reset_mock(side_effect=True)
+    verify_multiple.reset_mock()
+    process_block(crystallized_state, active_state, block, parent_block, config, batch_verify=False)
+    assert verify_multiple.call_count == 0
+    assert verify.call_count == len(block.attestations)
+
+
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,shard_count'
+    ),
+    [
+        (100, 1000, 50, 10, 10),
+    ],
+)
+def test_process_block_reports_errors_in_block_order(mocker,
+                                                     attestation_validation_fixture,
+                                                     config):
+    (
+        crystallized_state,
+        active_state,
+        attestation,
+        block,
+        parent_block
+    ) = attestation_validation_fixture
+    # The first attestation has a bad signature, the second a bad bitfield
+    bad_structure = copy.deepcopy(attestation)
+    bad_structure.attester_bitfield = attestation.attester_bitfield + b'\x00'
+    block.attestations = [attestation, bad_structure]
+    verify_multiple = mocker.patch('beacon_chain.utils.bls.verify_multiple', return_value=False)
+    verify = mocker.patch('beacon_chain.utils.bls.verify', return_value=False)
+
+    for kwargs in ({}, {'batch_verify': False}):
+        with pytest.raises(ValidationError, match="signature fails"):
+            process_block(crystallized_state, active_state, block, parent_block, config, **kwargs)
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValidationError, match="signature fails"):
+            process_block(
+                crystallized_state,
+                active_state,
+                block,
+                parent_block,
+                config,
+                executor=executor,
+            )
+
+    # Without an earlier bad signature, the structural error is raised
+    verify_multiple.return_value = True
+    verify.return_value = True
+    for kwargs in ({}, {'batch_verify': False}):
+        with pytest.raises(ValidationError, match="bitfield length"):
+            process_block(crystallized_state, active_state, block, parent_block, config, **kwargs)
+
+
 @pytest.mark.parametrize(
     (
         'num_validators,max_validator_count,cycle_length,'
@@ -425,3 +545,176 @@ def test_compute_cycle_transitions(genesis_crystallized_state,
     assert crystallized_state.last_state_recalc == (
         block.slot_number // config['cycle_length'] * config['cycle_length']
     )
+
+
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,min_dynasty_length,shard_count'
+    ),
+    [
+        (200, 200, 10, 20, 20, 25),
+    ]
+)
+def test_state_transition_shares_unchanged_state(genesis_crystallized_state,
+                                                 genesis_active_state,
+                                                 genesis_block,
+                                                 config,
+                                                 mock_make_attestations,
+                                                 mock_make_child):
+    c = genesis_crystallized_state
+    a = genesis_active_state
+    block = genesis_block
+    a.chain = Chain(head=block, blocks=[block])
+
+    attestations = mock_make_attestations((c, a), block, attester_share=0.8)
+    block2, c2, a2 = mock_make_child((c, a), block, 1, attestations)
+    serialized_c2 = codec.serialize(c2)
+    serialized_a2 = codec.serialize(a2)
+    vote_cache_a2 = copy.deepcopy(a2.block_vote_cache)
+
+    # within a cycle the crystallized state is untouched
+    assert c2 is c
+
+    attestations2 = mock_make_attestations((c2, a2), block2, attester_share=0.8)
+    block3, c3, a3 = mock_make_child(
+        (c2, a2),
+        block2,
+        block2.slot_number + config['cycle_length'],
+        attestations2
+    )
+
+    # the parent states are left unchanged
+    assert codec.serialize(c2) == serialized_c2
+    assert codec.serialize(a2) == serialized_a2
+    assert a2.block_vote_cache == vote_cache_a2
+
+    # the next cycle transition applies rewards and penalties
+    attestations3 = mock_make_attestations((c3, a3), block3, attester_share=0.8)
+    block4, c4, a4 = mock_make_child(
+        (c3, a3),
+        block3,
+        block3.slot_number + config['cycle_length'],
+        attestations3
+    )
+
+    # validators whose balance did not change are shared, the others copied
+    assert c4 is not c3
+    assert any(old.balance != new.balance for old, new in zip(c3.validators, c4.validators))
+    for old, new in zip(c3.validators, c4.validators):
+        assert (old is new) == (old.balance == new.balance)
+
+
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,shard_count'
+    ),
+    [
+        (100, 1000, 50, 10, 10),
+    ]
+)
+def test_state_transition_checks_state_roots(mocker,
+                                             genesis_crystallized_state,
+                                             genesis_active_state,
+                                             genesis_block,
+                                             config,
+                                             mock_make_attestations,
+                                             mock_make_child):
+    c = genesis_crystallized_state
+    a = genesis_active_state
+    block = genesis_block
+    a.chain = Chain(head=block, blocks=[block])
+
+    # The genesis block carries the roots of the genesis states and has no
+    # state transition of its own
+    validate_state_roots(block, c, a)
+    with pytest.raises(ValidationError):
+        compute_state_transition((c, a), block, block, config=config)
+
+    attestations = mock_make_attestations((c, a), block, attester_share=0.8)
+    # The proposer runs the state transition once to fill in the roots
+    spy = mocker.spy(state_transition, 'process_block')
+    block2, c2, a2 = mock_make_child((c, a), block, 1, attestations)
+    assert spy.call_count == 1
+
+    assert get_state_roots(c2, a2) == (
+        block2.crystallized_state_root,
+        block2.active_state_root,
+    )
+    assert block2 in a2.chain
+    assert a2.chain.get_block_by_hash(block2.hash) is block2
+
+    # The block is left unchanged
+    serialized_block2 = serialize(block2)
+    compute_state_transition((c, a), block, block2, config=config)
+    assert serialize(block2) == serialized_block2
+
+    # Both roots must match the post-states, zero roots included
+    for field in ('active_state_root', 'crystallized_state_root'):
+        for root in (b'\x11' * 32, ZERO_HASH32):
+            bad_block = deepcopy(block2)
+            setattr(bad_block, field, root)
+            with pytest.raises(ValidationError):
+                compute_state_transition((c, a), block, bad_block, config=config)
+
+
+@pytest.mark.parametrize(
+    (
+        'num_validators,max_validator_count,cycle_length,'
+        'min_committee_size,shard_count'
+    ),
+    [
+        (100, 1000, 50, 10, 10),
+    ]
+)
+def test_compute_state_transition_deferred(mocker,
+                                           genesis_crystallized_state,
+                                           genesis_active_state,
+                                           genesis_block,
+                                           config,
+                                           mock_make_attestations,
+                                           mock_make_child):
+    c = genesis_crystallized_state
+    a = genesis_active_state
+    block = genesis_block
+    a.chain = Chain(head=block, blocks=[block])
+
+    attestations = mock_make_attestations((c, a), block, attester_share=0.8)
+    block2, c2, a2 = mock_make_child((c, a), block, 1, attestations)
+    serialized_block2 = serialize(block2)
+
+    # Every signature passes: the tentative state is committed
+    verify = mocker.patch('beacon_chain.utils.bls.verify', return_value=True)
+    with ThreadPoolExecutor(2) as executor:
+        pending = compute_state_transition_deferred((c, a), block, block2, config, executor)
+        c3, a3 = pending.result()
+    assert verify.call_count == len(attestations)
+    assert serialize(c3) == serialize(c2)
+    assert serialize(a3) == serialize(a2)
+    assert pending.result() == (c3, a3)
+
+    # A signature fails: the tentative state is rolled back
+    verify.return_value = False
+    with ThreadPoolExecutor(2) as executor:
+        pending = compute_state_transition_deferred((c, a), block, block2, config, executor)
+        with pytest.raises(ValidationError):
+            pending.result()
+    with pytest.raises(ValidationError):
+        pending.result()
+
+    # A cancelled transition is rolled back as well
+    verify.return_value = True
+    with ThreadPoolExecutor(2) as executor:
+        pending = compute_state_transition_deferred((c, a), block, block2, config, executor)
+        pending.cancel()
+    with pytest.raises(ValidationError):
+        pending.result()
+    assert serialize(block2) == serialized_block2
+
+    # State roots are checked before returning
+    bad_block = deepcopy(block2)
+    bad_block.active_state_root = b'\x11' * 32
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValidationError):
+            compute_state_transition_deferred((c, a), block, bad_block, config, executor)
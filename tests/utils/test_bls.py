@@ -1,8 +1,18 @@
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+
 import pytest
 
+from beacon_chain.utils import bls
 from beacon_chain.utils.bls import (
+    FQ12,
     G1,
     G2,
+    final_exponentiate,
+    multi_pairing,
+    pairing,
     hash_to_G2,
     compress_G1,
     compress_G2,
@@ -14,7 +24,8 @@ from beacon_chain.utils.bls import (
     privtopub,
     aggregate_sigs,
     aggregate_pubs,
-    verify
+    verify,
+    verify_multiple,
 )
 
 
@@ -56,3 +67,183 @@ def test_signature_aggregation(msg, privkeys):
     aggsig = aggregate_sigs(sigs)
     aggpub = aggregate_pubs(pubs)
     assert verify(msg, aggpub, aggsig)
+
+
+def test_verify_multiple():
+    privkeys = [3, 14, 15, 92, 65]
+    # Two triples share a message
+    msgs = [b'cow', b'dog', b'cow', b'pig', b'hen']
+    pubs = [privtopub(k) for k in privkeys]
+    sigs = [sign(msg, k) for msg, k in zip(msgs, privkeys)]
+
+    assert verify_multiple(msgs, pubs, sigs)
+    assert verify_multiple([], [], [])
+    assert not verify_multiple(msgs, pubs, sigs[:3] + [sigs[4], sigs[3]])
+    assert not verify_multiple(msgs, pubs[:4] + [pubs[0]], sigs)
+    assert not verify_multiple(msgs[:4] + [b'cat'], pubs, sigs)
+
+
+def test_decompress_G1_cache(monkeypatch):
+    monkeypatch.setattr(bls, 'G1_CACHE', bls.LRUCache(2))
+    pubs = [privtopub(k) for k in (3, 5, 7)]
+
+    points = [decompress_G1(pub) for pub in pubs[:2]]
+    assert decompress_G1(pubs[0]) is points[0]
+    # The least recently used point is dropped
+    decompress_G1(pubs[2])
+    assert list(bls.G1_CACHE.entries) == [pubs[0], pubs[2]]
+    assert decompress_G1(pubs[1]) is not points[1]
+    assert normalize(decompress_G1(pubs[1])) == normalize(points[1])
+    assert (bls.G1_CACHE.hits, bls.G1_CACHE.misses) == (2, 4)
+
+
+def test_verify_does_not_cache_aggregates(monkeypatch):
+    monkeypatch.setattr(bls, 'G1_CACHE', bls.LRUCache(8))
+    privkeys = [3, 5, 7]
+    pubs = [privtopub(k) for k in privkeys]
+    aggregate_pub = aggregate_pubs(pubs)
+    aggregate_sig = aggregate_sigs([sign(b'cow', k) for k in privkeys])
+
+    assert verify(b'cow', aggregate_pub, aggregate_sig)
+    assert verify_multiple([b'cow'], [aggregate_pub], [aggregate_sig])
+    # Aggregates given as points are not decompressed at all
+    assert verify(b'cow', bls.sum_pubs(pubs), aggregate_sig)
+    # Only the registry keys the aggregate was built from are kept
+    assert set(bls.G1_CACHE.entries) == set(pubs)
+
+
+def test_hash_to_G2_cache(monkeypatch):
+    monkeypatch.setattr(bls, 'CACHE', bls.LRUCache(2))
+    points = [hash_to_G2(msg) for msg in (b'cow', b'dog', b'cow')]
+
+    assert points[2] is points[0]
+    assert (bls.CACHE.hits, bls.CACHE.misses) == (1, 2)
+    hash_to_G2(b'pig')
+    assert b'dog' not in bls.CACHE
+    assert len(bls.CACHE) == 2
+
+
+def test_warm_hash_to_G2(monkeypatch):
+    monkeypatch.setattr(bls, 'CACHE', bls.LRUCache(8))
+    hash_to_G2(b'cow')
+
+    with ThreadPoolExecutor(1) as executor:
+        futures = bls.warm_hash_to_G2([b'cow', b'dog', b'pig', b'dog'], executor)
+    assert len(futures) == 2
+    assert b'dog' in bls.CACHE and b'pig' in bls.CACHE
+    misses = bls.CACHE.misses
+    assert normalize(hash_to_G2(b'dog')) == normalize(bls._hash_to_G2(b'dog'))
+    assert bls.CACHE.misses == misses
+
+
+@pytest.mark.parametrize(
+    'scalars',
+    [
+        [],
+        [(1, 1)],
+        [(5, 3), (7, 11)],
+        [(2, 3), (0, 5), (4, 0), (9, 8)],
+    ]
+)
+def test_multi_pairing(scalars):
+    pairs = [(multiply(G2, q), multiply(G1, p)) for q, p in scalars]
+    expected = FQ12.one()
+    for Q, P in pairs:
+        expected = expected * pairing(Q, P, False)
+
+    assert multi_pairing(pairs) == final_exponentiate(expected)
+    # e(Q, P) = e(G2, G1) ** (q * p)
+    assert multi_pairing(pairs) == pairing(G2, G1) ** sum(q * p for q, p in scalars)
+
+
+def test_g2_lines():
+    Q = multiply(G2, 5)
+    lines = bls.G2Lines(Q)
+
+    assert multi_pairing([(lines, multiply(G1, 7))]) == pairing(Q, multiply(G1, 7))
+    assert multi_pairing([(lines, G1), (Q, bls.neg(G1))]) == FQ12.one()
+    assert multi_pairing([(bls.G2Lines(bls.Z2), G1)]) == FQ12.one()
+    assert multi_pairing([(lines, bls.Z1)]) == FQ12.one()
+
+
+def test_verify_caches_message_lines(monkeypatch):
+    monkeypatch.setattr(bls, 'LINES_CACHE', bls.LRUCache(4))
+    sigs = [(privtopub(k), sign(b'cow', k)) for k in (3, 5)]
+
+    assert all(verify(b'cow', pub, sig) for pub, sig in sigs)
+    assert (bls.LINES_CACHE.hits, bls.LINES_CACHE.misses) == (1, 1)
+    assert not verify(b'cow', sigs[0][0], sigs[1][1])
+
+
+def test_verify_each():
+    msgs = [b'cow', b'dog', b'pig']
+    pubs = [privtopub(k) for k in (3, 5, 7)]
+    sigs = [sign(msg, k) for msg, k in zip(msgs, (3, 5, 7))]
+    sigs[1] = sigs[2]
+
+    assert list(bls.verify_each(msgs, pubs, sigs)) == [True, False, True]
+    with ProcessPoolExecutor(2) as executor:
+        assert list(bls.verify_each(msgs, pubs, sigs, executor)) == [True, False, True]
+
+    # Points are compressed for the process pool only
+    points = [decompress_G1(pub) for pub in pubs]
+    with ProcessPoolExecutor(2) as executor:
+        assert list(bls.verify_each(msgs, points, sigs, executor)) == [True, False, True]
+    with ThreadPoolExecutor(2) as executor:
+        assert list(bls.verify_each(msgs, points, sigs, executor)) == [True, False, True]
+
+
+def test_get_process_pool(monkeypatch):
+    monkeypatch.setattr(bls, '_PROCESS_POOL', None)
+    pool = bls.get_process_pool(1)
+    try:
+        assert bls.get_process_pool() is pool
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.parametrize(
+    'included',
+    [
+        [True] * 4,
+        [True, False, True, True],
+        [False, True, False, True],
+        [False] * 4,
+    ]
+)
+def test_sum_pubs_from_total(included):
+    pubs = [privtopub(k) for k in (3, 5, 7, 11)]
+    total = bls.sum_pubs(pubs)
+    expected = aggregate_pubs([pub for pub, flag in zip(pubs, included) if flag])
+
+    assert compress_G1(bls.sum_pubs_from_total(total, pubs, included)) == expected
+
+
+def test_aggregators():
+    msg = b'cow'
+    privkeys = [3, 5, 7, 11]
+    sigs = [sign(msg, k) for k in privkeys]
+    pubs = [privtopub(k) for k in privkeys]
+
+    # Compressed and decompressed inputs can be mixed
+    sig_aggregator = bls.G2Aggregator().extend(sigs[:2])
+    sig_aggregator.add_point(decompress_G2(sigs[2])).add(sigs[3])
+    assert sig_aggregator.compress() == aggregate_sigs(sigs)
+
+    pub_aggregator = bls.G1Aggregator().extend(pubs)
+    assert pub_aggregator.compress() == aggregate_pubs(pubs)
+    assert verify(msg, pub_aggregator.compress(), sig_aggregator.compress())
+
+    # A running aggregate keeps growing without decompressing it again
+    sig_aggregator = bls.G2Aggregator().extend(sigs[:3])
+    partial = sig_aggregator.compress()
+    assert partial == aggregate_sigs(sigs[:3])
+    assert sig_aggregator.add(sigs[3]).compress() == aggregate_sigs(sigs)
+
+    pub_aggregator.sub(pubs[0]).sub_point(decompress_G1(pubs[1]))
+    assert pub_aggregator.compress() == aggregate_pubs(pubs[2:])
+    # Verified against the point, without compressing it
+    assert verify(msg, pub_aggregator.point, aggregate_sigs(sigs[2:]))
+    assert verify_multiple([msg], [pub_aggregator.point], [aggregate_sigs(sigs[2:])])
+    assert bls.G1Aggregator().compress() == aggregate_pubs([])
+    assert bls.G2Aggregator().compress() == aggregate_sigs([])
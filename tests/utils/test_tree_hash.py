@@ -0,0 +1,566 @@
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+
+import pytest
+
+from ssz import (
+    codec,
+    deepcopy,
+    serialize,
+)
+from ssz.cache import (
+    clear,
+    get_cached,
+)
+
+from beacon_chain.state.attestation_record import (
+    AttestationRecord,
+)
+from beacon_chain.state.block import (
+    Block,
+)
+from beacon_chain.state.crosslink_record import (
+    CrosslinkRecord,
+)
+from beacon_chain.state.crystallized_state import (
+    CrystallizedState,
+)
+from beacon_chain.state.shard_and_committee import (
+    ShardAndCommittee,
+)
+from beacon_chain.state.validator_record import (
+    ValidatorRecord,
+)
+from beacon_chain.utils import tree_hash as tree_hash_module
+from beacon_chain.utils.blake import (
+    blake,
+)
+from beacon_chain.utils.tree_hash import (
+    HASHERS,
+    LIST_TREE_MIN_LENGTH,
+    SERIALIZED_HASHERS,
+    TREE_HASH_KEY,
+    MerkleStream,
+    MerkleTree,
+    make_proof,
+    make_proofs,
+    merkle_hash,
+    merkle_hash_parallel,
+    merkle_hash_stream,
+    register_hasher,
+    set_shared_memo_size,
+    tree_hash,
+    tree_hash_serialized,
+    verify_proof,
+)
+
+
+def make_items(count, seed=0):
+    return [blake((seed * 10**6 + i).to_bytes(8, 'big')) for i in range(count)]
+
+
+def make_state(count):
+    return CrystallizedState(
+        validators=[ValidatorRecord(pubkey=i, balance=i) for i in range(count)],
+        crosslink_records=[CrosslinkRecord(slot=i) for i in range(8)],
+        shard_and_committee_for_slots=[[ShardAndCommittee(committee=[1, 2])]],
+    )
+
+
+def fresh_hash(state):
+    # tree_hash without any cached values
+    tree_hash_module._LIST_TREES.clear()
+    clear(state)
+    return tree_hash(state)
+
+
+@pytest.fixture(autouse=True)
+def small_list_trees(monkeypatch):
+    monkeypatch.setattr(tree_hash_module, 'LIST_TREE_MIN_LENGTH', 16)
+    monkeypatch.setattr(tree_hash_module, '_LIST_TREES', {})
+
+
+@pytest.mark.parametrize(
+    'count',
+    [1, 2, 4, 5, 7, 8, 13, 16, 17, 32, 64, 120, 124, 128, 256]
+)
+def test_merkle_tree_root(count):
+    items = make_items(count)
+    tree = MerkleTree(items)
+
+    assert tree.root() == merkle_hash(items)
+
+
+@pytest.mark.parametrize(
+    'count, changed',
+    [
+        (1, [0]),
+        (8, [0, 7]),
+        (124, [3, 50, 51, 123]),
+        (256, list(range(0, 256, 3))),
+    ]
+)
+def test_merkle_tree_set(count, changed):
+    items = make_items(count)
+    tree = MerkleTree(items)
+    tree.root()
+    for index, item in zip(changed, make_items(len(changed), seed=1)):
+        items[index] = item
+        tree.set(index, item)
+
+    assert tree.root() == merkle_hash(items)
+    assert tree.root() == MerkleTree(items).root()
+
+
+def test_merkle_tree_short_items():
+    items = [i.to_bytes(3, 'big') for i in range(124)]
+    tree = MerkleTree(items)
+    tree.set(42, (1000).to_bytes(3, 'big'))
+    items[42] = (1000).to_bytes(3, 'big')
+
+    assert tree.root() == merkle_hash(items)
+
+
+def test_state_hash_uses_list_tree():
+    state = make_state(64)
+    root = tree_hash(state)
+
+    assert root == fresh_hash(make_state(64))
+    tree = tree_hash_module._LIST_TREES[(CrystallizedState, 'validators')]
+    assert len(tree.tree) == 64
+
+
+def test_setattr_updates_state_hash():
+    state = make_state(64)
+    root = tree_hash(state)
+    tree = tree_hash_module._LIST_TREES[(CrystallizedState, 'validators')]
+
+    state.validators[10].balance = 12345
+    assert tree.changed_indices == {10}
+    updated_root = tree_hash(state)
+
+    assert updated_root != root
+    assert updated_root == fresh_hash(state)
+
+
+def test_shared_validators_between_states():
+    state = make_state(64)
+    root = tree_hash(state)
+
+    # The next state shares all but one validator
+    validators = list(state.validators)
+    validators[5] = deepcopy(validators[5])
+    validators[5].balance = 7
+    new_state = CrystallizedState(
+        validators=validators,
+        crosslink_records=state.crosslink_records,
+        shard_and_committee_for_slots=state.shard_and_committee_for_slots,
+    )
+    new_root = tree_hash(new_state)
+
+    assert new_root != root
+    assert tree_hash(state) == root
+    assert new_root == fresh_hash(new_state)
+    assert root == fresh_hash(state)
+
+
+def test_change_invalidates_every_holder():
+    state = make_state(64)
+    new_state = CrystallizedState(
+        validators=list(state.validators),
+        crosslink_records=state.crosslink_records,
+        shard_and_committee_for_slots=state.shard_and_committee_for_slots,
+    )
+    tree_hash(state)
+    tree_hash(new_state)
+
+    # A validator held by both states, changed in place
+    state.validators[3].balance = 99
+    root = tree_hash(state)
+    new_root = tree_hash(new_state)
+
+    assert root == new_root
+    assert root == fresh_hash(state)
+
+
+def test_list_length_change():
+    state = make_state(64)
+    tree_hash(state)
+    state.validators = state.validators[:60]
+
+    assert tree_hash(state) == fresh_hash(make_state(60))
+
+
+def test_list_elements_replaced_in_place():
+    state = make_state(64)
+    tree_hash(state)
+    state.validators[5] = ValidatorRecord(pubkey=5, balance=7)
+    state.crosslink_records[0] = CrosslinkRecord(slot=9)
+    state.shard_and_committee_for_slots[0][0].committee.append(3)
+
+    assert tree_hash(state) == tree_hash(deepcopy(state))
+
+
+def test_cached_state_hash():
+    state = make_state(64)
+    root = tree_hash(state, cache=True)
+    assert get_cached(state, TREE_HASH_KEY) == root
+    assert get_cached(state.shard_and_committee_for_slots[0][0], TREE_HASH_KEY) is not None
+
+    state.validators[3].balance = 99
+    assert get_cached(state, TREE_HASH_KEY) is None
+    assert tree_hash(state, cache=True) == fresh_hash(state)
+
+
+def test_containers_with_lists_not_cached_by_default():
+    state = make_state(64)
+    tree_hash(state)
+
+    assert get_cached(state, TREE_HASH_KEY) is None
+    assert get_cached(state.shard_and_committee_for_slots[0][0], TREE_HASH_KEY) is None
+    assert get_cached(state.crosslink_records[0], TREE_HASH_KEY) is not None
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(4) as executor:
+        yield executor
+
+
+@pytest.mark.parametrize(
+    'count, parts',
+    [
+        (1, 4),
+        (16, 4),
+        (124, 4),
+        (124, 64),
+        (128, 8),
+        (1024, 64),
+    ]
+)
+def test_merkle_hash_parallel(executor, count, parts):
+    items = make_items(count)
+
+    assert merkle_hash_parallel(items, executor, parts) == merkle_hash(items)
+
+
+@pytest.mark.parametrize(
+    'count',
+    [16, 100, 124, 1024]
+)
+def test_merkle_tree_parallel(monkeypatch, executor, count):
+    monkeypatch.setattr(tree_hash_module, 'PARALLEL_MIN_CHUNKS', 2)
+    items = make_items(count)
+    tree = MerkleTree(items, executor)
+
+    assert tree.levels == MerkleTree(items).levels
+    tree.set(7, make_items(1, seed=1)[0])
+    items[7] = make_items(1, seed=1)[0]
+    assert tree.root() == MerkleTree(items).root()
+
+
+def test_merkle_hash_process_pool(monkeypatch):
+    monkeypatch.setattr(tree_hash_module, 'PARALLEL_MIN_CHUNKS', 4)
+    items = make_items(256)
+    with ProcessPoolExecutor(2) as executor:
+        assert merkle_hash(items, executor) == merkle_hash(items)
+
+
+def test_tree_hash_parallel(monkeypatch, executor):
+    monkeypatch.setattr(tree_hash_module, 'PARALLEL_MIN_CHUNKS', 4)
+    state = make_state(64)
+
+    assert tree_hash(state, executor=executor) == fresh_hash(make_state(64))
+
+
+def test_tree_hash_from_threads(executor):
+    states = [make_state(64) for _ in range(8)]
+    for i, state in enumerate(states):
+        state.validators[i] = ValidatorRecord(pubkey=i, balance=1000 + i)
+    expected = [fresh_hash(deepcopy(state)) for state in states]
+
+    tree_hash_module.reset()
+    for _ in range(4):
+        assert list(executor.map(tree_hash, states)) == expected
+
+
+def test_passes_are_per_thread(monkeypatch, executor):
+    # A tree_hash call in another thread runs its own pass while one is
+    # running here
+    committee = ShardAndCommittee(committee=[1, 2])
+    hasher = HASHERS[ValidatorRecord]
+
+    def hasher_hashing_in_thread(val):
+        executor.submit(tree_hash, committee, cache=True).result()
+        return hasher(val)
+    monkeypatch.setitem(HASHERS, ValidatorRecord, hasher_hashing_in_thread)
+    tree_hash(ValidatorRecord(pubkey=1))
+
+    assert get_cached(committee, TREE_HASH_KEY) == tree_hash(deepcopy(committee))
+
+
+@pytest.mark.parametrize(
+    'count',
+    [1, 2, 3, 4, 5, 7, 8, 13, 16, 17, 32, 124, 128, 256]
+)
+@pytest.mark.parametrize(
+    'item_size',
+    [3, 32, 256]
+)
+def test_merkle_hash_stream(count, item_size):
+    items = [item * (item_size // 32 + 1) for item in make_items(count)]
+    items = [item[:item_size] for item in items]
+
+    assert merkle_hash_stream(iter(items)) == merkle_hash(items)
+
+
+def test_merkle_stream_root_can_be_read_while_appending():
+    items = make_items(20)
+    stream = MerkleStream()
+    for count, item in enumerate(items, 1):
+        stream.append(item)
+        assert stream.root() == MerkleTree(items[:count]).root()
+    # One pending node per level of the 5 chunks tree
+    assert len(stream.pending) == 3
+
+
+def test_tree_hash_serialized():
+    state = make_state(64)
+    state.validators[3].balance = 10**20
+
+    assert tree_hash_serialized(serialize(state), CrystallizedState) == fresh_hash(state)
+    assert tree_hash_serialized(bytearray(serialize(state)), CrystallizedState) == fresh_hash(state)
+
+
+def test_empty_list(executor):
+    root = blake(b'\x00' * 128 + (0).to_bytes(32, 'big'))
+
+    assert merkle_hash([]) == root
+    assert merkle_hash_parallel([], executor) == root
+    assert merkle_hash_stream(iter([])) == root
+    assert tree_hash([], ['hash32']) == root
+    assert tree_hash_serialized(serialize([], ['hash32']), ['hash32']) == root
+
+
+def test_registered_fixed_layout_hashers():
+    validator = ValidatorRecord(
+        pubkey=3**160,
+        withdrawal_shard=5,
+        withdrawal_address=b'\x01' * 20,
+        randao_commitment=b'\x02' * 32,
+        balance=10**20,
+        start_dynasty=3,
+        end_dynasty=9,
+    )
+    expected = blake(
+        (3**160).to_bytes(32, 'big') + (5).to_bytes(2, 'big') + b'\x01' * 20 + b'\x02' * 32 +
+        (10**20).to_bytes(16, 'big') + (3).to_bytes(8, 'big') + (9).to_bytes(8, 'big')
+    )
+    assert tree_hash(validator) == expected
+    assert tree_hash_serialized(serialize(validator), ValidatorRecord) == expected
+
+    shard_and_committee = ShardAndCommittee(shard_id=7, committee=[1, 2, 3])
+    expected = blake(
+        (7).to_bytes(2, 'big') + merkle_hash([x.to_bytes(3, 'big') for x in [1, 2, 3]])
+    )
+    assert tree_hash(shard_and_committee) == expected
+    # Not fixed size, so hashed from its decoded value
+    assert ShardAndCommittee not in SERIALIZED_HASHERS
+    assert tree_hash_serialized(serialize(shard_and_committee), ShardAndCommittee) == expected
+
+
+def test_register_hasher(monkeypatch):
+    monkeypatch.setitem(HASHERS, CrosslinkRecord, lambda val: b'\x07' * 32)
+    state = make_state(4)
+
+    assert tree_hash(CrosslinkRecord()) == b'\x07' * 32
+    assert tree_hash(state) == blake(b''.join([
+        tree_hash(getattr(state, name), CrystallizedState.fields[name])
+        for name in sorted(CrystallizedState.fields)
+    ]))
+
+
+def test_register_compiled_hasher(monkeypatch):
+    monkeypatch.setitem(HASHERS, CrosslinkRecord, None)
+    monkeypatch.setitem(SERIALIZED_HASHERS, CrosslinkRecord, None)
+    register_hasher(CrosslinkRecord)
+    record = CrosslinkRecord(dynasty=3, slot=5, hash=b'\x09' * 32)
+    expected = blake((3).to_bytes(8, 'big') + (5).to_bytes(8, 'big') + b'\x09' * 32)
+
+    assert tree_hash(record) == expected
+    assert tree_hash_serialized(serialize(record), CrosslinkRecord) == expected
+
+
+@pytest.mark.parametrize(
+    'count',
+    [1, 5, 16, 64, 100],
+)
+def test_validator_proofs(count):
+    state = make_state(count)
+    root = tree_hash(state)
+    indices = list(range(count))
+    proofs = make_proofs(state, 'validators', indices)
+
+    for index, proof in zip(indices, proofs):
+        validator = state.validators[index]
+        assert verify_proof(root, CrystallizedState, proof, validator)
+        assert not verify_proof(root, CrystallizedState, proof, ValidatorRecord(pubkey=10**6))
+        if count > 1:
+            proof.index = (index + 1) % count
+            assert not verify_proof(root, CrystallizedState, proof, validator)
+            proof.index = index
+        assert not verify_proof(blake(root), CrystallizedState, proof, validator)
+
+
+def test_crosslink_proof():
+    state = make_state(64)
+    root = tree_hash(state)
+    proof = make_proof(state, 'crosslink_records', 5)
+
+    assert verify_proof(root, CrystallizedState, proof, state.crosslink_records[5])
+    assert not verify_proof(root, CrystallizedState, proof, CrosslinkRecord(slot=6))
+    # The proof does not show the value is a validator
+    proof.name = 'validators'
+    assert not verify_proof(root, CrystallizedState, proof, state.crosslink_records[5])
+
+
+def test_registered_type_proof(monkeypatch):
+    committee = ShardAndCommittee(shard_id=3, committee=list(range(100)))
+    root = tree_hash(committee)
+    proof = make_proof(committee, 'committee', 4)
+
+    assert verify_proof(root, ShardAndCommittee, proof, 4)
+    assert not verify_proof(root, ShardAndCommittee, proof, 5)
+
+    # Types with a custom hasher have no known field layout
+    monkeypatch.setitem(HASHERS, CrystallizedState, lambda val: b'\x00' * 32)
+    with pytest.raises(Exception):
+        make_proof(make_state(4), 'validators', 1)
+
+
+def test_proofs_after_change():
+    state = make_state(64)
+    tree_hash(state)
+    state.validators[10].balance = 12345
+    proof = make_proof(state, 'validators', 10)
+
+    assert verify_proof(fresh_hash(state), CrystallizedState, proof, state.validators[10])
+
+
+def test_proof_index_out_of_range():
+    state = make_state(4)
+    with pytest.raises(IndexError):
+        make_proof(state, 'validators', 4)
+    with pytest.raises(IndexError):
+        make_proofs(state, 'validators', [-1])
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    # Hashers of ShardAndCommittee and CrystallizedState's lists, counting
+    # the values they hash
+    calls = []
+    hasher = HASHERS[ShardAndCommittee]
+
+    def counting_hasher(val):
+        calls.append(val)
+        return hasher(val)
+    monkeypatch.setitem(HASHERS, ShardAndCommittee, counting_hasher)
+
+    def counting_merkle_hash(lst, executor=None):
+        calls.append(lst)
+        return merkle_hash(lst, executor)
+    monkeypatch.setattr(tree_hash_module, 'merkle_hash', counting_merkle_hash)
+    return calls
+
+
+def test_repeated_list_hashed_once(hash_calls):
+    committees = [ShardAndCommittee(shard_id=i, committee=[i]) for i in range(4)]
+    state = make_state(4)
+    # The shuffling concatenated with itself, as in the genesis state
+    state.shard_and_committee_for_slots = [committees, committees]
+    root = tree_hash(state)
+
+    # 4 committees, their 4 committee lists, the outer and the inner list
+    assert len(hash_calls) == 10 + 2
+    assert root == fresh_hash(state)
+
+
+def test_equal_committees_hashed_once(hash_calls):
+    committees = [ShardAndCommittee(shard_id=1, committee=[1, 2, 3]) for _ in range(100)]
+
+    assert len(set(tree_hash(committee, cache=True) for committee in committees)) == 1
+    assert len(hash_calls) == 100 * 2
+
+    hash_calls.clear()
+    root = tree_hash(committees, [ShardAndCommittee], cache=True)
+    assert len([call for call in hash_calls if isinstance(call, ShardAndCommittee)]) == 0
+    for committee in committees:
+        clear(committee)
+    hash_calls.clear()
+    assert tree_hash(committees, [ShardAndCommittee]) == root
+    assert len([call for call in hash_calls if isinstance(call, ShardAndCommittee)]) == 1
+
+
+def test_shared_memo(hash_calls):
+    # Room for the shared committee list and two committees
+    set_shared_memo_size(3)
+    try:
+        committees = [ShardAndCommittee(shard_id=i, committee=[1, 2]) for i in range(3)]
+        roots = [tree_hash(committee) for committee in committees]
+        hash_calls.clear()
+        # The most recent hashes are kept across passes
+        for committee in committees:
+            clear(committee)
+        assert [tree_hash(committee) for committee in reversed(committees)] == roots[::-1]
+        assert [call.shard_id for call in hash_calls if isinstance(call, ShardAndCommittee)] == [0]
+    finally:
+        set_shared_memo_size(None)
+
+
+def test_bytearray_fields_are_memoized_by_content():
+    attestation = AttestationRecord(
+        attester_bitfield=bytearray(b'\x01'),
+        oblique_parent_hashes=[bytearray(b'\x02' * 32)],
+    )
+    expected = AttestationRecord(
+        attester_bitfield=b'\x01',
+        oblique_parent_hashes=[b'\x02' * 32],
+    )
+    assert tree_hash(attestation) == tree_hash(expected)
+
+
+def test_zero_copy_decoded_block():
+    block = Block(
+        parent_hash=b'\x55' * 32,
+        attestations=[
+            AttestationRecord(
+                shard_id=i,
+                oblique_parent_hashes=[b'\x33' * 32],
+                attester_bitfield=b'\x0f',
+            )
+            for i in range(3)
+        ],
+    )
+    decoded = codec.deserialize(bytearray(serialize(block)), Block, zero_copy=True)
+    assert tree_hash(decoded) == tree_hash(block)
+
+
+def test_reset(monkeypatch):
+    state = make_state(LIST_TREE_MIN_LENGTH)
+    root = tree_hash(state)
+    clear(state)
+    tree_hash_module.reset()
+
+    rehashed = []
+    original = tree_hash_module.MerkleTree.__init__
+
+    def counting_init(self, items, executor=None):
+        rehashed.append(len(items))
+        original(self, items, executor)
+    monkeypatch.setattr(tree_hash_module.MerkleTree, '__init__', counting_init)
+    assert tree_hash(state) == root
+    # The validator registry's tree is built again from scratch
+    assert rehashed == [LIST_TREE_MIN_LENGTH]
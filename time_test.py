@@ -1,13 +1,14 @@
 import hash_ssz
 from beacon_chain.state import crystallized_state as cs
-from ssz import ssz
+from ssz import ssz, codec
 import time
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import blake2b
 
 def hash(x):
     return blake2b(x).digest()[:32]
 
-v = cs.ValidatorRecord(pubkey=3**160, withdrawal_shard=567, withdrawal_address=b'\x35' * 20, randao_commitment=b'\x57' * 20, balance=32 * 10**18, start_dynasty=7, end_dynasty=17284)
+v = cs.ValidatorRecord(pubkey=3**160, withdrawal_shard=567, withdrawal_address=b'\x35' * 20, randao_commitment=b'\x57' * 32, balance=32 * 10**18, start_dynasty=7, end_dynasty=17284)
 c = cs.CrosslinkRecord(dynasty=4, slot=12847, hash=b'\x67' * 32)
 cr_stubs = [c for i in range(1024)]
 
@@ -46,5 +47,32 @@ def hash_time_test(valcount):
     h = hash(s)
     return(a2 - a, time.time() - a2)
 
+def codec_time_test(valcount):
+    c = make_crystallized_state(valcount)
+    a = time.time()
+    s = ssz.serialize(c)
+    a2 = time.time()
+    s2 = codec.serialize(c)
+    assert s == s2
+    return(a2 - a, time.time() - a2)
+
+def parallel_time_test(valcount, workers=None):
+    # merkle_hash of valcount validator hashes, sequential and parallel
+    leaves = [hash(i.to_bytes(32, 'big')) for i in range(valcount)]
+    a = time.time()
+    root = hash_ssz.merkle_hash(leaves)
+    sequential = time.time() - a
+    with ProcessPoolExecutor(workers) as executor:
+        # Start the workers before timing
+        list(executor.map(hash_ssz.chunk_tree_root, [b'\x00' * hash_ssz.CHUNKSIZE] * 64))
+        a = time.time()
+        assert hash_ssz.merkle_hash(leaves, executor) == root
+        parallel = time.time() - a
+    return(sequential, parallel)
+
 if __name__ == '__main__':
     print(time_test(2**18))
+    for exp in (18, 20, 22):
+        sequential, parallel = parallel_time_test(2**exp)
+        print('merkle_hash 2**%d: sequential %.3f s, parallel %.3f s, speedup %.2fx' %
+              (exp, sequential, parallel, sequential / parallel))